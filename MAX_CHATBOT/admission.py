@@ -0,0 +1,69 @@
+"""Admission control for upstream Gemini calls.
+
+At most ``max_in_flight`` calls run at once; up to ``max_waiting`` further
+requests queue for a slot for at most ``wait_timeout`` seconds. Anything
+beyond that is rejected immediately so clients get a fast 429/503 instead of
+a connection that silently hangs. Built on ``threading.Condition``, which
+gevent's monkey patching turns into a cooperative primitive.
+"""
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; carries the HTTP status to return."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=8, max_waiting=32, wait_timeout=10.0):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self.counters = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting in line if needed; raises ``Overloaded`` otherwise.
+
+        ``timeout`` shortens the wait below ``wait_timeout``, e.g. to what is
+        left of the request's deadline.
+        """
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._waiting:
+                self._in_flight += 1
+                self.counters["admitted"] += 1
+                return
+            if self._waiting >= self.max_waiting:
+                self.counters["rejected_full"] += 1
+                raise Overloaded(429, "Too many requests are waiting for an answer.", retry_after=1)
+            self._waiting += 1
+            wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+            deadline = time.monotonic() + wait_timeout
+            try:
+                while self._in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["rejected_timeout"] += 1
+                        raise Overloaded(503, "The assistant is busy right now.", retry_after=int(self.wait_timeout) or 1)
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self.counters["admitted"] += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters, in_flight=self._in_flight, waiting=self._waiting)
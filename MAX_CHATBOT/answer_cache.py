@@ -0,0 +1,132 @@
+"""SQLite-backed answer cache shared by all gunicorn workers.
+
+Answers are keyed by the normalised question, the response language and the
+corpus version, so a price list change can never serve a stale answer. The
+database runs in WAL mode, which lets several worker processes read while one
+writes.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+
+from sqlite_store import SharedDatabase
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s\u0900-\u097F\u0A80-\u0AFF]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Case-fold, strip punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class AnswerCache:
+    """TTL + LRU bounded cache of final chat answers."""
+
+    def __init__(self, path, ttl=3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db = SharedDatabase(path)
+        self._db.run(self._create)
+
+    @staticmethod
+    def _create(conn):
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY,"
+                " corpus_version TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(question, language, corpus_version, prompt_version=""):
+        raw = "\0".join((normalize_question(question), language, corpus_version, prompt_version))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key, corpus_version):
+        try:
+            return self._db.run(self._get, key, corpus_version)
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache lookup failed: {str(e)}")
+            return None
+
+    def _get(self, conn, key, corpus_version):
+        now = time.time()
+        row = conn.execute(
+            "SELECT answer FROM answers WHERE key = ? AND corpus_version = ? AND created_at > ?",
+            (key, corpus_version, now - self.ttl),
+        ).fetchone()
+        if row is None:
+            self._count(conn, "misses")
+            return None
+        conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+        self._count(conn, "hits")
+        return row[0]
+
+    def put(self, key, corpus_version, answer):
+        try:
+            self._db.run(self._put, key, corpus_version, answer)
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache store failed: {str(e)}")
+
+    def _put(self, conn, key, corpus_version, answer):
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO answers (key, corpus_version, answer, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, corpus_version, answer, now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM answers WHERE key IN ("
+            " SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def purge_version(self, corpus_version):
+        """Drop every entry cached against a corpus version that was replaced.
+
+        Each tenant has its own corpus versions, so only the replaced one goes.
+        """
+        try:
+            deleted = self._db.run(
+                lambda conn: conn.execute("DELETE FROM answers WHERE corpus_version = ?", (corpus_version,)).rowcount
+            )
+            if deleted:
+                logger.info(f"Purged {deleted} cached answers from corpus version {corpus_version}")
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache purge failed: {str(e)}")
+
+    def stats(self):
+        try:
+            counters, entries = self._db.run(lambda conn: (
+                dict(conn.execute("SELECT name, value FROM counters").fetchall()),
+                conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0],
+            ))
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache stats failed: {str(e)}")
+            return {}
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
@@ -1,6 +1,6 @@
+import time
+_import_started = time.perf_counter()
 import os
-import PyPDF2
-import google.generativeai as genai
 from flask import Flask, request, render_template, jsonify, Response, session
 from datetime import datetime, timedelta
 from flask_cors import CORS
@@ -9,14 +9,42 @@ import json
 import traceback
 import logging
 import hashlib
-import time
 import sys
+import threading
+import tempfile
+import uuid
+import shutil
+import mimetypes
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import jwt
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import pandas as pd
-from supabase import create_client, Client
+from corpus import load_snapshot, save_snapshot
+from tenants import TenantCorpora, TenantCorpus, TenantDirectory, shared_paths, snapshot_size, tenant_paths, valid_tenant_id
+from mapped_corpus import MappedSnapshot, RefreshLease, file_stamp, write_mapped
+from offload import run_cpu_bound
+from lazy import Lazy
+from change_detection import Manifest, list_bucket_folders, list_bucket_objects
+from extraction_cache import ExtractionCache
+from ingestion import IngestionPipeline, decode_text, default_extract_processes
+from artifacts import parse_artifact_path, publish_artifact, remove_artifacts
+from prompt import PromptBuilder, prefix_hash
+from answer_cache import AnswerCache
+from conversations import ConversationStore
+from singleflight import SingleFlight
+from deadline_model import DeadlineExceeded, DeadlineModel
+from interaction_log import InteractionLogger
+from admission import AdmissionController, Overloaded
+from spreadsheet import serialize_workbook
+from storage import FakeSupabaseClient, LocalStorageBucket, MemoryStorageBucket
+from metrics import registry as metrics
+from profiler import SamplingProfiler
+
+# Startup phases in seconds; /healthz reports them
+startup_timings = {"imports": time.perf_counter() - _import_started}
 
 # Configure logging
 logging.basicConfig(
@@ -31,29 +59,65 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
+# Where uploads and users live: "supabase", or "local" (files under
+# PDF_DIRECTORY) / "memory" for running offline with an in-process stand-in
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
+# Supabase settings; the client itself is created on first use
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
+if STORAGE_BACKEND == "supabase" and (not SUPABASE_URL or not SUPABASE_KEY):
     logger.error("SUPABASE_URL or SUPABASE_KEY environment variables are not set")
     raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# Configure Gemini API
+# Configure Gemini API; GEMINI_BACKEND=fake answers with FakeGeminiModel instead
+# (offline runs and benchmarks), with the latency and token rate set below
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "gemini").lower()
+FAKE_GEMINI_LATENCY = float(os.getenv("FAKE_GEMINI_LATENCY", "0.3"))
+FAKE_GEMINI_TOKENS_PER_SECOND = float(os.getenv("FAKE_GEMINI_TOKENS_PER_SECOND", "50"))
+FAKE_GEMINI_ANSWER_TOKENS = int(os.getenv("FAKE_GEMINI_ANSWER_TOKENS", "80"))
+# Injected tail latency and failures, to exercise deadlines, retries and hedging
+FAKE_GEMINI_SLOW_RATE = float(os.getenv("FAKE_GEMINI_SLOW_RATE", "0"))
+FAKE_GEMINI_SLOW_LATENCY = float(os.getenv("FAKE_GEMINI_SLOW_LATENCY", "10"))
+FAKE_GEMINI_FAILURE_RATE = float(os.getenv("FAKE_GEMINI_FAILURE_RATE", "0"))
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+if GEMINI_BACKEND == "gemini" and not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY environment variable is not set")
     raise ValueError("GEMINI_API_KEY environment variable is not set")
 
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    logger.info("Successfully configured Gemini API")
-except Exception as e:
-    logger.error(f"Failed to configure Gemini API: {str(e)}")
-    raise
+def use_cooperative_grpc():
+    """Let the Gemini SDK's gRPC calls yield to other greenlets under gevent workers."""
+    if "gevent" not in sys.modules:
+        return
+    from gevent import monkey
+    if monkey.is_module_patched("socket"):
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+        logger.info("Enabled gevent-compatible gRPC")
+
+def configure_gemini():
+    """Import and configure the Gemini SDK; runs on the first chat that needs it."""
+    if GEMINI_BACKEND == "fake":
+        from fake_gemini import FakeGeminiModel, long_tail
+        logger.info(f"Using fake Gemini model (latency={FAKE_GEMINI_LATENCY}s, {FAKE_GEMINI_TOKENS_PER_SECOND} tokens/s)")
+        latency = FAKE_GEMINI_LATENCY
+        if FAKE_GEMINI_SLOW_RATE > 0:
+            latency = long_tail(FAKE_GEMINI_LATENCY, FAKE_GEMINI_SLOW_RATE, FAKE_GEMINI_SLOW_LATENCY)
+        return FakeGeminiModel(latency, FAKE_GEMINI_TOKENS_PER_SECOND, FAKE_GEMINI_ANSWER_TOKENS,
+                               failure_rate=FAKE_GEMINI_FAILURE_RATE)
+    try:
+        import google.generativeai as genai
+        use_cooperative_grpc()
+        genai.configure(api_key=GEMINI_API_KEY)
+        gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+        logger.info("Successfully configured Gemini API")
+        return gemini_model
+    except Exception as e:
+        logger.error(f"Failed to configure Gemini API: {str(e)}")
+        raise
+
+model = Lazy("gemini", configure_gemini)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -70,33 +134,190 @@ CORS(app, resources={
             "https://max-enquiry-chatbot-3qa0xcwdu-khushins-projects.vercel.app"
         ],
         "methods": ["GET", "POST", "OPTIONS", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["X-Conversation-Id"]
     }
 })
 
-# Directory containing PDF files
+# Directory containing PDF files (the bucket itself when STORAGE_BACKEND=local)
 PDF_DIRECTORY = os.getenv("PDF_DIRECTORY", "pdfs")
+LOCAL_STORAGE_WATCH = os.getenv("LOCAL_STORAGE_WATCH", "true").lower() == "true"
 
 # File upload configuration
 ALLOWED_EXTENSIONS = {'pdf', 'xlsx', 'xls'}
 BUCKET_NAME = "price-lists"  # Name of your Supabase storage bucket
+# Text goes into the corpus; spreadsheets also feed the structured price table
+INGESTED_EXTENSIONS = ('.pdf', '.txt', '.xlsx', '.xls')
 
 # Initialize Supabase storage bucket if it doesn't exist
-def init_storage_bucket():
+def init_storage_bucket(client):
     try:
         # Check if bucket exists
-        response = supabase.storage.get_bucket(BUCKET_NAME)
+        response = client.storage.get_bucket(BUCKET_NAME)
         logger.info(f"Storage bucket '{BUCKET_NAME}' already exists")
     except Exception as e:
         logger.error(f"Storage bucket '{BUCKET_NAME}' does not exist or could not be accessed: {str(e)}")
         raise
 
-# Initialize storage bucket
-init_storage_bucket()
+def connect_supabase():
+    """Create the Supabase client (or its offline stand-in) and check the bucket; runs on first use."""
+    if STORAGE_BACKEND == "local":
+        bucket = LocalStorageBucket(PDF_DIRECTORY)
+        client = FakeSupabaseClient({BUCKET_NAME: bucket})
+        if LOCAL_STORAGE_WATCH:
+            # Pick up files dropped into the directory without waiting for the next poll
+            bucket.watch(refresh_requested.set)
+        logger.info(f"Using local storage in '{bucket.root}'")
+    elif STORAGE_BACKEND == "memory":
+        client = FakeSupabaseClient({BUCKET_NAME: MemoryStorageBucket()})
+        logger.info("Using in-memory storage")
+    elif STORAGE_BACKEND == "supabase":
+        from supabase import create_client
+        client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+    init_storage_bucket(client)
+    return client
+
+supabase = Lazy("supabase", connect_supabase)
+
+# Local cache directory (Vercel only allows writes under /tmp)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "max_chatbot"))
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", os.path.join(CACHE_DIR, "manifest.json"))
+# Last published snapshot, served on startup until the bucket has been checked. It is
+# unpickled, so it lives in a directory only this user can write (see corpus.save_snapshot)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(CACHE_DIR, "snapshots", "corpus-snapshot.pickle"))
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(CACHE_DIR, "extracted"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_BYTES)
+
+# Per-tenant corpora: a tenant is an admin's <user_id>/ folder, "" is the whole bucket.
+# Chats without a tenant use DEFAULT_TENANT, which is loaded at startup and never evicted.
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "")
+TENANT_MEMORY_MAX_BYTES = int(os.getenv("TENANT_MEMORY_MAX_BYTES", str(512 * 1024 * 1024)))
+TENANT_MAX_LOADED = int(os.getenv("TENANT_MAX_LOADED", "256"))
+# Chats may name DEFAULT_TENANT, these (comma-separated) ids, or an admin folder in the bucket
+TENANTS = [tenant.strip() for tenant in os.getenv("TENANTS", "").split(",") if tenant.strip()]
+# How long the list of admin folders is trusted before an unknown tenant re-lists the bucket
+TENANT_LOOKUP_TTL = float(os.getenv("TENANT_LOOKUP_TTL", "60"))
+
+# Ingestion concurrency: download threads and PDF extraction processes (0 = inline)
+INGEST_DOWNLOAD_WORKERS = int(os.getenv("INGEST_DOWNLOAD_WORKERS", "4"))
+INGEST_EXTRACT_PROCESSES = int(os.getenv("INGEST_EXTRACT_PROCESSES", str(default_extract_processes())))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "20"))
+ingestion = IngestionPipeline(
+    extraction_cache,
+    download_workers=INGEST_DOWNLOAD_WORKERS,
+    extract_processes=INGEST_EXTRACT_PROCESSES,
+    pages_per_task=INGEST_PAGES_PER_TASK,
+)
+
+# Retrieval: how much product context (in estimated tokens) goes into a prompt
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "6000"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))
 
-# Global variables to store PDF data and file hashes
-product_data = ""
-pdf_hashes = {}
+# Hard cap on the whole prompt, and the share conversation history may use
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+PROMPT_HISTORY_BUDGET = int(os.getenv("PROMPT_HISTORY_BUDGET", "1000"))
+prompt_builder = PromptBuilder(
+    token_budget=PROMPT_TOKEN_BUDGET,
+    context_budget=RETRIEVAL_TOKEN_BUDGET,
+    history_budget=PROMPT_HISTORY_BUDGET,
+    top_k=RETRIEVAL_TOP_K,
+)
+
+# Answer cache shared by all workers through SQLite
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answers.sqlite3"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES)
+
+# Conversation history, shared by all workers through SQLite (empty path = in memory)
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(CACHE_DIR, "conversations.sqlite3"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "10"))
+CONVERSATION_MAX_COUNT = int(os.getenv("CONVERSATION_MAX_COUNT", "10000"))
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(24 * 3600)))
+conversations = ConversationStore(
+    CONVERSATION_DB_PATH or None,
+    max_turns=CONVERSATION_MAX_TURNS,
+    max_conversations=CONVERSATION_MAX_COUNT,
+    ttl=CONVERSATION_TTL,
+)
+
+# Identical prompts in flight at the same time share one Gemini call
+GEMINI_STREAM_TIMEOUT = float(os.getenv("GEMINI_STREAM_TIMEOUT", "60"))
+gemini_flights = SingleFlight()
+
+# Every chat answer must finish within CHAT_DEADLINE seconds of the request
+# arriving (below Vercel's 30 s maxDuration). Gemini calls inherit what is
+# left of it: failed attempts are retried with jittered backoff while the
+# budget allows, and with GEMINI_HEDGE=true a second attempt races one that
+# is slower than the recent p95 time to first token.
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "25"))
+gemini = DeadlineModel(
+    model,
+    max_attempts=int(os.getenv("GEMINI_MAX_ATTEMPTS", "3")),
+    backoff=float(os.getenv("GEMINI_RETRY_BACKOFF", "0.25")),
+    max_backoff=float(os.getenv("GEMINI_RETRY_MAX_BACKOFF", "2")),
+    hedge=os.getenv("GEMINI_HEDGE", "false").lower() == "true",
+    hedge_percentile=float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95")),
+    hedge_initial_delay=float(os.getenv("GEMINI_HEDGE_INITIAL_DELAY", "2")),
+    hedge_min_delay=float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "0.25")),
+)
+
+# Admission control for Gemini calls: a bounded number in flight, a bounded
+# queue with a deadline, and fast 429/503 rejection beyond that
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "8"))
+GEMINI_MAX_WAITING = int(os.getenv("GEMINI_MAX_WAITING", "32"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+gemini_admission = AdmissionController(GEMINI_MAX_IN_FLIGHT, GEMINI_MAX_WAITING, GEMINI_QUEUE_TIMEOUT)
+
+# Background refresher controls
+CORPUS_REFRESH_INTERVAL = float(os.getenv("CORPUS_REFRESH_INTERVAL", "5"))
+stop_polling = threading.Event()
+refresh_requested = threading.Event()
+# How long a chat waits for its tenant's warm snapshot or first bucket scan
+CORPUS_READY_TIMEOUT = float(os.getenv("CORPUS_READY_TIMEOUT", "20"))
+_refresher_thread = None
+
+# Metrics: each worker writes its values under METRICS_DIR and /metrics merges them
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# /debug/profile (admins only) samples stacks for a flame graph when enabled
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+# Bulk uploads: every file (or zip member) is spooled to disk under
+# UPLOAD_SPOOL_DIR and BULK_UPLOAD_WORKERS of them are stored at a time
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(CACHE_DIR, "uploads"))
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "4"))
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "200"))
+BULK_UPLOAD_MAX_FILE_BYTES = int(os.getenv("BULK_UPLOAD_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+
+CHAT_STAGE_SECONDS = metrics.histogram("chatbot_chat_stage_seconds", "Time spent in each stage of /api/chat.", ("stage",))
+CHAT_REQUESTS = metrics.counter("chatbot_chat_requests_total", "Chat requests by how they were answered.", ("outcome",))
+CHAT_TTFB_SECONDS = metrics.histogram("chatbot_chat_ttfb_seconds", "Time to the first byte of a chat answer.")
+CHAT_DURATION_SECONDS = metrics.histogram("chatbot_chat_duration_seconds", "Time to the last byte of a chat answer.")
+PROMPT_TOKENS = metrics.counter("chatbot_prompt_tokens_total", "Estimated prompt tokens sent to Gemini, by section.", ("section",))
+PROMPT_SIZE_TOKENS = metrics.histogram(
+    "chatbot_prompt_size_tokens", "Estimated size of each prompt sent to Gemini.",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+ANSWER_CACHE_LOOKUPS = metrics.counter("chatbot_answer_cache_lookups_total", "Answer cache lookups by result.", ("result",))
+EXTRACTION_CACHE_LOOKUPS = metrics.counter("chatbot_extraction_cache_lookups_total", "Extraction cache lookups by result.", ("result",))
+GEMINI_CALLS = metrics.counter("chatbot_gemini_calls_total", "Gemini calls started, and requests that joined one in flight.", ("kind",))
+GEMINI_ATTEMPTS = metrics.counter("chatbot_gemini_attempts_total", "Upstream Gemini attempts by kind.", ("kind",))
+GEMINI_ATTEMPT_RESULTS = metrics.counter(
+    "chatbot_gemini_attempt_results_total", "Gemini attempts that failed, were cancelled or ran out of time, and hedges that won.", ("result",))
+GEMINI_ADMISSION = metrics.gauge("chatbot_gemini_admission", "Gemini calls in flight and requests queued for a slot.", ("state",), mode="sum")
+REFRESH_STAGE_SECONDS = metrics.histogram("chatbot_refresh_stage_seconds", "Time spent in each stage of a corpus refresh.", ("stage",))
+UPLOAD_STAGE_SECONDS = metrics.histogram("chatbot_upload_stage_seconds", "Time spent in each stage of a file upload.", ("stage",))
+UPLOADED_FILES = metrics.counter("chatbot_uploaded_files_total", "Files received by the upload endpoints, by result.", ("result",))
+INTERACTION_INSERT_SECONDS = metrics.histogram("chatbot_interaction_insert_seconds", "Time to insert a batch of logged interactions.")
+CORPUS_INFO = metrics.gauge("chatbot_corpus_info", "Corpus version served for each loaded tenant.", ("tenant", "version"))
+CORPUS_DOCUMENTS = metrics.gauge("chatbot_corpus_documents", "Documents in each loaded tenant's corpus.", ("tenant",))
+CORPUS_TOKENS = metrics.gauge("chatbot_corpus_tokens", "Estimated tokens in each loaded tenant's corpus.", ("tenant",))
 
 def calculate_file_hash(file_path):
     """Calculate MD5 hash of a file."""
@@ -106,88 +327,208 @@ def calculate_file_hash(file_path):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
-def get_pdf_files():
-    """Get list of PDF files in the directory."""
-    if not os.path.exists(PDF_DIRECTORY):
-        return []
-    return [f for f in os.listdir(PDF_DIRECTORY) if f.lower().endswith('.pdf')]
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_pdf_text():
-    """Extract text from all PDFs and text files in Supabase Storage."""
-    global product_data, pdf_hashes
-    pdf_text = ""
-    new_hashes = {}
+def extract_pdf_text(tenant=None):
+    """Extract text from all PDFs and text files of a tenant in Supabase Storage.
+
+    Only objects whose listing metadata changed since the last run are
+    downloaded; everything else is served from the persisted manifest, so the
+    published snapshot (and the returned text) always covers the full corpus.
+    Files with a precomputed artifact are loaded from it instead of re-parsed.
+    """
+    tenant = tenant or tenants.get(DEFAULT_TENANT)
+    with tenant.refresh_lock, REFRESH_STAGE_SECONDS.time(stage="total"):
+        return _refresh_tenant(tenant)
+
+def _refresh_tenant(tenant):
+    entries = {}
+    manifest = tenant.manifest
     
     try:
-        # List all files in the bucket
-        response = supabase.storage.from_(BUCKET_NAME).list()
+        # List the tenant's folder (the whole bucket for the "" tenant)
+        stage_started = time.perf_counter()
+        bucket = supabase.storage.from_(BUCKET_NAME)
+        objects = []
+        artifacts = {}
+        for obj in list_bucket_objects(bucket, tenant.prefix):
+            parsed = parse_artifact_path(obj.path)
+            if parsed is None:
+                if obj.path.endswith(INGESTED_EXTENSIONS):
+                    objects.append(obj)
+                continue
+            # Keep the newest artifact per source if a stale one is still around
+            source_path = parsed[0]
+            if source_path not in artifacts or obj.modified > artifacts[source_path].modified:
+                artifacts[source_path] = obj
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - stage_started, stage="list")
         
-        for file in response:
-            if file['name'].endswith(('.pdf', '.txt')):
-                try:
-                    # Download file content
-                    file_content = supabase.storage.from_(BUCKET_NAME).download(file['name'])
-                    
-                    # Calculate hash of the content
-                    content_hash = hashlib.md5(file_content).hexdigest()
-                    new_hashes[file['name']] = content_hash
-                    
-                    # Skip if file hasn't changed
-                    if file['name'] in pdf_hashes and pdf_hashes[file['name']] == content_hash:
-                        logger.info(f"Skipping unchanged file: {file['name']}")
-                        continue
-                    
-                    logger.info(f"Processing file: {file['name']}")
-                    
-                    if file['name'].endswith('.pdf'):
-                        # Process PDF
-                        with open("temp.pdf", "wb") as f:
-                            f.write(file_content)
-                        reader = PyPDF2.PdfReader("temp.pdf")
-                        for page_num, page in enumerate(reader.pages, 1):
-                            try:
-                                text = page.extract_text()
-                                if text:
-                                    pdf_text += f"\n--- Page {page_num} from {file['name']} ---\n{text}\n"
-                            except Exception as e:
-                                logger.error(f"Error extracting text from page {page_num} of {file['name']}: {str(e)}")
-                        os.remove("temp.pdf")
-                    else:  # .txt file
-                        # Process text file
-                        text = file_content.decode('utf-8')
-                        if text:
-                            pdf_text += f"\n--- Content from {file['name']} ---\n{text}\n"
-                    
-                except Exception as e:
-                    logger.error(f"Error processing {file['name']}: {str(e)}")
+        stage_started = time.perf_counter()
+        changed = []
+        for obj in objects:
+            # Skip the download entirely if the metadata hasn't changed
+            document = manifest.lookup(obj)
+            if document is not None:
+                entries[obj.path] = (obj.fingerprint, document)
+            else:
+                changed.append(obj)
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - stage_started, stage="diff")
         
-        # Update global variables
-        pdf_hashes = new_hashes
-        if pdf_text:
-            product_data = pdf_text
-            logger.info("Successfully updated product data")
-        else:
-            logger.warning("No text was extracted from any files")
+        if changed:
+            with REFRESH_STAGE_SECONDS.time(stage="ingest"):
+                entries.update(ingestion.run(bucket, changed, manifest.previous, artifacts))
+        
+        manifest.replace(entries)
+        previous_version = tenant.current().version
+        with REFRESH_STAGE_SECONDS.time(stage="publish"):
+            snapshot, changed = tenant.store.publish(document for _, document in entries.values())
+        if changed:
+            logger.info(f"Published corpus version {snapshot.version} for tenant '{tenant.tenant_id}' ({len(snapshot.documents)} files)")
+            answer_cache.purge_version(previous_version)
+            tenant.size = run_cpu_bound(snapshot_size, snapshot)
+            try:
+                with REFRESH_STAGE_SECONDS.time(stage="save_snapshot"):
+                    run_cpu_bound(save_snapshot, snapshot, tenant.snapshot_path)
+            except Exception as e:
+                logger.warning(f"Could not save warm snapshot: {str(e)}")
+        if changed or not os.path.exists(tenant.mapped_path):
+            # Other workers map this file instead of ingesting themselves
+            try:
+                with REFRESH_STAGE_SECONDS.time(stage="write_mapped"):
+                    run_cpu_bound(write_mapped, snapshot, tenant.mapped_path)
+                tenant.mapped_stamp = file_stamp(tenant.mapped_path)
+            except Exception as e:
+                logger.warning(f"Could not write shared snapshot: {str(e)}")
+        if changed and not snapshot.has_text:
+            # Only when a new version is published; an empty tenant would otherwise warn on every poll
+            logger.warning(f"No text was extracted from any files for tenant '{tenant.tenant_id}'")
         
-        return pdf_text
+        return snapshot.text
         
     except Exception as e:
         logger.error(f"Error extracting text from storage: {str(e)}")
-        return ""
+        return tenant.current().text
 
-def poll_pdf_directory():
-    """Poll the Supabase Storage for changes."""
-    global stop_polling
-    while not stop_polling:
+def publish_upload_artifact(bucket, file_path, file_content, kind, pages=(), tables=(), content_hash=None):
+    """Precompute an uploaded file's ingestion artifact and store it next to the file."""
+    if not content_hash:
+        # A spooled upload is hashed from disk in chunks
+        content_hash = calculate_file_hash(file_content) if isinstance(file_content, str) else hashlib.md5(file_content).hexdigest()
+    artifact = ingestion.prepare(content_hash, kind, pages, tables)
+    publish_artifact(bucket, file_path, content_hash, artifact)
+
+def make_tenant(tenant_id):
+    if tenant_id == "":
+        # The whole-bucket corpus keeps its historical cache locations
+        manifest_path, snapshot_path = MANIFEST_PATH, SNAPSHOT_PATH
+    else:
+        manifest_path, snapshot_path = tenant_paths(CACHE_DIR, tenant_id)
+    # Reading the manifest hydrates every cached document, so it happens off the request path
+    manifest = Lazy(f"manifest:{tenant_id}" if tenant_id else "manifest", lambda: Manifest(manifest_path, extraction_cache))
+    mapped_path, lock_path = shared_paths(snapshot_path)
+    return TenantCorpus(tenant_id, manifest, snapshot_path, mapped_path, RefreshLease(lock_path))
+
+def sync_shared_snapshot(tenant):
+    """Map the tenant's shared snapshot if another worker has written a new one."""
+    stamp = file_stamp(tenant.mapped_path)
+    if stamp is None:
+        return False
+    if stamp != tenant.mapped_stamp:
         try:
-            extract_pdf_text()
-            time.sleep(5)  # Poll every 5 seconds
+            snapshot = MappedSnapshot(tenant.mapped_path)
         except Exception as e:
-            logger.error(f"Error in storage polling: {str(e)}")
-            time.sleep(5)  # Wait before retrying
+            logger.warning(f"Could not map shared snapshot {tenant.mapped_path}: {str(e)}")
+            return False
+        if snapshot.version != tenant.current().version:
+            tenant.store.swap(snapshot)
+            tenant.size = snapshot_size(snapshot)
+            logger.info(f"Mapped shared snapshot {snapshot.version} for tenant '{tenant.tenant_id}'")
+        tenant.mapped_stamp = stamp
+    tenant.ready.set()
+    return True
+
+def refresh_tenant(tenant):
+    """Refresh from storage if this process holds the tenant's lease, else follow the shared file."""
+    if tenant.lease.acquire():
+        extract_pdf_text(tenant)
+    else:
+        sync_shared_snapshot(tenant)
+
+def load_tenant(tenant):
+    """Serve the saved snapshot right away, then reconcile it with the bucket.
+
+    Only the worker holding the tenant's refresh lease talks to storage;
+    the others wait for the snapshot file it writes and map that.
+    """
+    started = time.perf_counter()
+    while not tenant.lease.acquire():
+        if sync_shared_snapshot(tenant):
+            if tenant.tenant_id == DEFAULT_TENANT:
+                startup_timings["shared_snapshot"] = time.perf_counter() - started
+            return
+        if stop_polling.wait(0.2):
+            return
+    timed = tenant.tenant_id == DEFAULT_TENANT
+    started = time.perf_counter()
+    # Unpickling a large snapshot is CPU bound, so under gevent it runs on a native thread
+    snapshot = run_cpu_bound(load_snapshot, tenant.snapshot_path)
+    if snapshot is not None and tenant.store.restore(snapshot):
+        tenant.size = snapshot_size(snapshot)
+        tenant.ready.set()
+        if timed:
+            startup_timings["warm_snapshot"] = time.perf_counter() - started
+        logger.info(f"Restored warm snapshot {snapshot.version} for tenant '{tenant.tenant_id}' ({len(snapshot.documents)} files)")
+    started = time.perf_counter()
+    try:
+        product_data = extract_pdf_text(tenant)
+        if not product_data.strip():
+            logger.warning(f"No product data was extracted for tenant '{tenant.tenant_id}'")
+        else:
+            logger.info(f"Successfully loaded product data for tenant '{tenant.tenant_id}'")
+    finally:
+        if timed:
+            startup_timings["first_refresh"] = time.perf_counter() - started
+
+def poll_pdf_directory():
+    """Poll the Supabase Storage for changes to every loaded tenant."""
+    while not stop_polling.is_set():
+        # Wake up early when a refresh is requested (e.g. after an upload)
+        refresh_requested.wait(CORPUS_REFRESH_INTERVAL)
+        refresh_requested.clear()
+        if stop_polling.is_set():
+            break
+        for tenant in tenants.loaded():
+            # Tenants still loading are refreshed by their loader
+            if not tenant.ready.is_set():
+                continue
+            try:
+                refresh_tenant(tenant)
+            except Exception as e:
+                logger.error(f"Error in storage polling: {str(e)}")
+        tenants.evict()
+
+def start_corpus_refresher():
+    """Start the background refresher thread once per process."""
+    global _refresher_thread
+    if _refresher_thread is not None and _refresher_thread.is_alive():
+        return
+    stop_polling.clear()
+    _refresher_thread = threading.Thread(target=poll_pdf_directory, name="corpus-refresher", daemon=True)
+    _refresher_thread.start()
+
+tenant_directory = TenantDirectory(
+    lambda: list_bucket_folders(supabase.storage.from_(BUCKET_NAME)),
+    configured=[DEFAULT_TENANT, *TENANTS],
+    ttl=TENANT_LOOKUP_TTL,
+)
+tenants = TenantCorpora(
+    make_tenant,
+    load_tenant,
+    max_bytes=TENANT_MEMORY_MAX_BYTES,
+    max_tenants=TENANT_MAX_LOADED,
+    pinned=(DEFAULT_TENANT,),
+)
 
 # JWT configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")  # Change this in production
@@ -320,42 +661,115 @@ def login():
         logger.error(f"Login error: {str(e)}")
         return jsonify({"error": "Internal server error", "status": "error"}), 500
 
+# Interaction logging is batched off the request path
+INTERACTION_LOG_QUEUE_SIZE = int(os.getenv("INTERACTION_LOG_QUEUE_SIZE", "10000"))
+INTERACTION_LOG_BATCH_SIZE = int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "50"))
+INTERACTION_LOG_FLUSH_INTERVAL = float(os.getenv("INTERACTION_LOG_FLUSH_INTERVAL", "2"))
+INTERACTION_LOG_PUT_TIMEOUT = float(os.getenv("INTERACTION_LOG_PUT_TIMEOUT", "0"))
+INTERACTION_LOG_SPILL_PATH = os.getenv("INTERACTION_LOG_SPILL_PATH", os.path.join(CACHE_DIR, "queries-spill.jsonl"))
+
+def insert_interactions(rows):
+    with INTERACTION_INSERT_SECONDS.time():
+        supabase.table("queries").insert(rows).execute()
+
+interaction_logger = InteractionLogger(
+    insert_interactions,
+    max_queue=INTERACTION_LOG_QUEUE_SIZE,
+    batch_size=INTERACTION_LOG_BATCH_SIZE,
+    flush_interval=INTERACTION_LOG_FLUSH_INTERVAL,
+    put_timeout=INTERACTION_LOG_PUT_TIMEOUT,
+    spill_path=INTERACTION_LOG_SPILL_PATH,
+)
+interaction_logger.start()
+
 # Log user question and response to database
 def log_interaction(question, response=None, error=None):
-    try:
-        supabase.table("queries").insert({
-            "question": question,
-            "response": response,
-            "timestamp": datetime.utcnow().isoformat(),
-            "error": error
-        }).execute()
-        logger.info("Successfully logged interaction")
-    except Exception as e:
-        logger.error(f"Failed to log interaction: {str(e)}")
+    if not interaction_logger.log({
+        "question": question,
+        "response": response,
+        "timestamp": datetime.utcnow().isoformat(),
+        "error": error
+    }):
+        logger.warning("Interaction log queue is full; dropped interaction")
 
-# Extract product data once at startup (for Vercel, this will happen on each cold start)
-try:
-    product_data = extract_pdf_text()
-    if not product_data.strip():
-        logger.warning("No product data was extracted from PDFs")
-    else:
-        logger.info("Successfully loaded product data")
-except Exception as e:
-    logger.error(f"Failed to extract product data: {str(e)}")
-    product_data = ""
+def generate_text(prompt, deadline):
+    """Yield the text of each chunk Gemini streams back for ``prompt`` before ``deadline`` (monotonic)."""
+    for chunk in gemini.stream(prompt, deadline):
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. the final finish-reason chunk)
+            continue
+        if text:
+            yield text
+
+# Recent chat timings in seconds: (time to first byte, total), newest last
+chat_timings = deque(maxlen=1000)
+
+def record_chat_timing(ttfb, total):
+    chat_timings.append((ttfb, total))
+    CHAT_TTFB_SECONDS.observe(ttfb)
+    CHAT_DURATION_SECONDS.observe(total)
+
+@metrics.on_collect
+def collect_metrics():
+    """Mirror counts kept by other components into metrics before each flush or scrape."""
+    EXTRACTION_CACHE_LOOKUPS.set_total(extraction_cache.hits, result="hit")
+    EXTRACTION_CACHE_LOOKUPS.set_total(extraction_cache.misses, result="miss")
+    GEMINI_CALLS.set_total(gemini_flights.started, kind="started")
+    GEMINI_CALLS.set_total(gemini_flights.coalesced, kind="coalesced")
+    attempts = gemini.stats()
+    GEMINI_ATTEMPTS.set_total(attempts["attempts"] - attempts["retries"] - attempts["hedges"], kind="primary")
+    GEMINI_ATTEMPTS.set_total(attempts["retries"], kind="retry")
+    GEMINI_ATTEMPTS.set_total(attempts["hedges"], kind="hedge")
+    for result in ("errors", "cancelled", "deadline_exceeded", "hedge_wins"):
+        GEMINI_ATTEMPT_RESULTS.set_total(attempts[result], result=result)
+    admission = gemini_admission.stats()
+    GEMINI_ADMISSION.set(admission["in_flight"], state="in_flight")
+    GEMINI_ADMISSION.set(admission["waiting"], state="waiting")
+    # Evicted tenants and replaced versions drop out
+    for gauge in (CORPUS_INFO, CORPUS_DOCUMENTS, CORPUS_TOKENS):
+        gauge.clear()
+    for tenant in tenants.loaded():
+        snapshot = tenant.current()
+        CORPUS_INFO.set(1, tenant=tenant.tenant_id, version=snapshot.version)
+        CORPUS_DOCUMENTS.set(len(snapshot.documents), tenant=tenant.tenant_id)
+        CORPUS_TOKENS.set(snapshot.text_tokens, tenant=tenant.tenant_id)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+# Load the default corpus (warm snapshot first) and keep loaded tenants fresh
+# in the background, so neither imports nor requests wait on storage I/O
+tenants.get(DEFAULT_TENANT)
+start_corpus_refresher()
+metrics.start(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+startup_timings["app_import"] = time.perf_counter() - _import_started
 
 # Flask route for home page
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({"message": "Chatbot API is running", "status": "success"})
 
+def chat_response(body, conversation_id):
+    """Plain-text chat answer; the header lets cookie-less clients continue the conversation."""
+    response = Response(body, mimetype='text/plain')
+    response.headers["X-Conversation-Id"] = conversation_id
+    return response
+
 # Modify existing chat endpoint to not require authentication
 @app.route("/api/chat", methods=["POST"])
 def chat():
+    request_started = time.perf_counter()
+    request_deadline = time.monotonic() + CHAT_DEADLINE
     try:
         data = request.get_json()
         if not data or "message" not in data:
             logger.warning("No message provided in request")
+            CHAT_REQUESTS.inc(outcome="invalid")
             return jsonify({
                 "error": "No message provided. Please enter your question.",
                 "suggestion": "Type your question in the chat box.",
@@ -363,15 +777,51 @@ def chat():
             }), 400
 
         user_query = data["message"]
+        if not isinstance(user_query, str):
+            CHAT_REQUESTS.inc(outcome="invalid")
+            return jsonify({
+                "error": "The message must be text.",
+                "suggestion": "Type your question in the chat box.",
+                "status": "error"
+            }), 400
         customer_name = data.get("customerName", "Anonymous")
         language = data.get("language", "en")  # Default to English
+        if not isinstance(language, str):
+            CHAT_REQUESTS.inc(outcome="invalid")
+            return jsonify({"error": "Invalid language.", "status": "error"}), 400
         logger.info(f"Received query from {customer_name}: {user_query} (lang={language})")
 
-        # For Vercel, extract product data on each request to ensure freshness
-        current_product_data = extract_pdf_text()
-        if not current_product_data.strip():
+        # Each shop's chat widget names its tenant; otherwise use the default corpus
+        tenant_id = data.get("tenant", DEFAULT_TENANT)
+        if not isinstance(tenant_id, str) or not valid_tenant_id(tenant_id):
+            CHAT_REQUESTS.inc(outcome="invalid")
+            return jsonify({"error": "Invalid tenant.", "status": "error"}), 400
+        # Only tenants that exist get a corpus (and cache files); anything else is a 404
+        if not tenant_directory.known(tenant_id):
+            CHAT_REQUESTS.inc(outcome="unknown_tenant")
+            return jsonify({"error": "Unknown tenant.", "status": "error"}), 404
+        tenant = tenants.get(tenant_id)
+
+        # Right after a cold start (or for a tenant not loaded yet) the first scan may still be running
+        with CHAT_STAGE_SECONDS.time(stage="corpus_wait"):
+            ready = tenant.ready.wait(CORPUS_READY_TIMEOUT)
+        if not ready:
+            CHAT_REQUESTS.inc(outcome="not_ready")
+            response = jsonify({
+                "error": "The product catalogue is still loading.",
+                "suggestion": "Please try again in a few seconds.",
+                "status": "error"
+            })
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+
+        # Read the current snapshot; the background refresher keeps it fresh
+        snapshot = tenant.current()
+        if not snapshot.has_text:
             error_msg = "No product data available. Please upload a price list."
             logger.error(error_msg)
+            CHAT_REQUESTS.inc(outcome="no_data")
             log_interaction(user_query, error=error_msg)
             return jsonify({
                 "error": error_msg,
@@ -380,44 +830,100 @@ def chat():
             }), 500
 
         # --- Contextual Memory ---
-        history = session.get("chat_history", [])
-        # Keep only last 5 exchanges
-        history = history[-5:]
-        # Add current question
-        history.append({"role": "user", "content": user_query})
-        session["chat_history"] = history
+        # Only the conversation id lives in the cookie; history is kept server-side
+        conversation_id = data.get("conversationId") or session.get("conversation_id")
+        if not conversation_id:
+            conversation_id = uuid.uuid4().hex
+        session["conversation_id"] = conversation_id
+        with CHAT_STAGE_SECONDS.time(stage="conversation"):
+            conversation = conversations.get(conversation_id)
+            conversations.append(conversation_id, "user", user_query)
+
+        # Simple "price of X" questions are answered straight from the price table
+        with CHAT_STAGE_SECONDS.time(stage="price_table"):
+            direct_answer = snapshot.price_table.answer(user_query, language) if snapshot.price_table else None
+        if direct_answer is not None:
+            logger.info("Answered from the structured price table")
+            CHAT_REQUESTS.inc(outcome="price_table")
+            elapsed = time.perf_counter() - request_started
+            record_chat_timing(elapsed, elapsed)
+            log_interaction(user_query, direct_answer)
+            conversations.append(conversation_id, "assistant", direct_answer)
+            return chat_response(direct_answer, conversation_id)
+
+        # Cached answers are only valid when no earlier turn can change the answer
+        answer_key = None
+        if not conversation.turns and not conversation.summary:
+            answer_key = AnswerCache.make_key(user_query, language, snapshot.version, prefix_hash(language, snapshot.version))
+            with CHAT_STAGE_SECONDS.time(stage="answer_cache"):
+                cached_answer = answer_cache.get(answer_key, snapshot.version)
+            ANSWER_CACHE_LOOKUPS.inc(result="miss" if cached_answer is None else "hit")
+            if cached_answer is not None:
+                logger.info("Serving cached answer")
+                CHAT_REQUESTS.inc(outcome="answer_cache")
+                elapsed = time.perf_counter() - request_started
+                record_chat_timing(elapsed, elapsed)
+                log_interaction(user_query, cached_answer)
+                conversations.append(conversation_id, "assistant", cached_answer)
+                return chat_response(cached_answer, conversation_id)
 
         # --- Prompt Engineering ---
-        history_text = "\n".join([
-            f"{h['role'].capitalize()}: {h['content']}" for h in history
-        ])
-        prompt = f"""Based on the following product information:\n{current_product_data}\n\nConversation so far:\n{history_text}\n\nAnswer the user's question: {user_query}\n\nImportant:\n- When providing price information, format it in a clear and readable way.\n- Use bullet points for different price types.\n- Separate prices with clear labels.\n- Use proper spacing and line breaks.\n- Avoid using asterisks or markdown formatting.\n- Make sure the response is easy to read and understand.\n- If possible, return a JSON object with a 'text' field for the answer and a 'prices' field as a list of price items (if relevant).\n"""
-        if language == "gu":
-            prompt += (
-                "\n\nRespond ONLY in Gujarati language. Do NOT use English or any other language. "
-                "If you use any language other than Gujarati, it is incorrect. "
-                "All explanations, numbers, and price details must be in Gujarati."
-            )
-        elif language == "en":
-            prompt += (
-                "\n\nRespond ONLY in English language. Do NOT use Gujarati or any other language. "
-                "If you use any language other than English, it is incorrect. "
-                "All explanations, numbers, and price details must be in English."
-            )
-        else:
-            prompt += f"\n\nRespond ONLY in {language} language. Do NOT use any other language."
+        # Stable instructions first, then only as much context and history as fits
+        with CHAT_STAGE_SECONDS.time(stage="prompt"):
+            prompt = prompt_builder.build(snapshot, user_query, language, conversation.turns, conversation.summary)
+        for section, tokens in prompt.sections.items():
+            if section != "total":
+                PROMPT_TOKENS.inc(tokens, section=section)
+        PROMPT_SIZE_TOKENS.observe(prompt.sections["total"])
+
+        # Only the request that starts an upstream call takes an admission slot, and holds
+        # it until the call ends; identical requests join that call at no extra Gemini capacity
+        def admit():
+            with CHAT_STAGE_SECONDS.time(stage="admission"):
+                gemini_admission.acquire(timeout=max(0.0, request_deadline - time.monotonic()))
+
+        def start_call():
+            try:
+                yield from generate_text(prompt.text, request_deadline)
+            finally:
+                gemini_admission.release()
+
+        # A request joining an identical call waits for each chunk no longer than its deadline allows
+        chunk_timeout = min(GEMINI_STREAM_TIMEOUT, max(0.0, request_deadline - time.monotonic()))
+        try:
+            chunks = gemini_flights.stream(prompt.key, start_call, chunk_timeout, on_lead=admit)
+        except Overloaded as e:
+            logger.warning(f"Rejected chat request ({e.status}): {e.message}")
+            CHAT_REQUESTS.inc(outcome="rejected")
+            response = jsonify({
+                "error": e.message,
+                "suggestion": "Please try again in a few seconds.",
+                "status": "error"
+            })
+            response.status_code = e.status
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
 
         def stream_response():
+            first_byte_at = None
+            parts = []
+            outcome = "gemini"
             try:
-                # Call Gemini API
+                # Call Gemini API and forward text as soon as the model emits it
                 logger.info("Calling Gemini API (streaming)")
-                gemini_response = model.generate_content(prompt)
-                response = gemini_response.text
-                # Simulate streaming by splitting into chunks
-                chunk_size = 100
-                for i in range(0, len(response), chunk_size):
-                    yield response[i:i+chunk_size]
-                    time.sleep(0.05)
+                gemini_started = time.perf_counter()
+                for text in chunks:
+                    if first_byte_at is None:
+                        first_byte_at = time.perf_counter()
+                        CHAT_STAGE_SECONDS.observe(first_byte_at - gemini_started, stage="gemini_first_token")
+                    parts.append(text)
+                    yield text
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - gemini_started, stage="gemini_stream")
+                response = "".join(parts)
+                if answer_key is not None and response:
+                    answer_cache.put(answer_key, snapshot.version, response)
+                if response:
+                    conversations.append(conversation_id, "assistant", response)
                 # Log successful interaction
                 log_interaction(user_query, response)
                 logger.info("Successfully generated response (streamed)")
@@ -425,24 +931,100 @@ def chat():
                 error_msg = f"Error processing query: {str(e)}"
                 logger.error(f"Gemini API error: {str(e)}")
                 logger.error(traceback.format_exc())
+                if isinstance(e, Overloaded):
+                    # The identical call this request joined was never admitted
+                    outcome = "rejected"
+                else:
+                    outcome = "deadline" if isinstance(e, DeadlineExceeded) else "gemini_error"
                 log_interaction(user_query, error=error_msg)
                 yield f"[Error]: {error_msg}\nSuggestion: Try rephrasing your question or check if the price list is uploaded."
+            finally:
+                finished_at = time.perf_counter()
+                CHAT_REQUESTS.inc(outcome=outcome)
+                ttfb = (first_byte_at or finished_at) - request_started
+                record_chat_timing(ttfb, finished_at - request_started)
+                logger.info(f"Chat timing: ttfb={ttfb * 1000:.0f}ms total={(finished_at - request_started) * 1000:.0f}ms")
 
-        return Response(stream_response(), mimetype='text/plain')
+        return chat_response(stream_response(), conversation_id)
 
     except Exception as e:
         error_msg = f"Internal server error: {str(e)}"
         logger.error(f"Unexpected error: {str(e)}")
         logger.error(traceback.format_exc())
+        CHAT_REQUESTS.inc(outcome="error")
         return jsonify({
             "error": "Internal server error.",
             "suggestion": "Please try again later or contact support.",
             "status": "error"
         }), 500
 
+class UploadError(Exception):
+    """An uploaded file that could not be processed; the message is shown to the admin."""
+
+def store_upload(bucket, user_id, filename, content, content_type, content_hash=None, upsert=False):
+    """Store one uploaded file plus its spreadsheet text and precomputed artifacts.
+
+    ``content`` is the file's bytes or the path of a copy spooled to disk; a
+    path is streamed to storage and parsed from disk, so the file is never
+    held in memory. Returns the file's public URL and, for workbooks, the
+    serialization report.
+    """
+    file_path = f"{user_id}/{filename}"
+    options = {"content-type": content_type}
+    if upsert:
+        options["x-upsert"] = "true"
+    
+    # Upload to Supabase Storage
+    with UPLOAD_STAGE_SECONDS.time(stage="storage_upload"):
+        bucket.upload(file_path, content, options)
+    tenant_directory.add(user_id)
+    
+    # Files to precompute artifacts for: (path, content, kind, pages, tables, hash)
+    prepared = []
+    if filename.endswith('.pdf'):
+        prepared.append((file_path, content, "pdf", None, (), content_hash))
+    
+    # If it's an Excel file, convert it to compact text and upload
+    serialization = None
+    if filename.endswith(('.xlsx', '.xls')):
+        try:
+            with UPLOAD_STAGE_SECONDS.time(stage="serialize"):
+                tables, text_content, serialization = serialize_workbook(content)
+            logger.info(
+                f"Serialized {filename}: {serialization['sheets']} sheets, "
+                f"{serialization['bytes']} bytes (~{serialization['tokens']} tokens), "
+                f"saved {serialization['bytes_saved']} bytes (~{serialization['tokens_saved']} tokens)"
+            )
+            
+            # Upload text version
+            text_file_path = f"{file_path}.txt"
+            text_bytes = text_content.encode('utf-8')
+            with UPLOAD_STAGE_SECONDS.time(stage="storage_upload"):
+                bucket.upload(text_file_path, text_bytes, dict(options, **{"content-type": "text/plain"}))
+            prepared.append((file_path, content, "sheet", (), tables, content_hash))
+            prepared.append((text_file_path, text_bytes, "text", decode_text(text_bytes), (), None))
+        except Exception as e:
+            logger.error(f"Error converting Excel to text: {str(e)}")
+            raise UploadError("Error processing Excel file")
+    
+    # Extract, chunk and index now so chat workers never parse this file
+    for path, data, kind, pages, tables, digest in prepared:
+        try:
+            if pages is None:
+                with UPLOAD_STAGE_SECONDS.time(stage="extract"):
+                    pages = ingestion.extract_pdf(data)
+            with UPLOAD_STAGE_SECONDS.time(stage="artifact"):
+                publish_upload_artifact(bucket, path, data, kind, pages, tables, digest)
+        except Exception as e:
+            # The refresher falls back to ingesting the original file
+            logger.warning(f"Could not precompute artifact for {path}: {str(e)}")
+    
+    return {"url": bucket.get_public_url(file_path), "serialization": serialization}
+
 @app.route("/api/files/upload", methods=["POST"])
 @admin_required
 def upload_file(current_user):
+    upload_started = time.perf_counter()
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file part", "status": "error"}), 400
@@ -457,48 +1039,23 @@ def upload_file(current_user):
             # Read file content
             file_content = file.read()
             
-            # Upload to Supabase Storage
-            file_path = f"{current_user['user_id']}/{filename}"
-            response = supabase.storage.from_(BUCKET_NAME).upload(
-                file_path,
-                file_content,
-                {"content-type": file.content_type}
-            )
-            
-            # If it's an Excel file, convert it to text and upload
-            if filename.endswith(('.xlsx', '.xls')):
-                try:
-                    # Create a temporary file to process Excel
-                    temp_file = f"temp_{filename}"
-                    with open(temp_file, "wb") as f:
-                        f.write(file_content)
-                    
-                    # Convert Excel to text
-                    df = pd.read_excel(temp_file)
-                    text_content = df.to_string()
-                    
-                    # Upload text version
-                    text_filename = f"{filename}.txt"
-                    text_file_path = f"{current_user['user_id']}/{text_filename}"
-                    supabase.storage.from_(BUCKET_NAME).upload(
-                        text_file_path,
-                        text_content.encode('utf-8'),
-                        {"content-type": "text/plain"}
-                    )
-                    
-                    # Clean up temporary file
-                    os.remove(temp_file)
-                except Exception as e:
-                    logger.error(f"Error converting Excel to text: {str(e)}")
-                    return jsonify({"error": "Error processing Excel file", "status": "error"}), 500
+            bucket = supabase.storage.from_(BUCKET_NAME)
+            try:
+                stored = store_upload(bucket, current_user['user_id'], filename, file_content, file.content_type)
+            except UploadError as e:
+                UPLOADED_FILES.inc(result="error")
+                return jsonify({"error": str(e), "status": "error"}), 500
+            UPLOADED_FILES.inc(result="success")
             
-            # Get public URL for the file
-            file_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_path)
+            # Pick up the new file without waiting for the next poll
+            refresh_requested.set()
+            UPLOAD_STAGE_SECONDS.observe(time.perf_counter() - upload_started, stage="total")
             
             return jsonify({
                 "message": "File uploaded successfully",
                 "filename": filename,
-                "url": file_url,
+                "url": stored["url"],
+                "serialization": stored["serialization"],
                 "status": "success"
             })
         
@@ -508,6 +1065,138 @@ def upload_file(current_user):
         logger.error(f"File upload error: {str(e)}")
         return jsonify({"error": "File upload failed", "status": "error"}), 500
 
+def spool_upload(stream, directory, limit):
+    """Copy ``stream`` to a file in ``directory`` in chunks; returns its path."""
+    fd, path = tempfile.mkstemp(dir=directory, prefix="upload-")
+    copied = 0
+    with os.fdopen(fd, "wb") as f:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            copied += len(chunk)
+            if copied > limit:
+                raise UploadError(f"File is larger than {limit} bytes")
+            f.write(chunk)
+    return path
+
+def bulk_upload_entries(files):
+    """Yield ``(filename, archive, open_stream, size)`` for every uploaded file and zip member.
+
+    ``open_stream`` is None for an archive that can't be read; ``size`` is
+    only known (from the zip directory) for members.
+    """
+    for file in files:
+        name = file.filename or ""
+        if not name.lower().endswith(".zip"):
+            yield name, None, lambda file=file: file.stream, None
+            continue
+        try:
+            # Werkzeug has already spooled large parts to disk, so members are read from there
+            archive = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile:
+            yield name, None, None, None
+            continue
+        for info in archive.infolist():
+            member = info.filename.rsplit("/", 1)[-1]
+            if info.is_dir() or not member or member.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            yield member, name, lambda info=info, archive=archive: archive.open(info), info.file_size
+
+@app.route("/api/files/upload/bulk", methods=["POST"])
+@admin_required
+def bulk_upload_files(current_user):
+    """Upload several files and/or zip archives of them in one request.
+
+    Each file is spooled to disk, then up to BULK_UPLOAD_WORKERS are stored
+    (with artifacts and spreadsheet text, as for a single upload) at once.
+    Returns a result per file and refreshes the corpus once at the end.
+    """
+    upload_started = time.perf_counter()
+    files = request.files.getlist("files") + request.files.getlist("file")
+    if not files:
+        return jsonify({"error": "No file part", "status": "error"}), 400
+    overwrite = request.form.get("overwrite", "false").lower() == "true"
+    user_id = current_user['user_id']
+    bucket = supabase.storage.from_(BUCKET_NAME)
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    spool_dir = tempfile.mkdtemp(prefix="bulk-", dir=UPLOAD_SPOOL_DIR)
+
+    def store(filename, spooled_path, content_type):
+        try:
+            content_hash = calculate_file_hash(spooled_path)
+            stored = store_upload(bucket, user_id, filename, spooled_path, content_type,
+                                  content_hash=content_hash, upsert=overwrite)
+            return dict(stored, md5=content_hash, status="success")
+        finally:
+            os.remove(spooled_path)
+
+    results = []
+    pending = []
+    seen = set()
+    try:
+        with ThreadPoolExecutor(max_workers=BULK_UPLOAD_WORKERS, thread_name_prefix="bulk-upload") as pool:
+            for name, archive, open_stream, size in bulk_upload_entries(files):
+                result = {"filename": secure_filename(name) or name}
+                if archive:
+                    result["archive"] = archive
+                results.append(result)
+                filename = result["filename"]
+                if len(results) > BULK_UPLOAD_MAX_FILES:
+                    # One row for everything past the cap, zip members included
+                    result.update(status="error", error=f"More than {BULK_UPLOAD_MAX_FILES} files in one upload; this and the rest were not stored")
+                    break
+                if open_stream is None:
+                    result.update(status="error", error="Not a valid zip archive")
+                elif not filename or not allowed_file(filename):
+                    result.update(status="error", error="File type not allowed")
+                elif filename in seen:
+                    result.update(status="error", error="Duplicate file name in this upload")
+                elif size is not None and size > BULK_UPLOAD_MAX_FILE_BYTES:
+                    result.update(status="error", error=f"File is larger than {BULK_UPLOAD_MAX_FILE_BYTES} bytes")
+                else:
+                    seen.add(filename)
+                    try:
+                        with UPLOAD_STAGE_SECONDS.time(stage="spool"):
+                            stream = open_stream()
+                            try:
+                                spooled_path = spool_upload(stream, spool_dir, BULK_UPLOAD_MAX_FILE_BYTES)
+                            finally:
+                                if archive:
+                                    stream.close()
+                    except (UploadError, zipfile.BadZipFile, OSError) as e:
+                        result.update(status="error", error=str(e))
+                        continue
+                    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                    # Storing overlaps with spooling the next file
+                    pending.append((result, pool.submit(store, filename, spooled_path, content_type)))
+            for result, future in pending:
+                try:
+                    result.update(future.result())
+                except UploadError as e:
+                    result.update(status="error", error=str(e))
+                except Exception as e:
+                    logger.error(f"Bulk upload of {result['filename']} failed: {str(e)}")
+                    result.update(status="error", error="File upload failed")
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    uploaded = sum(1 for result in results if result["status"] == "success")
+    failed = len(results) - uploaded
+    UPLOADED_FILES.inc(uploaded, result="success")
+    UPLOADED_FILES.inc(failed, result="error")
+    if uploaded:
+        # One refresh for the whole batch
+        refresh_requested.set()
+    UPLOAD_STAGE_SECONDS.observe(time.perf_counter() - upload_started, stage="bulk_total")
+    logger.info(f"Bulk upload: {uploaded} stored, {failed} failed in {time.perf_counter() - upload_started:.1f}s")
+
+    # 207 when some files failed; each result says which and why
+    status = "success" if not failed else ("partial" if uploaded else "error")
+    return jsonify({
+        "uploaded": uploaded,
+        "failed": failed,
+        "files": results,
+        "status": status
+    }), 200 if not failed else 207
+
 @app.route("/api/files/list", methods=["GET"])
 @admin_required
 def list_files(current_user):
@@ -546,16 +1235,28 @@ def delete_file(current_user, filename):
         file_path = f"{current_user['user_id']}/{filename}"
         
         # Delete the file
-        supabase.storage.from_(BUCKET_NAME).remove([file_path])
+        bucket = supabase.storage.from_(BUCKET_NAME)
+        bucket.remove([file_path])
+        artifact_sources = [file_path]
         
         # If it's an Excel file, also delete the text version
         if filename.endswith(('.xlsx', '.xls')):
             text_file_path = f"{current_user['user_id']}/{filename}.txt"
+            artifact_sources.append(text_file_path)
             try:
-                supabase.storage.from_(BUCKET_NAME).remove([text_file_path])
+                bucket.remove([text_file_path])
             except Exception as e:
                 logger.warning(f"Could not delete text version of {filename}: {str(e)}")
         
+        # Remove the precomputed artifacts as well
+        for source_path in artifact_sources:
+            try:
+                remove_artifacts(bucket, source_path)
+            except Exception as e:
+                logger.warning(f"Could not delete artifacts of {source_path}: {str(e)}")
+        
+        refresh_requested.set()
+        
         return jsonify({
             "message": "File deleted successfully",
             "status": "success"
@@ -564,9 +1265,70 @@ def delete_file(current_user, filename):
         logger.error(f"Error deleting file: {str(e)}")
         return jsonify({"error": "Failed to delete file", "status": "error"}), 500
 
+@app.route("/api/chat/stats", methods=["GET"])
+def chat_stats():
+    """Time-to-first-byte and total latency over the most recent chats."""
+    timings = list(chat_timings)
+    ttfbs = [ttfb for ttfb, _ in timings]
+    totals = [total for _, total in timings]
+    def to_ms(value):
+        return round(value * 1000, 1) if value is not None else None
+    return jsonify({
+        "count": len(timings),
+        "ttfb_ms": {"p50": to_ms(percentile(ttfbs, 50)), "p95": to_ms(percentile(ttfbs, 95))},
+        "total_ms": {"p50": to_ms(percentile(totals, 50)), "p95": to_ms(percentile(totals, 95))},
+        "answer_cache": answer_cache.stats(),
+        "conversations": conversations.stats(),
+        "interaction_log": interaction_logger.stats(),
+        "admission": gemini_admission.stats(),
+        "gemini_calls": {
+            "started": gemini_flights.started,
+            "coalesced": gemini_flights.coalesced,
+            "in_flight": gemini_flights.in_flight(),
+            "attempts": gemini.stats(),
+        },
+        "status": "success"
+    })
+
 @app.route("/healthz", methods=["GET"])
 def healthz():
-    return jsonify({"status": "ok"}), 200
+    timings = dict(startup_timings)
+    default_tenant = tenants.get(DEFAULT_TENANT)
+    for client in (supabase, model, default_tenant.manifest):
+        if client.seconds is not None:
+            timings[f"{client.name}_init"] = client.seconds
+    return jsonify({
+        "status": "ok",
+        "corpus_ready": default_tenant.ready.is_set(),
+        "corpus_version": default_tenant.current().version,
+        "tenants": tenants.stats(),
+        "startup_ms": {phase: round(seconds * 1000, 1) for phase, seconds in timings.items()},
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition, merged across all workers."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/debug/profile", methods=["GET"])
+@admin_required
+def profile(current_user):
+    """Sample every thread's stack for ``seconds`` and return folded stacks for a flame graph."""
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "Profiling is disabled", "status": "error"}), 404
+    try:
+        seconds = min(float(request.args.get("seconds", "10")), PROFILER_MAX_SECONDS)
+        interval = max(float(request.args.get("interval", "0.01")), 0.001)
+    except ValueError:
+        return jsonify({"error": "Invalid seconds or interval", "status": "error"}), 400
+    logger.info(f"Profiling for {seconds}s at {interval * 1000:.0f}ms intervals")
+    profiler = SamplingProfiler(interval).start()
+    # time.sleep yields to other greenlets under gevent while the sampler runs
+    time.sleep(seconds)
+    profiler.stop(wait=time.sleep)
+    response = Response(profiler.folded(), mimetype="text/plain")
+    response.headers["X-Profile-Samples"] = str(profiler.sample_count)
+    return response
 
 if __name__ == "__main__":
     logger.info("Starting Flask application")
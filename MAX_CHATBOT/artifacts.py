@@ -0,0 +1,121 @@
+"""Ingestion artifacts: everything chat needs from one file, computed once.
+
+An artifact holds the extracted pages/tables of a source file plus its
+retrieval chunks (with term counts) and structured price rows. The same JSON
+document is stored in the bucket next to the upload, at
+``<folder>/.artifacts/<filename>.<content_hash>.json``, and in the local
+extraction cache, so neither chat workers nor cold starts need to parse the
+original file again.
+"""
+import json
+from collections import Counter
+from dataclasses import dataclass
+
+from corpus import Document
+from price_table import PriceRow, document_rows
+from retrieval import chunk_document, tokenize
+
+ARTIFACT_FOLDER = ".artifacts"
+# Bump when the artifact layout or the extraction/chunking logic changes
+ARTIFACT_VERSION = 5
+
+
+@dataclass(frozen=True)
+class Prepared:
+    """Precomputed index and price-table inputs carried by a document."""
+    chunks: tuple  # tuple of (label, text)
+    terms: tuple  # per chunk, a dict of token -> count
+    price_rows: tuple  # PriceRow with sources relative to the document
+
+
+def build_artifact(kind, pages=(), tables=()):
+    """Chunk, tokenise and extract price rows for one file's content."""
+    document = Document("", "", kind, tuple(pages), tuple(tables))
+    chunks = chunk_document(document)
+    return {
+        "version": ARTIFACT_VERSION,
+        "kind": kind,
+        "pages": [list(page) for page in document.pages],
+        "tables": [[sheet_name, [list(row) for row in rows]] for sheet_name, rows in document.tables],
+        "chunks": [[chunk.label, chunk.text] for chunk in chunks],
+        "terms": [dict(Counter(tokenize(chunk.text))) for chunk in chunks],
+        "price_rows": [[row.name, row.sku, [list(price) for price in row.prices], row.source, row.structured]
+                       for row in document_rows(document)],
+    }
+
+
+def document_from_artifact(path, content_hash, artifact):
+    """Rebuild a corpus ``Document`` (with its prepared parts) from an artifact."""
+    prepared = Prepared(
+        chunks=tuple((label, text) for label, text in artifact["chunks"]),
+        terms=tuple(artifact["terms"]),
+        price_rows=tuple(
+            PriceRow(name, sku, tuple((label, value) for label, value in prices), source, structured)
+            for name, sku, prices, source, structured in artifact["price_rows"]
+        ),
+    )
+    return Document(
+        path,
+        content_hash,
+        artifact["kind"],
+        tuple((page_num, text) for page_num, text in artifact["pages"]),
+        tuple((sheet_name, tuple(tuple(row) for row in rows)) for sheet_name, rows in artifact["tables"]),
+        prepared=prepared,
+    )
+
+
+def is_current(artifact):
+    return isinstance(artifact, dict) and artifact.get("version") == ARTIFACT_VERSION
+
+
+def artifact_path(source_path, content_hash):
+    folder, _, name = source_path.rpartition("/")
+    prefix = f"{folder}/" if folder else ""
+    return f"{prefix}{ARTIFACT_FOLDER}/{name}.{content_hash}.json"
+
+
+def parse_artifact_path(path):
+    """Return ``(source_path, content_hash)`` for an artifact path, or None."""
+    folder, _, name = path.rpartition("/")
+    parent, _, leaf = folder.rpartition("/")
+    if leaf != ARTIFACT_FOLDER or not name.endswith(".json"):
+        return None
+    source_name, _, content_hash = name[:-len(".json")].rpartition(".")
+    if not source_name or not content_hash:
+        return None
+    return (f"{parent}/{source_name}" if parent else source_name), content_hash
+
+
+def _artifacts_for(bucket, source_path):
+    folder, _, name = source_path.rpartition("/")
+    artifact_folder = f"{folder}/{ARTIFACT_FOLDER}" if folder else ARTIFACT_FOLDER
+    try:
+        entries = bucket.list(artifact_folder, {"limit": 1000, "offset": 0})
+    except Exception:
+        return artifact_folder, []
+    # Only ``<name>.<hash>.json``: a sibling such as ``<name>.txt`` has artifacts with the same prefix
+    return artifact_folder, [
+        entry['name'] for entry in entries
+        if (parse_artifact_path(f"{artifact_folder}/{entry['name']}") or (None,))[0] == source_path
+    ]
+
+
+def publish_artifact(bucket, source_path, content_hash, artifact):
+    """Upload an artifact for ``source_path`` and remove ones for older content."""
+    path = artifact_path(source_path, content_hash)
+    bucket.upload(
+        path,
+        json.dumps(artifact, ensure_ascii=False).encode("utf-8"),
+        {"content-type": "application/json", "x-upsert": "true"},
+    )
+    artifact_folder, names = _artifacts_for(bucket, source_path)
+    stale = [f"{artifact_folder}/{name}" for name in names if f"{artifact_folder}/{name}" != path]
+    if stale:
+        bucket.remove(stale)
+    return path
+
+
+def remove_artifacts(bucket, source_path):
+    artifact_folder, names = _artifacts_for(bucket, source_path)
+    if names:
+        bucket.remove([f"{artifact_folder}/{name}" for name in names])
@@ -0,0 +1,26 @@
+"""Benchmarks for the chat API and its hot paths.
+
+Everything runs offline: storage is a local directory (``STORAGE_BACKEND=local``)
+filled with generated price-list PDFs, and Gemini is ``FakeGeminiModel``
+(``GEMINI_BACKEND=fake``) with a configurable time to first token and token
+rate. Run from the ``MAX_CHATBOT`` directory::
+
+    python -m benchmarks                        # everything, default sizes
+    python -m benchmarks --suite micro --pages 10,100,1000
+    python -m benchmarks --suite gunicorn --workers 1,2,4 --concurrency 32
+    python -m benchmarks --json results.json    # also write raw numbers
+    GEMINI_HEDGE=true python -m benchmarks --suite client --slow-rate 0.05 --slow-latency 5
+
+Suites:
+
+- ``client``: ``/api/chat``, ``/api/files/upload``, ``/api/files/upload/bulk``
+  and ``/api/files/list`` through the Flask test client, in a fresh process
+  per corpus size.
+- ``gunicorn``: the same endpoints over HTTP against a real gunicorn
+  (``gunicorn_config.py``) for every worker count and corpus size.
+- ``micro``: ``extract_pdf_text`` (cold, cached, unchanged, one file
+  changed) and prompt building (with and without history).
+
+Every result reports throughput, p50/p95/p99 latency and, for chat, time to
+first byte.
+"""
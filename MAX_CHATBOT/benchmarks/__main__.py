@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.fixtures import write_corpus
+from benchmarks.http_bench import run_gunicorn, run_test_client
+from benchmarks.loadgen import format_table
+from benchmarks.micro_bench import run_micro
+
+SUITES = ("client", "gunicorn", "micro")
+
+HTTP_COLUMNS = [
+    ("server", lambda r: r["server"]),
+    ("workers", lambda r: r["workers"]),
+    ("pages", lambda r: r["pages"]),
+    ("endpoint", lambda r: r["endpoint"]),
+    ("startup_s", lambda r: r.get("startup_s")),
+    ("ok", lambda r: r["ok"]),
+    ("errors", lambda r: r["errors"]),
+    ("req/s", lambda r: r["throughput_rps"]),
+    ("p50_ms", lambda r: r["latency_ms"]["p50"]),
+    ("p95_ms", lambda r: r["latency_ms"]["p95"]),
+    ("p99_ms", lambda r: r["latency_ms"]["p99"]),
+    ("ttfb_p50", lambda r: r["ttfb_ms"]["p50"]),
+    ("ttfb_p95", lambda r: r["ttfb_ms"]["p95"]),
+    ("ttfb_p99", lambda r: r["ttfb_ms"]["p99"]),
+]
+
+MICRO_COLUMNS = [
+    ("pages", lambda r: r["pages"]),
+    ("benchmark", lambda r: r["benchmark"]),
+    ("iterations", lambda r: r["iterations"]),
+    ("ops/s", lambda r: r["ops_per_second"]),
+    ("p50_ms", lambda r: r["latency_ms"]["p50"]),
+    ("p95_ms", lambda r: r["latency_ms"]["p95"]),
+    ("p99_ms", lambda r: r["latency_ms"]["p99"]),
+]
+
+
+def int_list(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline benchmarks for the chat API")
+    parser.add_argument("--suite", default="all", help=f"comma-separated subset of {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--pages", type=int_list, default=[10, 100, 1000], help="corpus sizes in pages (default: 10,100,1000)")
+    parser.add_argument("--workers", type=int_list, default=[1, 2, 4], help="gunicorn worker counts (default: 1,2,4)")
+    parser.add_argument("--worker-class", default="gevent", help="gunicorn worker class (default: gevent)")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint for chat and list")
+    parser.add_argument("--upload-requests", type=int, default=10, help="uploads per run (each one triggers a refresh)")
+    parser.add_argument("--bulk-requests", type=int, default=2, help="bulk uploads per run")
+    parser.add_argument("--bulk-files", type=int, default=10, help="files per bulk upload (half of them zipped)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake Gemini time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="fake Gemini streaming rate")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="fake Gemini answer length")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of fake Gemini calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="time to first token of slow calls in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of fake Gemini calls that fail")
+    parser.add_argument("--micro-iterations", type=int, default=200)
+    parser.add_argument("--cold-iterations", type=int, default=3, help="cold extract_pdf_text runs per corpus size")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="seconds to wait for a corpus to load")
+    parser.add_argument("--json", help="also write every result to this file")
+    args = parser.parse_args()
+
+    suites = SUITES if args.suite == "all" else [suite.strip() for suite in args.suite.split(",")]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    root = tempfile.mkdtemp(prefix="bench-corpora-")
+    http_results, micro_results = [], []
+    try:
+        for pages in args.pages:
+            corpus_dir = os.path.join(root, f"pages-{pages}")
+            write_corpus(corpus_dir, pages)
+            print(f"Corpus of {pages} pages", file=sys.stderr)
+            if "micro" in suites:
+                micro_results.extend(run_micro(args, corpus_dir, pages))
+            if "client" in suites:
+                http_results.extend(run_test_client(args, corpus_dir, pages))
+            if "gunicorn" in suites:
+                for workers in args.workers:
+                    http_results.extend(run_gunicorn(args, corpus_dir, pages, workers))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(
+        f"\nFake Gemini: {args.latency * 1000:.0f} ms to first token, {args.tokens_per_second:g} tokens/s, "
+        f"{args.answer_tokens} tokens per answer; concurrency {args.concurrency}"
+    )
+    if args.slow_rate or args.failure_rate:
+        print(f"Injected: {args.slow_rate:.0%} slow calls ({args.slow_latency:g} s), {args.failure_rate:.0%} failures")
+    if http_results:
+        print("\nEndpoints\n" + format_table(http_results, HTTP_COLUMNS))
+    if micro_results:
+        print("\nMicro-benchmarks\n" + format_table(micro_results, MICRO_COLUMNS))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "endpoints": http_results, "micro": micro_results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Generated corpora, questions and environments for the benchmarks."""
+import os
+import random
+import time
+
+import jwt
+
+# Admin whose <user_id>/ folder holds the generated corpus
+BENCH_USER = "bench"
+BENCH_JWT_SECRET = "benchmark-secret-benchmark-secret"
+
+PRODUCTS = ["pump", "valve", "motor", "gear box", "bearing", "coupling", "filter", "pipe", "flange", "nozzle"]
+LINES_PER_PAGE = 30
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """A minimal PDF with one page per list of text lines."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + i * 2} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font = 3 + len(pages) * 2
+    for i, lines in enumerate(pages):
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 760 Td {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + i * 2} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+
+def price_page(page_number, seed=0):
+    """One page of a price list: product lines with SKU and prices."""
+    rng = random.Random(page_number * 7919 + seed)
+    lines = [f"Price list page {page_number}"]
+    for line in range(LINES_PER_PAGE - 1):
+        product = PRODUCTS[(page_number + line) % len(PRODUCTS)]
+        sku = f"MX-{page_number:04d}-{line:02d}"
+        price = rng.randint(50, 50000)
+        lines.append(f"{product.title()} model {page_number}.{line} {sku} MRP Rs {price} Dealer Rs {int(price * 0.8)}")
+    return lines
+
+
+def write_corpus(directory, pages, pages_per_file=10):
+    """Fill ``directory/<BENCH_USER>/`` with ``pages`` pages of price-list PDFs; returns the file paths."""
+    folder = os.path.join(directory, BENCH_USER)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for first in range(0, pages, pages_per_file):
+        numbers = range(first, min(pages, first + pages_per_file))
+        path = os.path.join(folder, f"price-list-{first // pages_per_file:04d}.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf([price_page(number) for number in numbers]))
+        paths.append(path)
+    return paths
+
+
+def question(i):
+    """Distinct, non-price questions so neither the answer cache nor the price table short-circuits Gemini."""
+    product = PRODUCTS[i % len(PRODUCTS)]
+    return f"What should I know about the {product} model {i % 97}.{i % 29} before ordering? (#{i})"
+
+
+def admin_token(user_id=BENCH_USER, secret=BENCH_JWT_SECRET):
+    return jwt.encode({"user_id": user_id, "role": "admin", "exp": int(time.time()) + 24 * 3600}, secret, algorithm="HS256")
+
+
+def bench_env(storage_dir, cache_dir, latency, tokens_per_second, answer_tokens, slow_rate=0.0, slow_latency=10.0,
+              failure_rate=0.0):
+    """Environment for an app process running against the generated corpus and fake Gemini.
+
+    ``slow_rate`` of Gemini calls take ``slow_latency`` to the first token and
+    ``failure_rate`` of them fail, to measure deadlines, retries and hedging
+    (``GEMINI_HEDGE`` and the other settings are passed through from the
+    environment).
+    """
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": "local",
+        "PDF_DIRECTORY": storage_dir,
+        "CACHE_DIR": cache_dir,
+        "GEMINI_BACKEND": "fake",
+        "FAKE_GEMINI_LATENCY": str(latency),
+        "FAKE_GEMINI_TOKENS_PER_SECOND": str(tokens_per_second),
+        "FAKE_GEMINI_ANSWER_TOKENS": str(answer_tokens),
+        "FAKE_GEMINI_SLOW_RATE": str(slow_rate),
+        "FAKE_GEMINI_SLOW_LATENCY": str(slow_latency),
+        "FAKE_GEMINI_FAILURE_RATE": str(failure_rate),
+        "JWT_SECRET": BENCH_JWT_SECRET,
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
@@ -0,0 +1,285 @@
+"""Endpoint benchmarks through the Flask test client and a real gunicorn.
+
+The test-client run happens in a child process (``python -m
+benchmarks.http_bench``) because the app reads its configuration at import;
+the child prints its results as JSON on stdout.
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+from benchmarks.fixtures import admin_token, bench_env, make_pdf, price_page, question
+from benchmarks.loadgen import run_load
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOAD_PAGES = 5
+
+
+def upload_pdf(i):
+    return make_pdf([price_page(10000 + i * UPLOAD_PAGES + page, seed=i) for page in range(UPLOAD_PAGES)])
+
+
+def multipart(filename, data, content_type="application/pdf", field="file"):
+    return multipart_files([(field, filename, data, content_type)])
+
+
+def multipart_files(parts):
+    """A multipart body with one file part per ``(field, filename, data, content_type)``."""
+    boundary = uuid.uuid4().hex
+    body = []
+    for field, filename, data, content_type in parts:
+        body.append((
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode())
+        body.append(data + b"\r\n")
+    body.append(f"--{boundary}--\r\n".encode())
+    return b"".join(body), f"multipart/form-data; boundary={boundary}"
+
+
+def upload_zip(names):
+    """A zip archive holding one generated price list per name."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i, name in enumerate(names):
+            archive.writestr(name, upload_pdf(i))
+    return buffer.getvalue()
+
+
+class ClientTarget:
+    """Requests through ``app.test_client()``; chat bodies are streamed to measure TTFB."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client(use_cookies=False)
+        return client
+
+    def request(self, method, path, json_body=None, body=None, headers=None):
+        started = time.perf_counter()
+        kwargs = {"headers": headers or {}, "buffered": False}
+        if json_body is not None:
+            kwargs["json"] = json_body
+        if body is not None:
+            kwargs["data"] = body
+        response = self._client().open(path, method=method, **kwargs)
+        ttfb = None
+        try:
+            for part in response.response:
+                if part and ttfb is None:
+                    ttfb = time.perf_counter() - started
+        finally:
+            # Closes the streamed body, whose finally records the chat outcome and timings
+            response.close()
+        total = time.perf_counter() - started
+        return response.status_code, ttfb or total, total
+
+
+class HttpTarget:
+    """Requests over a fresh HTTP connection each; TTFB is the first body byte."""
+
+    def __init__(self, host, port, timeout=120):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method, path, json_body=None, body=None, headers=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            first = response.read(1)
+            ttfb = time.perf_counter() - started
+            response.read()
+            total = time.perf_counter() - started
+            return response.status, ttfb if first else total, total
+        finally:
+            conn.close()
+
+
+def run_scenarios(target, args, label):
+    """Benchmark list, chat, upload and bulk upload against ``target``; uploads go last as they grow the corpus."""
+    auth = {"Authorization": f"Bearer {admin_token()}"}
+    run_id = uuid.uuid4().hex[:8]
+
+    def chat(i):
+        return target.request("POST", "/api/chat", json_body={
+            "message": question(i),
+            "conversationId": f"bench-{run_id}-{i}",
+        })
+
+    def list_files(i):
+        return target.request("GET", "/api/files/list", headers=auth)
+
+    def upload(i):
+        body, content_type = multipart(f"upload-{run_id}-{i:05d}.pdf", upload_pdf(i))
+        return target.request("POST", "/api/files/upload", body=body, headers=dict(auth, **{"Content-Type": content_type}))
+
+    def bulk_upload(i):
+        # Half the files as parts, half in a zip; one refresh per request
+        names = [f"bulk-{run_id}-{i:05d}-{n:03d}.pdf" for n in range(args.bulk_files)]
+        half = len(names) // 2
+        parts = [("files", name, upload_pdf(n), "application/pdf") for n, name in enumerate(names[:half])]
+        parts.append(("files", f"bulk-{run_id}-{i:05d}.zip", upload_zip(names[half:]), "application/zip"))
+        body, content_type = multipart_files(parts)
+        return target.request("POST", "/api/files/upload/bulk", body=body, headers=dict(auth, **{"Content-Type": content_type}))
+
+    # Warm up lazy clients and connection paths outside the measurement
+    run_load(lambda i: chat(1000000 + i), args.concurrency, args.concurrency)
+
+    results = []
+    for endpoint, send, requests in (
+        ("list", list_files, args.requests),
+        ("chat", chat, args.requests),
+        ("upload", upload, args.upload_requests),
+        ("bulk_upload", bulk_upload, args.bulk_requests),
+    ):
+        if requests <= 0:
+            continue
+        summary = run_load(send, requests, args.concurrency)
+        results.append(dict(label, endpoint=endpoint, **summary))
+        print(
+            f"  {label['server']} x{label['workers']} {label['pages']} pages {endpoint}: "
+            f"{summary['throughput_rps']} req/s, p95 {summary['latency_ms']['p95']} ms",
+            file=sys.stderr,
+        )
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(target, timeout, confirmations=1):
+    """Poll /healthz until the default corpus is loaded on ``confirmations`` consecutive answers."""
+    deadline = time.monotonic() + timeout
+    seen = 0
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(target.host, target.port, timeout=5)
+            conn.request("GET", "/healthz")
+            response = conn.getresponse()
+            health = json.loads(response.read() or b"{}")
+            conn.close()
+            ready = response.status == 200 and health.get("corpus_ready")
+        except (OSError, ValueError, http.client.HTTPException):
+            ready = False
+        seen = seen + 1 if ready else 0
+        if seen >= confirmations:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def fresh_copy(corpus_dir, prefix):
+    """A scratch directory holding a copy of the corpus, so uploads don't leak into later runs."""
+    work_dir = tempfile.mkdtemp(prefix=prefix)
+    storage_dir = os.path.join(work_dir, "storage")
+    shutil.copytree(corpus_dir, storage_dir)
+    return work_dir, storage_dir, os.path.join(work_dir, "cache")
+
+
+def run_gunicorn(args, corpus_dir, pages, workers):
+    """Start gunicorn on a copy of the corpus with a cold cache, benchmark it and stop it."""
+    work_dir, storage_dir, cache_dir = fresh_copy(corpus_dir, f"bench-{pages}-{workers}-")
+    env = bench_env(storage_dir, cache_dir, args.latency, args.tokens_per_second, args.answer_tokens,
+                    args.slow_rate, args.slow_latency, args.failure_rate)
+    env["GUNICORN_WORKERS"] = str(workers)
+    env["GUNICORN_WORKER_CLASS"] = args.worker_class
+    port = free_port()
+    log_path = os.path.join(work_dir, "gunicorn.log")
+    label = {"server": f"gunicorn/{args.worker_class}", "workers": workers, "pages": pages}
+    started = time.perf_counter()
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "-b", f"127.0.0.1:{port}", "app:app"],
+            cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        target = HttpTarget("127.0.0.1", port)
+        if not wait_ready(target, args.ready_timeout, confirmations=2 * workers):
+            raise RuntimeError(f"gunicorn did not become ready; see {log_path}")
+        label["startup_s"] = round(time.perf_counter() - started, 2)
+        results = run_scenarios(target, args, label)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    # Kept on failure for the gunicorn log
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def run_test_client(args, corpus_dir, pages):
+    """Run the test-client benchmark for one corpus size in a child process."""
+    work_dir, storage_dir, cache_dir = fresh_copy(corpus_dir, f"bench-{pages}-client-")
+    env = bench_env(storage_dir, cache_dir, args.latency, args.tokens_per_second, args.answer_tokens,
+                    args.slow_rate, args.slow_latency, args.failure_rate)
+    command = [
+        sys.executable, "-m", "benchmarks.http_bench",
+        "--pages", str(pages),
+        "--requests", str(args.requests),
+        "--upload-requests", str(args.upload_requests),
+        "--bulk-requests", str(args.bulk_requests),
+        "--bulk-files", str(args.bulk_files),
+        "--concurrency", str(args.concurrency),
+        "--ready-timeout", str(args.ready_timeout),
+    ]
+    completed = subprocess.run(command, cwd=APP_DIR, env=env, stdout=subprocess.PIPE, check=True)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test-client benchmark for one corpus (child process)")
+    parser.add_argument("--pages", type=int, required=True)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--upload-requests", type=int, default=10)
+    parser.add_argument("--bulk-requests", type=int, default=2)
+    parser.add_argument("--bulk-files", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    started = time.perf_counter()
+    import app as app_module
+    tenant = app_module.tenants.get(app_module.DEFAULT_TENANT)
+    if not tenant.ready.wait(args.ready_timeout):
+        raise SystemExit("corpus did not load in time")
+    label = {"server": "test-client", "workers": 1, "pages": args.pages,
+             "startup_s": round(time.perf_counter() - started, 2)}
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_scenarios(ClientTarget(app_module.app), args, label)
+    # Pool workers would otherwise hold the parent's stdout pipe open
+    app_module.ingestion.shutdown()
+    json.dump(results, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Closed-loop load generation and latency summaries."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, as ``/api/chat/stats`` reports it."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_load(send, requests, concurrency):
+    """Call ``send(i)`` for ``i`` in ``range(requests)`` from ``concurrency`` threads.
+
+    ``send`` returns ``(status, ttfb_seconds, total_seconds)``; exceptions
+    count as errors. Returns the summary dict from ``summarize``.
+    """
+    samples, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            try:
+                status, ttfb, total = send(i)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            with lock:
+                samples.append((status, ttfb, total))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(samples, errors, time.perf_counter() - started, concurrency)
+
+
+def summarize(samples, errors, elapsed, concurrency):
+    ok = [(ttfb, total) for status, ttfb, total in samples if status < 400]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    ttfbs = [ttfb for ttfb, _ in ok]
+    totals = [total for _, total in ok]
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests": len(samples) + len(errors),
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": len(samples) - len(ok) + len(errors),
+        "statuses": statuses,
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {f"p{pct}": ms(percentile(totals, pct)) for pct in (50, 95, 99)},
+        "ttfb_ms": {f"p{pct}": ms(percentile(ttfbs, pct)) for pct in (50, 95, 99)},
+    }
+
+
+def time_calls(function, iterations):
+    """Run ``function()`` ``iterations`` times; per-call latency summary."""
+    durations = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "ops_per_second": round(iterations / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {f"p{pct}": round(percentile(durations, pct) * 1000, 3) for pct in (50, 95, 99)},
+    }
+
+
+def format_table(rows, columns):
+    """Plain-text table of ``rows`` (dicts) with ``columns`` as (heading, getter) pairs."""
+    cells = [[heading for heading, _ in columns]]
+    for row in rows:
+        cells.append(["" if getter(row) is None else str(getter(row)) for _, getter in columns])
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells)
@@ -0,0 +1,149 @@
+"""Micro-benchmarks for ``extract_pdf_text`` and prompt building.
+
+Runs in a child process (``python -m benchmarks.micro_bench``) with the app
+configured against one generated corpus; prints results as JSON on stdout.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fixtures import BENCH_USER, bench_env, make_pdf, price_page, question
+from benchmarks.http_bench import APP_DIR, fresh_copy
+from benchmarks.loadgen import time_calls
+
+HISTORY = [
+    {"role": "user", "content": "Do you have pumps for agriculture?"},
+    {"role": "assistant", "content": "Yes, we stock several agricultural pump models in different capacities."},
+] * 5
+
+
+def bench_extraction(app_module, iterations, cold_iterations):
+    """extract_pdf_text from a cold cache, a warm cache, with nothing changed and with one file changed."""
+    from change_detection import Manifest
+    from extraction_cache import ExtractionCache
+    from mapped_corpus import RefreshLease
+    from tenants import TenantCorpus, shared_paths
+
+    scratch = tempfile.mkdtemp(prefix="bench-extract-")
+    counter = itertools.count()
+    original_cache = app_module.ingestion.cache
+
+    def fresh_tenant(cache):
+        # A whole-bucket tenant with its own manifest and snapshot files
+        directory = os.path.join(scratch, f"run-{next(counter)}")
+        snapshot_path = os.path.join(directory, "corpus-snapshot.pickle")
+        mapped_path, lock_path = shared_paths(snapshot_path)
+        manifest = Manifest(os.path.join(directory, "manifest.json"), cache)
+        return TenantCorpus("", manifest, snapshot_path, mapped_path, RefreshLease(lock_path))
+
+    def use_cache(cache):
+        app_module.ingestion.cache = cache
+        return cache
+
+    def cold():
+        cache = use_cache(ExtractionCache(os.path.join(scratch, f"cache-{next(counter)}")))
+        app_module.extract_pdf_text(fresh_tenant(cache))
+
+    warm_cache = use_cache(ExtractionCache(os.path.join(scratch, "warm-cache")))
+    app_module.extract_pdf_text(fresh_tenant(warm_cache))
+
+    def cached():
+        app_module.extract_pdf_text(fresh_tenant(warm_cache))
+
+    steady = fresh_tenant(warm_cache)
+    app_module.extract_pdf_text(steady)
+
+    def unchanged():
+        app_module.extract_pdf_text(steady)
+
+    changed_path = os.path.join(app_module.PDF_DIRECTORY, BENCH_USER, "price-list-0000.pdf")
+    edits = itertools.count(1)
+
+    def one_changed():
+        with open(changed_path, "wb") as f:
+            f.write(make_pdf([price_page(0, seed=next(edits))]))
+        app_module.extract_pdf_text(steady)
+
+    try:
+        results = {"extract_pdf_text/cold": time_calls(cold, cold_iterations)}
+        use_cache(warm_cache)
+        results["extract_pdf_text/cached"] = time_calls(cached, iterations)
+        results["extract_pdf_text/unchanged"] = time_calls(unchanged, iterations)
+        results["extract_pdf_text/one_changed"] = time_calls(one_changed, iterations)
+    finally:
+        app_module.ingestion.cache = original_cache
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def bench_prompts(app_module, snapshot, iterations):
+    from retrieval import select_context
+
+    builder = app_module.prompt_builder
+    numbers = itertools.count()
+    results = {
+        "select_context": time_calls(
+            lambda: select_context(snapshot, question(next(numbers)), builder.context_budget, builder.top_k), iterations),
+        "prompt_build": time_calls(
+            lambda: builder.build(snapshot, question(next(numbers)), "en"), iterations),
+        "prompt_build/history": time_calls(
+            lambda: builder.build(snapshot, question(next(numbers)), "en", HISTORY, "pump prices; valve sizes"), iterations),
+    }
+    return results
+
+
+def run_micro(args, corpus_dir, pages):
+    """Run the micro-benchmarks for one corpus size in a child process."""
+    work_dir, storage_dir, cache_dir = fresh_copy(corpus_dir, f"bench-{pages}-micro-")
+    env = bench_env(storage_dir, cache_dir, args.latency, args.tokens_per_second, args.answer_tokens)
+    command = [
+        sys.executable, "-m", "benchmarks.micro_bench",
+        "--pages", str(pages),
+        "--iterations", str(args.micro_iterations),
+        "--cold-iterations", str(args.cold_iterations),
+        "--ready-timeout", str(args.ready_timeout),
+    ]
+    completed = subprocess.run(command, cwd=APP_DIR, env=env, stdout=subprocess.PIPE, check=True)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for one corpus (child process)")
+    parser.add_argument("--pages", type=int, required=True)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--cold-iterations", type=int, default=3)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    import app as app_module
+    tenant = app_module.tenants.get(app_module.DEFAULT_TENANT)
+    if not tenant.ready.wait(args.ready_timeout):
+        raise SystemExit("corpus did not load in time")
+    # Let the startup refresh settle so it doesn't run alongside the measurements
+    with tenant.refresh_lock:
+        snapshot = tenant.current()
+    app_module.stop_polling.set()
+    app_module.refresh_requested.set()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    timings = bench_prompts(app_module, snapshot, args.iterations)
+    timings.update(bench_extraction(app_module, max(1, args.iterations // 20), args.cold_iterations))
+    for name, summary in timings.items():
+        results.append(dict(summary, benchmark=name, pages=args.pages, text_tokens=snapshot.text_tokens))
+        print(f"  micro {args.pages} pages {name}: p50 {summary['latency_ms']['p50']} ms", file=sys.stderr)
+    # Pool workers would otherwise hold the parent's stdout pipe open
+    app_module.ingestion.shutdown()
+    json.dump(results, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
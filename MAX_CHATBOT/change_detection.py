@@ -0,0 +1,153 @@
+"""Metadata-only change detection for the storage bucket.
+
+Listing the bucket is cheap; downloading it is not. Objects are compared by
+the metadata ``list()`` already returns, and only objects whose fingerprint
+changed need to be downloaded. The manifest is persisted so a restart
+resumes from the last known state instead of re-downloading everything.
+"""
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+
+from artifacts import document_from_artifact, is_current
+
+logger = logging.getLogger(__name__)
+
+LIST_PAGE_SIZE = 100
+
+
+@dataclass(frozen=True)
+class StorageObject:
+    """A file in the bucket as seen by ``list()``."""
+    path: str
+    fingerprint: str
+    size: int = 0
+    modified: str = ""  # ISO timestamp from the listing, comparable as a string
+
+
+def fingerprint(entry):
+    """Fingerprint an object from its listing metadata (size, mtime, eTag, id)."""
+    metadata = entry.get('metadata') or {}
+    return "|".join(str(part) for part in (
+        metadata.get('size', ''),
+        metadata.get('lastModified') or entry.get('updated_at', ''),
+        metadata.get('eTag', ''),
+        entry.get('id', ''),
+    ))
+
+
+def list_bucket_objects(bucket, prefix=""):
+    """Yield every object under ``prefix``, descending into folders.
+
+    Folders (such as the per-admin ``<user_id>/`` folders) come back from
+    ``list()`` as entries without an id; results are paginated.
+    """
+    offset = 0
+    while True:
+        entries = bucket.list(prefix or None, {
+            "limit": LIST_PAGE_SIZE,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+        for entry in entries:
+            path = f"{prefix}/{entry['name']}" if prefix else entry['name']
+            if entry.get('id') is None:
+                yield from list_bucket_objects(bucket, path)
+            else:
+                metadata = entry.get('metadata') or {}
+                modified = metadata.get('lastModified') or entry.get('updated_at') or ""
+                yield StorageObject(path, fingerprint(entry), metadata.get('size', 0), modified)
+        if len(entries) < LIST_PAGE_SIZE:
+            break
+        offset += LIST_PAGE_SIZE
+
+
+def list_bucket_folders(bucket):
+    """Yield the names of the top-level folders (one per admin) in the bucket."""
+    offset = 0
+    while True:
+        entries = bucket.list(None, {
+            "limit": LIST_PAGE_SIZE,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+        for entry in entries:
+            if entry.get('id') is None:
+                yield entry['name']
+        if len(entries) < LIST_PAGE_SIZE:
+            break
+        offset += LIST_PAGE_SIZE
+
+
+class Manifest:
+    """Persistent map of object path -> (listing fingerprint, extracted document).
+
+    Only fingerprints and content hashes are written to disk; page text is
+    rehydrated from the extraction cache, and entries whose artifact has been
+    evicted are dropped so the object is ingested again.
+    """
+
+    def __init__(self, path, cache):
+        self.path = path
+        self.cache = cache
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {str(e)}")
+            return
+        for path, entry in raw.items():
+            artifact = self.cache.get(entry['content_hash'])
+            if not is_current(artifact):
+                continue
+            self.entries[path] = (entry['fingerprint'], document_from_artifact(path, entry['content_hash'], artifact))
+        logger.info(f"Loaded manifest with {len(self.entries)}/{len(raw)} cached entries from {self.path}")
+
+    def save(self):
+        raw = {
+            path: {"fingerprint": fp, "content_hash": doc.content_hash}
+            for path, (fp, doc) in self.entries.items()
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial manifest
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(raw, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def lookup(self, obj):
+        """Return the stored document if ``obj``'s metadata is unchanged."""
+        entry = self.entries.get(obj.path)
+        if entry is not None and entry[0] == obj.fingerprint:
+            return entry[1]
+        return None
+
+    def previous(self, path):
+        """Return the last known document for ``path`` regardless of metadata."""
+        entry = self.entries.get(path)
+        return entry[1] if entry is not None else None
+
+    def replace(self, entries):
+        """Swap in new entries, persisting only when something changed."""
+        if entries == self.entries:
+            return False
+        self.entries = entries
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"Failed to persist manifest {self.path}: {str(e)}")
+        return True
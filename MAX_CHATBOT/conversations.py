@@ -0,0 +1,163 @@
+"""Server-side conversation history.
+
+History used to live in the Flask session cookie, which grew with every
+question and never held the model's answers. Conversations are now stored
+here, keyed by a conversation id, either in process memory or in SQLite
+(WAL mode) so every gunicorn worker sees the same history.
+
+Each conversation keeps at most ``max_turns`` turns; older turns are
+compacted into a one-line summary of the questions asked, so the history a
+prompt carries stays bounded however long the chat runs. Conversations
+expire after ``ttl`` seconds without activity and the least recently used
+ones are evicted beyond ``max_conversations``.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from prompt import digest
+from sqlite_store import SharedDatabase
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Conversation:
+    summary: str = ""  # "; "-separated questions from compacted turns
+    turns: list = field(default_factory=list)  # [{"role": ..., "content": ...}]
+
+
+class ConversationStore:
+    """Bounded conversation histories; ``path=None`` keeps them in memory."""
+
+    def __init__(self, path=None, max_turns=10, max_conversations=10000, ttl=24 * 3600,
+                 turn_max_chars=2000, summary_max_chars=600):
+        self.path = path
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.turn_max_chars = turn_max_chars
+        self.summary_max_chars = summary_max_chars
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # id -> (last_access, Conversation)
+        self._db = None
+        if path:
+            self._db = SharedDatabase(path)
+            self._db.run(self._create)
+
+    @staticmethod
+    def _create(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " turns TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS conversations_last_access ON conversations (last_access)"
+        )
+
+    def compact(self, conversation):
+        """Fold the oldest turns into the summary until ``max_turns`` remain."""
+        asked = conversation.summary.split("; ") if conversation.summary else []
+        while len(conversation.turns) > self.max_turns:
+            turn = conversation.turns.pop(0)
+            if turn["role"] == "user":
+                asked.append(digest(turn["content"]))
+        while len(asked) > 1 and len("; ".join(asked)) > self.summary_max_chars:
+            asked.pop(0)
+        conversation.summary = "; ".join(asked)[-self.summary_max_chars:]
+        return conversation
+
+    def get(self, conversation_id):
+        """Return the conversation (a copy), or an empty one if unknown or expired."""
+        now = time.time()
+        if not self.path:
+            with self._lock:
+                entry = self._memory.get(conversation_id)
+                if entry is None or entry[0] <= now - self.ttl:
+                    return Conversation()
+                self._memory[conversation_id] = (now, entry[1])
+                self._memory.move_to_end(conversation_id)
+                return Conversation(entry[1].summary, list(entry[1].turns))
+        try:
+            return self._db.run(self._get, conversation_id, now)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Conversation lookup failed: {str(e)}")
+            return Conversation()
+
+    def _get(self, conn, conversation_id, now):
+        row = conn.execute(
+            "SELECT summary, turns FROM conversations WHERE id = ? AND last_access > ?",
+            (conversation_id, now - self.ttl),
+        ).fetchone()
+        if row is None:
+            return Conversation()
+        conn.execute("UPDATE conversations SET last_access = ? WHERE id = ?", (now, conversation_id))
+        return Conversation(row[0], json.loads(row[1]))
+
+    def append(self, conversation_id, role, content):
+        """Add a turn, compacting the conversation if it is over its cap."""
+        turn = {"role": role, "content": content[:self.turn_max_chars]}
+        now = time.time()
+        if not self.path:
+            with self._lock:
+                entry = self._memory.pop(conversation_id, None)
+                conversation = entry[1] if entry is not None and entry[0] > now - self.ttl else Conversation()
+                conversation.turns.append(turn)
+                self._memory[conversation_id] = (now, self.compact(conversation))
+                # Oldest entries sit at the front; drop expired and over-limit ones
+                while self._memory:
+                    oldest_id, (last_access, _) = next(iter(self._memory.items()))
+                    if last_access > now - self.ttl and len(self._memory) <= self.max_conversations:
+                        break
+                    del self._memory[oldest_id]
+            return
+        try:
+            self._db.run(self._append, conversation_id, turn, now)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Conversation store failed: {str(e)}")
+
+    def _append(self, conn, conversation_id, turn, now):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT summary, turns FROM conversations WHERE id = ? AND last_access > ?",
+                (conversation_id, now - self.ttl),
+            ).fetchone()
+            conversation = Conversation(row[0], json.loads(row[1])) if row is not None else Conversation()
+            conversation.turns.append(turn)
+            self.compact(conversation)
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, summary, turns, last_access) VALUES (?, ?, ?, ?)",
+                (conversation_id, conversation.summary, json.dumps(conversation.turns, ensure_ascii=False), now),
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM conversations WHERE last_access <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM conversations WHERE id IN ("
+            " SELECT id FROM conversations ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversations,),
+        )
+
+    def stats(self):
+        if not self.path:
+            with self._lock:
+                return {"backend": "memory", "conversations": len(self._memory)}
+        try:
+            count = self._db.run(lambda conn: conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Conversation stats failed: {str(e)}")
+            return {}
+        return {"backend": "sqlite", "conversations": count}
@@ -0,0 +1,188 @@
+"""Immutable, versioned snapshots of the product corpus.
+
+The chat endpoint only ever reads ``CorpusStore.current()``; the background
+refresher builds a new snapshot off the request path and swaps it in.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+
+from offload import run_cpu_bound
+from price_table import PriceTable
+from retrieval import RetrievalIndex, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot classes change shape so old warm snapshots are ignored
+SNAPSHOT_FORMAT = 2
+
+
+@dataclass(frozen=True)
+class Document:
+    """Extracted text of a single file in the bucket."""
+    path: str
+    content_hash: str
+    kind: str  # "pdf", "text" or "sheet"
+    pages: tuple = ()  # tuple of (page_number, text)
+    tables: tuple = ()  # tuple of (sheet_name, rows) for spreadsheets
+    # artifacts.Prepared when chunks and price rows were computed at upload time
+    prepared: object = field(default=None, compare=False, repr=False)
+
+    def render(self):
+        """Render the document in the format the prompt has always used."""
+        if self.kind == "sheet":
+            # Spreadsheet text comes from the companion .txt file
+            return ""
+        if self.kind == "pdf":
+            return "".join(
+                f"\n--- Page {page_num} from {self.path} ---\n{text}\n"
+                for page_num, text in self.pages
+            )
+        return "".join(
+            f"\n--- Content from {self.path} ---\n{text}\n"
+            for _, text in self.pages
+        )
+
+
+@dataclass(frozen=True)
+class CorpusSnapshot:
+    """A full, read-only view of every document at one point in time."""
+    version: str
+    documents: tuple = ()
+    text: str = ""
+    index: object = None  # retrieval.RetrievalIndex
+    price_table: object = None  # price_table.PriceTable
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def files(self):
+        return {doc.path: doc.content_hash for doc in self.documents}
+
+    @property
+    def has_text(self):
+        return bool(self.text.strip())
+
+    @property
+    def text_tokens(self):
+        return estimate_tokens(self.text)
+
+
+def corpus_version(documents):
+    """Stable version id derived from the (path, content hash) pairs."""
+    if not documents:
+        return "empty"
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(f"{doc.path}\0{doc.content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def build_snapshot(documents, previous_index=None):
+    """Build a snapshot from documents, ordered by path for determinism.
+
+    The retrieval index is derived from ``previous_index`` so only files whose
+    content changed are re-indexed.
+    """
+    documents = tuple(sorted(documents, key=lambda doc: doc.path))
+    text = "".join(doc.render() for doc in documents)
+    index = (previous_index or RetrievalIndex()).updated(documents)
+    return CorpusSnapshot(
+        version=corpus_version(documents),
+        documents=documents,
+        text=text,
+        index=index,
+        price_table=PriceTable.from_documents(documents),
+    )
+
+
+def _private_directory(directory):
+    """Create ``directory`` (or take over an existing one of ours) with mode 0700."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.chmod(directory, 0o700)
+
+
+def _trusted(stat):
+    """Whether a file or directory belongs to this user and nobody else can write it."""
+    if not hasattr(os, "getuid"):
+        return True
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def save_snapshot(snapshot, path):
+    """Persist a snapshot so the next process can serve it before touching storage."""
+    directory = os.path.dirname(os.path.abspath(path))
+    _private_directory(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((SNAPSHOT_FORMAT, snapshot), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(path):
+    """Load a snapshot written by ``save_snapshot``; None if missing, stale or untrusted.
+
+    Unpickling runs code from the file, so it is only read when both the
+    file and its directory belong to this user and nobody else can write
+    them; the cache directory may sit in a shared place such as /tmp.
+    """
+    try:
+        with open(path, "rb") as f:
+            if not (_trusted(os.fstat(f.fileno())) and _trusted(os.stat(os.path.dirname(os.path.abspath(path))))):
+                logger.warning(f"Ignoring warm snapshot {path}: not owned by this user or writable by others")
+                return None
+            snapshot_format, snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable warm snapshot {path}: {str(e)}")
+        return None
+    if snapshot_format != SNAPSHOT_FORMAT or not isinstance(snapshot, CorpusSnapshot):
+        return None
+    return snapshot
+
+
+class CorpusStore:
+    """Holds the current snapshot and swaps it atomically."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = build_snapshot(())
+
+    def current(self):
+        # A single attribute read is atomic, so readers never need the lock.
+        return self._snapshot
+
+    def publish(self, documents):
+        """Install a snapshot of ``documents``; returns (snapshot, changed)."""
+        documents = tuple(documents)
+        with self._lock:
+            current = self._snapshot
+            if corpus_version(sorted(documents, key=lambda doc: doc.path)) == current.version:
+                return current, False
+            # Chunking and indexing a cold corpus takes seconds; keep it off the gevent hub
+            snapshot = run_cpu_bound(build_snapshot, documents, current.index)
+            self._snapshot = snapshot
+        return snapshot, True
+
+    def restore(self, snapshot):
+        """Install a saved snapshot, unless something has been published already."""
+        with self._lock:
+            if self._snapshot.documents:
+                return False
+            self._snapshot = snapshot
+        return True
+
+    def swap(self, snapshot):
+        """Install a snapshot built elsewhere (e.g. mapped from another process's file)."""
+        with self._lock:
+            self._snapshot = snapshot
@@ -0,0 +1,233 @@
+"""Deadline-aware streaming calls to the Gemini model.
+
+``DeadlineModel.stream(prompt, deadline)`` wraps ``model.generate_content(
+prompt, stream=True)`` so that a call never outlives the request that made
+it. ``deadline`` is an absolute ``time.monotonic()`` value; when it passes
+without an answer the call is cancelled and ``DeadlineExceeded`` is raised.
+
+Until the first chunk arrives nothing has been sent to the client, so the
+call can still be changed:
+
+* a failed attempt is retried after a jittered exponential backoff, but only
+  while the remaining budget is larger than the backoff plus a typical time
+  to first token, and never for errors that would fail again (bad request,
+  auth, blocked prompt);
+* with hedging enabled, a second attempt starts once the first has gone
+  longer than the recent p95 time to first token without answering. The
+  first attempt to produce a chunk wins and the other one is cancelled.
+
+Once a chunk has been yielded the winning attempt is streamed to the end
+(or to the deadline); errors after that point are raised as they are.
+Attempts run on their own threads, which gevent's monkey patching turns
+into greenlets, and are cancelled through the response's ``cancel()`` when
+it has one (the SDK's gRPC stream does) as well as by no longer reading it.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Error class names (from the SDK or google.api_core) that a retry won't fix
+NON_RETRYABLE = (
+    "InvalidArgument", "FailedPrecondition", "PermissionDenied", "Unauthenticated",
+    "NotFound", "BlockedPromptException", "StopCandidateException",
+)
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the model answered."""
+
+
+def is_retryable(error):
+    return not any(cls.__name__ in NON_RETRYABLE for cls in type(error).__mro__)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class _Attempt:
+    def __init__(self, number, kind):
+        self.number = number
+        self.kind = kind
+        self.started = time.monotonic()
+        self.response = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        for target in (self.response, getattr(self.response, "_iterator", None)):
+            cancel = getattr(target, "cancel", None)
+            if callable(cancel):
+                try:
+                    cancel()
+                except Exception:
+                    pass
+
+
+class DeadlineModel:
+    """Streams from ``model`` with a deadline, retries and optional hedging.
+
+    ``max_attempts`` counts every upstream call a request may make, hedges
+    included. Without enough first-token samples for a p95, hedges start
+    after ``hedge_initial_delay``; the delay never drops below
+    ``hedge_min_delay``.
+    """
+
+    def __init__(self, model, max_attempts=3, backoff=0.25, max_backoff=2.0, hedge=False,
+                 hedge_percentile=95, hedge_initial_delay=2.0, hedge_min_delay=0.25,
+                 min_samples=20, retryable=is_retryable):
+        self.model = model
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_initial_delay = hedge_initial_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.retryable = retryable
+        # Recent times to first token of attempts that answered, in seconds
+        self.first_token_seconds = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self.counts = {
+            "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "cancelled": 0, "errors": 0, "deadline_exceeded": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def hedge_delay(self):
+        """Seconds without a first chunk before a hedged attempt starts."""
+        samples = list(self.first_token_seconds)
+        if len(samples) < self.min_samples:
+            return max(self.hedge_min_delay, self.hedge_initial_delay)
+        return max(self.hedge_min_delay, _percentile(samples, self.hedge_percentile))
+
+    def _typical_first_token(self):
+        samples = list(self.first_token_seconds)
+        return _percentile(samples, 50) if len(samples) >= self.min_samples else 0.0
+
+    def _start(self, prompt, events, number, kind, kwargs):
+        attempt = _Attempt(number, kind)
+        self._count("attempts")
+        if kind != "primary":
+            self._count("retries" if kind == "retry" else "hedges")
+            logger.info(f"Starting Gemini attempt {number} ({kind})")
+
+        def run():
+            try:
+                attempt.response = self.model.generate_content(prompt, stream=True, **kwargs)
+                if attempt.cancelled:
+                    attempt.cancel()
+                    return
+                for chunk in attempt.response:
+                    if attempt.cancelled:
+                        return
+                    events.put((attempt, "chunk", chunk))
+                events.put((attempt, "done", None))
+            except BaseException as e:
+                events.put((attempt, "error", e))
+
+        threading.Thread(target=run, name=f"gemini-attempt-{number}", daemon=True).start()
+        return attempt
+
+    def _backoff(self, retry):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    def stream(self, prompt, deadline, **kwargs):
+        """Yield the chunks of one answer to ``prompt``, giving up at ``deadline``."""
+        # Events from attempts that lost are read and dropped here too
+        events = queue.Queue()
+        active = [self._start(prompt, events, 1, "primary", kwargs)]
+        started = 1
+        hedge_at = time.monotonic() + self.hedge_delay() if self.hedge else None
+        winner = None
+        try:
+            while winner is None:
+                now = time.monotonic()
+                if now >= deadline:
+                    self._count("deadline_exceeded")
+                    raise DeadlineExceeded("Gemini did not answer before the request deadline")
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if started < self.max_attempts and len(active) == 1:
+                        started += 1
+                        active.append(self._start(prompt, events, started, "hedge", kwargs))
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                try:
+                    attempt, kind, payload = events.get(timeout=max(0.0, wake - time.monotonic()))
+                except queue.Empty:
+                    continue
+                if attempt not in active:
+                    continue
+                if kind == "error":
+                    active.remove(attempt)
+                    self._count("errors")
+                    logger.warning(f"Gemini attempt {attempt.number} failed: {str(payload)}")
+                    if active:
+                        # The other attempt may still answer
+                        continue
+                    backoff = self._backoff(started - 1)
+                    remaining = deadline - time.monotonic()
+                    if (not self.retryable(payload) or started >= self.max_attempts
+                            or remaining <= backoff + self._typical_first_token()):
+                        raise payload
+                    time.sleep(backoff)
+                    started += 1
+                    active.append(self._start(prompt, events, started, "retry", kwargs))
+                    hedge_at = time.monotonic() + self.hedge_delay() if self.hedge else None
+                    continue
+                winner = attempt
+                self.first_token_seconds.append(time.monotonic() - attempt.started)
+                if attempt.kind == "hedge":
+                    self._count("hedge_wins")
+                for loser in active:
+                    if loser is not winner:
+                        loser.cancel()
+                        self._count("cancelled")
+                active = [winner]
+                if kind == "done":
+                    return
+                yield payload
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count("deadline_exceeded")
+                    raise DeadlineExceeded("Gemini did not finish answering before the request deadline")
+                try:
+                    attempt, kind, payload = events.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if attempt is not winner:
+                    continue
+                if kind == "error":
+                    self._count("errors")
+                    raise payload
+                if kind == "done":
+                    return
+                yield payload
+        finally:
+            # Deadline, error, or the consumer stopped reading: stop every attempt still running
+            for attempt in active:
+                if not attempt.cancelled:
+                    attempt.cancel()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        samples = list(self.first_token_seconds)
+        counts["first_token_ms"] = {
+            "p50": round(_percentile(samples, 50) * 1000, 1) if samples else None,
+            "p95": round(_percentile(samples, 95) * 1000, 1) if samples else None,
+        }
+        counts["hedge_delay_ms"] = round(self.hedge_delay() * 1000, 1) if self.hedge else None
+        return counts
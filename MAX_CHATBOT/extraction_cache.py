@@ -0,0 +1,161 @@
+"""Content-addressed on-disk cache of ingestion artifacts.
+
+Entries are keyed by the MD5 content hash ``extract_pdf_text`` computes, so
+the same file is parsed once no matter how many workers or restarts see it.
+Each entry is an artifact as built by ``artifacts.build_artifact``.
+Writes go through a temp file and ``os.replace`` which makes them atomic for
+concurrent readers. Each process keeps an LRU index of entries and their
+sizes with a running total, built from one directory scan (in mtime order)
+the first time it is needed; ``put`` only compares the total with the cap.
+Other workers write to the same directory, so going over the cap rescans it
+before evicting, and eviction trims down to ``LOW_WATER`` of the cap so the
+next rescan is many writes away. Mtimes are still touched on hits so every
+process's rescan sees the same recency, and eviction is serialised across
+processes with an advisory lock.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the extraction logic changes so stale entries are ignored
+EXTRACTION_VERSION = "3"
+
+# Share of ``max_bytes`` eviction trims the cache down to
+LOW_WATER = 0.9
+
+
+class ExtractionCache:
+    """LRU-by-mtime cache of artifact dicts keyed by content hash."""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # path -> size, least recently used first; None until the first scan
+        self._entries = None
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, content_hash[:2], f"{content_hash}.v{EXTRACTION_VERSION}.json")
+
+    def get(self, content_hash):
+        """Return the artifact for a content hash, or None on a miss."""
+        path = self._path(content_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                size = os.fstat(f.fileno()).st_size
+                entry = json.load(f)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path, None)
+            self._track(path, size)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, content_hash, artifact):
+        path = self._path(content_hash)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(artifact, f, ensure_ascii=False)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to write cache entry for {content_hash}: {str(e)}")
+            return
+        if self._track(path, size) > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        """Index every entry on disk, least recently used first."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        with self._lock:
+            self._entries = OrderedDict((path, size) for _, size, path in entries)
+            self._total = sum(size for _, size, _ in entries)
+
+    def _track(self, path, size):
+        """Record a use (or new size) of an entry; returns the running total."""
+        if self._entries is None:
+            self._scan()
+        with self._lock:
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            return self._total
+
+    def size(self):
+        """Bytes in the cache as far as this process knows."""
+        if self._entries is None:
+            self._scan()
+        return self._total
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits ``max_bytes``."""
+        lock_path = os.path.join(self.directory, ".evict.lock")
+        with open(lock_path, "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Another process is already evicting
+                    return
+            # Pick up what other workers have written since this process last looked
+            self._scan()
+            if self._total <= self.max_bytes:
+                return
+            target = self.max_bytes * LOW_WATER
+            victims = []
+            with self._lock:
+                while self._entries and self._total > target:
+                    path, size = self._entries.popitem(last=False)
+                    self._total -= size
+                    victims.append(path)
+                total = self._total
+            for path in victims:
+                self._unlink(path)
+            logger.info(f"Evicted {len(victims)} extraction cache entries down to {total} bytes")
+
+    def _remove(self, path):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self._total -= self._entries.pop(path)
+        self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,111 @@
+"""Stand-in for the Gemini model, for running and benchmarking offline.
+
+``FakeGeminiModel`` answers ``generate_content`` like the SDK does (a
+response with ``.text``, or an iterator of chunks when ``stream=True``). It
+waits ``latency`` seconds before the first token and then emits tokens at
+``tokens_per_second``, so time-to-first-byte and streaming throughput behave
+like a real model with those characteristics. Answers repeat words from the
+question so distinct questions get distinct answers.
+
+``latency`` may also be a callable returning a delay per call, e.g.
+``long_tail(0.3, 0.05, 8.0)`` for a model whose p99 is far above its
+median, and ``failure_rate`` makes that share of calls raise
+``FakeUnavailable`` before the first token. Streams can be cancelled with
+``cancel()`` like the SDK's, which ends them at the next sleep.
+"""
+import random
+import re
+import threading
+import time
+
+_QUESTION = re.compile(r"Answer the user's question: (.*)", re.S)
+
+
+class FakeUnavailable(Exception):
+    """An injected upstream failure (named like the 503 the real API returns)."""
+
+
+def long_tail(latency, slow_rate, slow_latency):
+    """A latency distribution: ``latency`` usually, ``slow_latency`` for ``slow_rate`` of calls."""
+    def sample():
+        return slow_latency if random.random() < slow_rate else latency
+    return sample
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    """An iterator of chunks that ``cancel()`` stops early, like the SDK's gRPC stream."""
+
+    def __init__(self, model, words, delay, fail):
+        self.cancelled = threading.Event()
+        self._chunks = model._chunks(words, delay, fail, self.cancelled)
+
+    def __iter__(self):
+        return self._chunks
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class FakeGeminiModel:
+    """``latency`` is the time to first token (seconds, or a callable returning them);
+    ``jitter`` varies it by up to that fraction."""
+
+    def __init__(self, latency=0.3, tokens_per_second=50.0, answer_tokens=80, jitter=0.0, chunk_tokens=8,
+                 failure_rate=0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.jitter = jitter
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def _answer_words(self, prompt):
+        match = _QUESTION.search(prompt)
+        words = (match.group(1) if match else prompt[-200:]).split() or ["answer"]
+        return [words[i % len(words)] for i in range(self.answer_tokens)]
+
+    def _first_token_delay(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        return max(0.0, latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def _token_delay(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        words = self._answer_words(prompt)
+        delay = self._first_token_delay()
+        fail = random.random() < self.failure_rate
+        if stream:
+            return FakeStream(self, words, delay, fail)
+        time.sleep(delay)
+        if fail:
+            raise FakeUnavailable("503 The model is overloaded. Please try again later.")
+        time.sleep(self._token_delay(len(words)))
+        return FakeChunk(" ".join(words))
+
+    def _chunks(self, words, delay, fail, cancelled):
+        if cancelled.wait(delay):
+            self._count_cancelled()
+            return
+        if fail:
+            raise FakeUnavailable("503 The model is overloaded. Please try again later.")
+        for start in range(0, len(words), self.chunk_tokens):
+            part = words[start:start + self.chunk_tokens]
+            if start and cancelled.wait(self._token_delay(len(part))):
+                self._count_cancelled()
+                return
+            yield FakeChunk(("" if start == 0 else " ") + " ".join(part))
+
+    def _count_cancelled(self):
+        with self._lock:
+            self.cancelled += 1
@@ -1,4 +1,11 @@
+import os
+
 bind = '0.0.0.0:5000'
-workers = 2
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# Cooperative (gevent) workers keep many streaming chats open per process;
+# set GUNICORN_WORKER_CLASS=sync to go back to one request per worker
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
 accesslog = '-'
-errorlog = '-' 
\ No newline at end of file
+errorlog = '-' 
@@ -0,0 +1,264 @@
+"""Parallel ingestion of changed bucket objects into corpus documents.
+
+Downloads run on a bounded thread pool (they are network bound) and PDF page
+extraction runs on a process pool (it is CPU bound and holds the GIL). PDFs
+are parsed in memory from the downloaded bytes, large PDFs are split into
+page ranges so one catalogue can use several processes, and results are
+reassembled in page order so the output is deterministic. Files uploaded
+through the admin endpoint already have an artifact next to them in the
+bucket; that small JSON is downloaded in place of the original.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+from artifacts import build_artifact, document_from_artifact, is_current, parse_artifact_path
+from metrics import registry as metrics
+from spreadsheet import read_sheets
+
+logger = logging.getLogger(__name__)
+
+# Per file: download, PDF extraction (submit to last page back) and text/sheet parsing
+INGEST_STAGE_SECONDS = metrics.histogram("chatbot_ingest_stage_seconds", "Time per file in each ingestion stage.", ("stage",))
+
+
+def _source(data):
+    """A PDF or workbook as the readers take it: bytes, or the path of a local copy."""
+    return data if isinstance(data, str) else io.BytesIO(data)
+
+
+def extract_pdf_pages(data, start=0, stop=None):
+    """Extract ``(page_number, text)`` pairs for pages ``[start, stop)`` of a PDF."""
+    reader = PyPDF2.PdfReader(_source(data))
+    pages = reader.pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    extracted = []
+    for index in range(start, stop):
+        try:
+            text = pages[index].extract_text()
+            if text:
+                extracted.append((index + 1, text))
+        except Exception as e:
+            logger.error(f"Error extracting text from page {index + 1}: {str(e)}")
+    return extracted
+
+
+def count_pdf_pages(data):
+    return len(PyPDF2.PdfReader(_source(data)).pages)
+
+
+def decode_text(data):
+    text = data.decode('utf-8')
+    return [(1, text)] if text else []
+
+
+class IngestionPipeline:
+    """Download, hash, extract and cache a batch of changed objects."""
+
+    def __init__(self, cache, download_workers=4, extract_processes=2, pages_per_task=20):
+        self.cache = cache
+        self.download_workers = max(1, download_workers)
+        self.extract_processes = extract_processes
+        self.pages_per_task = max(1, pages_per_task)
+        self._process_pool = None
+        # path -> fingerprint of objects that downloaded fine but failed to parse,
+        # so a corrupt file isn't re-downloaded on every poll
+        self._unparseable = {}
+
+    def _get_process_pool(self):
+        """Create the extraction pool on first use; None means extract inline."""
+        if self.extract_processes <= 0:
+            return None
+        if self._process_pool is None:
+            try:
+                # spawn/forkserver would re-import the __main__ module (app.py and
+                # its startup side effects) in every child, so prefer fork
+                context = None
+                if "fork" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("fork")
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.extract_processes,
+                    mp_context=context,
+                )
+            except Exception as e:
+                logger.warning(f"Process pool unavailable, extracting inline: {str(e)}")
+                self.extract_processes = 0
+                return None
+        return self._process_pool
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    def _submit_extraction(self, pool, data):
+        """Split a PDF into page-range tasks; returns a list of futures or results."""
+        if pool is None:
+            return [extract_pdf_pages(data)]
+        page_count = count_pdf_pages(data)
+        return [
+            pool.submit(extract_pdf_pages, data, start, start + self.pages_per_task)
+            for start in range(0, max(page_count, 1), self.pages_per_task)
+        ]
+
+    @staticmethod
+    def _collect(parts):
+        pages = []
+        for part in parts:
+            pages.extend(part.result() if hasattr(part, "result") else part)
+        pages.sort(key=lambda page: page[0])
+        return pages
+
+    def extract_pdf(self, data):
+        """Extract every page of one PDF (bytes or a local path) using the extraction pool."""
+        try:
+            return self._collect(self._submit_extraction(self._get_process_pool(), data))
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+
+    @staticmethod
+    def _download(bucket, path):
+        with INGEST_STAGE_SECONDS.time(stage="download"):
+            return bucket.download(path)
+
+    def prepare(self, content_hash, kind, pages=(), tables=()):
+        """Build and cache the artifact for some extracted content."""
+        artifact = build_artifact(kind, pages, tables)
+        self.cache.put(content_hash, artifact)
+        return artifact
+
+    def run(self, bucket, objects, previous, artifacts=None):
+        """Ingest ``objects``; returns ``{path: (fingerprint, Document)}``.
+
+        ``previous(path)`` returns the last known document for a path; it is
+        reused when the content is unchanged and kept when ingestion fails.
+        ``artifacts`` maps a source path to its artifact object in the bucket;
+        an artifact at least as new as its source is downloaded instead of it.
+        """
+        entries = {}
+        extractions = {}  # path -> (obj, content_hash, submitted at, [futures or page lists])
+        pool = self._get_process_pool()
+        artifacts = artifacts or {}
+        # Known-corrupt content isn't downloaded again, but its last good version stays
+        parseable = []
+        for obj in objects:
+            if self._unparseable.get(obj.path) == obj.fingerprint:
+                self._keep_previous(entries, obj.path, previous(obj.path))
+            else:
+                parseable.append(obj)
+        objects = parseable
+
+        with ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="ingest-download") as downloads:
+            pending = {}
+            for obj in objects:
+                artifact_obj = artifacts.get(obj.path)
+                if artifact_obj is not None and artifact_obj.modified >= obj.modified:
+                    pending[downloads.submit(self._download, bucket, artifact_obj.path)] = (obj, artifact_obj)
+                else:
+                    pending[downloads.submit(self._download, bucket, obj.path)] = (obj, None)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    obj, artifact_obj = pending.pop(future)
+                    prior = previous(obj.path)
+                    try:
+                        file_content = future.result()
+                    except Exception as e:
+                        logger.error(f"Error downloading {(artifact_obj or obj).path}: {str(e)}")
+                        if artifact_obj is not None:
+                            pending[downloads.submit(self._download, bucket, obj.path)] = (obj, None)
+                        else:
+                            self._keep_previous(entries, obj.path, prior)
+                        continue
+
+                    if artifact_obj is not None:
+                        document = self._from_artifact(obj, artifact_obj, file_content, prior)
+                        if document is None:
+                            # Stale or unreadable artifact: ingest the original instead
+                            pending[downloads.submit(self._download, bucket, obj.path)] = (obj, None)
+                        else:
+                            entries[obj.path] = (obj.fingerprint, document)
+                        continue
+
+                    try:
+                        content_hash = hashlib.md5(file_content).hexdigest()
+
+                        # Metadata changed but content didn't (e.g. re-upload of the same file)
+                        if prior is not None and prior.content_hash == content_hash:
+                            entries[obj.path] = (obj.fingerprint, prior)
+                            continue
+
+                        # Another worker (or a previous run) may already have parsed this content
+                        cached = self.cache.get(content_hash)
+                        if is_current(cached):
+                            entries[obj.path] = (obj.fingerprint, document_from_artifact(obj.path, content_hash, cached))
+                            continue
+
+                        logger.info(f"Processing file: {obj.path}")
+                        if obj.path.endswith('.pdf'):
+                            submitted = time.perf_counter()
+                            extractions[obj.path] = (obj, content_hash, submitted, self._submit_extraction(pool, file_content))
+                            continue
+                        with INGEST_STAGE_SECONDS.time(stage="parse"):
+                            if obj.path.endswith(('.xlsx', '.xls')):
+                                artifact = self.prepare(content_hash, "sheet", tables=read_sheets(file_content))
+                            else:
+                                artifact = self.prepare(content_hash, "text", decode_text(file_content))
+                        entries[obj.path] = (obj.fingerprint, document_from_artifact(obj.path, content_hash, artifact))
+                    except Exception as e:
+                        logger.error(f"Error processing {obj.path}: {str(e)}")
+                        self._unparseable[obj.path] = obj.fingerprint
+                        self._keep_previous(entries, obj.path, prior)
+
+        for path, (obj, content_hash, submitted, parts) in extractions.items():
+            try:
+                pages = self._collect(parts)
+                INGEST_STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="extract")
+                artifact = self.prepare(content_hash, "pdf", pages)
+                entries[path] = (obj.fingerprint, document_from_artifact(path, content_hash, artifact))
+            except BrokenProcessPool as e:
+                logger.error(f"Extraction pool failed while processing {path}: {str(e)}")
+                # Recreate the pool on the next run
+                self.shutdown()
+                self._keep_previous(entries, path, previous(path))
+            except Exception as e:
+                logger.error(f"Error processing {path}: {str(e)}")
+                self._unparseable[path] = obj.fingerprint
+                self._keep_previous(entries, path, previous(path))
+
+        return entries
+
+    def _from_artifact(self, obj, artifact_obj, data, prior):
+        """Document for ``obj`` from its downloaded artifact, or None if unusable."""
+        _, content_hash = parse_artifact_path(artifact_obj.path)
+        if prior is not None and prior.content_hash == content_hash:
+            return prior
+        try:
+            artifact = json.loads(data)
+        except Exception as e:
+            logger.warning(f"Unreadable artifact {artifact_obj.path}: {str(e)}")
+            return None
+        if not is_current(artifact):
+            return None
+        self.cache.put(content_hash, artifact)
+        return document_from_artifact(obj.path, content_hash, artifact)
+
+    @staticmethod
+    def _keep_previous(entries, path, prior):
+        # Keep serving the last good version rather than dropping the file;
+        # an empty fingerprint forces a retry on the next poll
+        if prior is not None:
+            entries[path] = ("", prior)
+
+
+def default_extract_processes():
+    return min(2, os.cpu_count() or 1)
@@ -0,0 +1,174 @@
+"""Asynchronous, batched writer for the ``queries`` table.
+
+Requests enqueue rows without any network I/O; a background flusher bulk
+inserts them when a batch fills up or the flush interval elapses. When the
+queue is full rows are dropped (after an optional short wait) and counted.
+If the insert fails, the batch is appended to a local JSONL spill file and
+replayed once the database is reachable again.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionLogger:
+    def __init__(self, insert_rows, max_queue=10000, batch_size=50, flush_interval=2.0,
+                 put_timeout=0.0, spill_path=None, spill_retry_interval=30.0):
+        self.insert_rows = insert_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.spill_path = spill_path
+        self.spill_retry_interval = spill_retry_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._flush_lock = threading.Lock()
+        # Don't hammer an unreachable database with spill replays
+        self._replay_after = 0.0
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "spilled": 0}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def log(self, row):
+        """Queue a row; returns False if it had to be dropped."""
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.counters["dropped"] += 1
+            return False
+        self.counters["enqueued"] += 1
+        return True
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher and write out everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._flush(self._drain(self._queue.qsize()))
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._run_once()
+            except Exception:
+                # Keep the flusher alive; otherwise every later row waits in the queue until dropped
+                logger.exception("Interaction log flusher failed")
+                self._stop.wait(self.flush_interval)
+
+    def _run_once(self):
+        deadline = time.monotonic() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        if batch:
+            self._flush(batch)
+        else:
+            self._replay_spill()
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        with self._flush_lock:
+            try:
+                self.insert_rows(rows)
+                self.counters["written"] += len(rows)
+                logger.info(f"Logged {len(rows)} interactions")
+            except Exception as e:
+                logger.error(f"Failed to log {len(rows)} interactions: {str(e)}")
+                self.counters["failed"] += len(rows)
+                self._replay_after = time.monotonic() + self.spill_retry_interval
+                self._spill(rows)
+                return
+        self._replay_after = 0.0
+        self._replay_spill()
+
+    def _spill(self, rows):
+        if not self.spill_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.counters["spilled"] += len(rows)
+        except Exception as e:
+            logger.error(f"Failed to spill interactions to {self.spill_path}: {str(e)}")
+
+    def _replay_spill(self):
+        """Re-insert spilled rows once the database accepts writes again."""
+        if not self.spill_path or time.monotonic() < self._replay_after:
+            return
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        if not os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+            return
+        with self._flush_lock:
+            # Claim the file first so rows spilled meanwhile land in a new one; a
+            # replay file left by an earlier failed attempt is retried as it is
+            if not os.path.exists(replay_path):
+                try:
+                    os.replace(self.spill_path, replay_path)
+                except FileNotFoundError:
+                    return
+            rows = self._read_spill(replay_path)
+            written = 0
+            try:
+                while written < len(rows):
+                    batch = rows[written:written + self.batch_size]
+                    self.insert_rows(batch)
+                    written += len(batch)
+                    self.counters["written"] += len(batch)
+                logger.info(f"Replayed {written} spilled interactions")
+            except Exception as e:
+                logger.warning(f"Spilled interactions still can't be written: {str(e)}")
+                self._replay_after = time.monotonic() + self.spill_retry_interval
+                self._spill(rows[written:])
+            os.remove(replay_path)
+
+    @staticmethod
+    def _read_spill(path):
+        """Rows of a spill file, skipping lines a crash mid-write left unparseable."""
+        rows = []
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping unreadable line {number} of {path}")
+        return rows
+
+    def stats(self):
+        return dict(self.counters, queued=self._queue.qsize())
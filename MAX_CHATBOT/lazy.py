@@ -0,0 +1,47 @@
+"""On-first-use initialisation for expensive clients.
+
+Creating the Supabase client (and checking the bucket) or importing and
+configuring the Gemini SDK used to happen at import time, which put that
+cost on every cold start. ``Lazy`` defers it to the first attribute access,
+runs the factory exactly once across threads, and records how long it took.
+"""
+import threading
+import time
+
+_UNSET = object()
+
+
+class Lazy:
+    """Proxy that builds its target with ``factory()`` on first use."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = _UNSET
+        self._lock = threading.Lock()
+        self.seconds = None  # how long the factory took, once it has run
+
+    @property
+    def loaded(self):
+        return self._value is not _UNSET
+
+    def get(self):
+        if self._value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    started = time.perf_counter()
+                    # A failing factory raises here and is retried on the next use
+                    value = self._factory()
+                    self.seconds = time.perf_counter() - started
+                    self._value = value
+        return self._value
+
+    def __getattr__(self, name):
+        # Only called for attributes the proxy itself doesn't have
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<Lazy {self.name} ({state})>"
@@ -0,0 +1,237 @@
+"""Corpus snapshots shared between gunicorn workers through one mapped file.
+
+One process per tenant (whichever holds the tenant's ``RefreshLease``) runs
+ingestion and writes the snapshot to a compact binary file; every other
+worker maps that file read-only. Term-frequency matrices and document
+frequencies are numpy views straight onto the mapping and chunk text is
+decoded only for the chunks a prompt actually uses, so the bulk of the
+corpus lives once in the OS page cache instead of once per worker.
+
+Layout: ``MAGIC``, an 8-byte little-endian header length, a JSON header,
+padding to 8 bytes, then the binary sections the header points into. New
+versions are written to a temp file and swapped in with ``os.replace``;
+readers notice the swap through the file's inode/mtime stamp, and a reader
+still holding the old mapping keeps working on the unlinked file.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Sequence
+from functools import cached_property
+
+import numpy as np
+from scipy import sparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from corpus import Document
+from price_table import PriceRow, PriceTable
+from retrieval import Chunk, RetrievalIndex
+
+MAGIC = b"MXCORP01"
+MAPPED_FORMAT = 2
+_ALIGN = 8
+
+
+def write_mapped(snapshot, path):
+    """Write ``snapshot`` to ``path`` atomically."""
+    index = snapshot.index or RetrievalIndex()
+    vocabulary_size = len(index.df)
+    tokens = [""] * vocabulary_size
+    for token, term_id in list(index.vocabulary.items()):
+        if term_id < vocabulary_size:
+            tokens[term_id] = token
+
+    paths, labels, chunk_texts, matrices, lengths = [], [], [], [], []
+    for block_path in sorted(index.blocks):
+        block = index.blocks[block_path]
+        paths.append(block_path)
+        for chunk in block.chunks:
+            labels.append([len(paths) - 1, chunk.label])
+            chunk_texts.append(chunk.text.encode("utf-8"))
+        # Widen each block to the full vocabulary before stacking
+        matrices.append(sparse.csr_matrix(
+            (block.tf.data, block.tf.indices, block.tf.indptr),
+            shape=(len(block.chunks), vocabulary_size),
+        ))
+        lengths.append(block.lengths)
+    tf = sparse.vstack(matrices, format="csr") if matrices else sparse.csr_matrix((0, vocabulary_size))
+    chunk_offsets = np.cumsum([0] + [len(text) for text in chunk_texts], dtype=np.int64)
+
+    arrays = {
+        "text": np.frombuffer(snapshot.text.encode("utf-8"), dtype=np.uint8),
+        "chunk_text": np.frombuffer(b"".join(chunk_texts), dtype=np.uint8),
+        "chunk_offsets": chunk_offsets,
+        "tf_data": tf.data.astype(np.float32),
+        "tf_indices": tf.indices.astype(np.int32),
+        "tf_indptr": tf.indptr.astype(np.int64),
+        "lengths": np.concatenate(lengths).astype(np.float64) if lengths else np.zeros(0),
+        "df": np.asarray(index.df, dtype=np.int64),
+    }
+    sections, offset = {}, 0
+    for name, array in arrays.items():
+        sections[name] = [offset, int(array.size), array.dtype.str]
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+
+    price_rows = snapshot.price_table.rows if snapshot.price_table is not None else ()
+    header = json.dumps({
+        "format": MAPPED_FORMAT,
+        "version": snapshot.version,
+        "created_at": snapshot.created_at,
+        "text_tokens": snapshot.text_tokens,
+        "has_text": snapshot.has_text,
+        "documents": [[doc.path, doc.content_hash, doc.kind] for doc in snapshot.documents],
+        "paths": paths,
+        "chunk_labels": labels,
+        "vocabulary": tokens,
+        "k1": index.k1,
+        "b": index.b,
+        "price_rows": [[row.name, row.sku, [list(price) for price in row.prices], row.source, row.structured]
+                       for row in price_rows],
+        "sections": sections,
+    }, ensure_ascii=False).encode("utf-8")
+    head = MAGIC + struct.pack("<Q", len(header)) + header
+    head += b"\0" * (-len(head) % _ALIGN)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mapped-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(head)
+            for array in arrays.values():
+                data = array.tobytes()
+                f.write(data + b"\0" * (-len(data) % _ALIGN))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_stamp(path):
+    """Identity of the file currently at ``path``; changes on every swap."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class MappedChunks(Sequence):
+    """Chunks decoded from the mapping on access."""
+
+    def __init__(self, text, offsets, labels, paths):
+        self._text = text
+        self._offsets = offsets
+        self._labels = labels
+        self._paths = paths
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        start, end = self._offsets[position], self._offsets[position + 1]
+        path_id, label = self._labels[position]
+        return Chunk(self._paths[path_id], label, bytes(self._text[start:end]).decode("utf-8"))
+
+
+class MappedSnapshot:
+    """Read-only snapshot backed by a mapped file; mirrors ``CorpusSnapshot``."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a mapped corpus file")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_length].decode("utf-8"))
+        if header["format"] != MAPPED_FORMAT:
+            raise ValueError(f"{path} has unsupported format {header['format']}")
+        data_start = header_start + header_length
+        data_start += -data_start % _ALIGN
+
+        def section(name):
+            offset, count, dtype = header["sections"][name]
+            return np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+
+        self.version = header["version"]
+        self.created_at = header["created_at"]
+        self.text_tokens = header["text_tokens"]
+        self.has_text = header["has_text"]
+        self.documents = tuple(Document(doc_path, content_hash, kind) for doc_path, content_hash, kind in header["documents"])
+        self._text = section("text")
+
+        vocabulary = {token: term_id for term_id, token in enumerate(header["vocabulary"])}
+        lengths = section("lengths")
+        tf = sparse.csr_matrix(
+            (section("tf_data"), section("tf_indices"), section("tf_indptr")),
+            shape=(len(lengths), len(header["vocabulary"])),
+            copy=False,
+        )
+        chunks = MappedChunks(
+            section("chunk_text"),
+            section("chunk_offsets"),
+            [tuple(label) for label in header["chunk_labels"]],
+            header["paths"],
+        )
+        self.index = RetrievalIndex.from_arrays(vocabulary, chunks, tf, lengths, section("df"), header["k1"], header["b"])
+        self.price_table = PriceTable(
+            PriceRow(name, sku, tuple((label, value) for label, value in prices), source, structured)
+            for name, sku, prices, source, structured in header["price_rows"]
+        )
+        # Only the per-worker Python objects count; the mapped pages are shared
+        self.resident_bytes = header_length * 2
+
+    @cached_property
+    def text(self):
+        return self._text.tobytes().decode("utf-8")
+
+    @property
+    def files(self):
+        return {doc.path: doc.content_hash for doc in self.documents}
+
+
+class RefreshLease:
+    """Cross-process lease on refreshing one tenant, held through ``flock``.
+
+    The holder keeps the lock file open for as long as it refreshes the
+    tenant; if it exits (or evicts the tenant) the lock is released and
+    another worker takes over on its next poll. Without ``fcntl`` every
+    process refreshes for itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self):
+        return fcntl is None or self._file is not None
+
+    def acquire(self):
+        """Try to take the lease without blocking; True if this process holds it."""
+        if self.held:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
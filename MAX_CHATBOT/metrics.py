@@ -0,0 +1,320 @@
+"""Counters, gauges and histograms exposed in the Prometheus text format.
+
+Modules declare their metrics at import on the shared ``registry``::
+
+    STAGE_SECONDS = registry.histogram("chatbot_chat_stage_seconds", "Time per chat stage", ("stage",))
+    with STAGE_SECONDS.time(stage="prompt"):
+        ...
+
+Recording only touches a dict under a lock. Each gunicorn worker keeps its
+own values; once ``registry.start(directory)`` has been called they are
+written to ``metrics-<group>-<pid>.json`` in that directory every few
+seconds (and right before a scrape), and ``render()`` merges the files of
+every worker started by the same gunicorn master (the group). Counters and
+histograms are summed, including those of workers that have since exited,
+so totals never go backwards when gunicorn recycles a worker; gauges only
+count processes that are still alive and are combined with ``max`` (or
+``sum``). Files left by an earlier master are removed on start.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache lookups up to slow Gemini answers and large refreshes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _empty(self):
+        return 0.0
+
+    def _merge(self, merged, value, live):
+        raise NotImplementedError
+
+    def _lines(self, series):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            values = self.registry._values[self.name]
+            values[key] = values.get(key, 0.0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirror a count that is kept elsewhere in this process (it must only grow)."""
+        key = self._key(labels)
+        with self.registry._lock:
+            self.registry._values[self.name][key] = float(value)
+
+    def _merge(self, merged, value, live):
+        return merged + value
+
+    def _lines(self, series):
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in series]
+
+
+class Gauge(Metric):
+    """``mode`` combines the values of live workers: ``max`` or ``sum``."""
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, labelnames=(), mode="max"):
+        super().__init__(registry, name, documentation, labelnames)
+        self.mode = mode
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            self.registry._values[self.name][key] = float(value)
+
+    def clear(self):
+        """Drop every series, e.g. before re-setting them all from a collector."""
+        with self.registry._lock:
+            self.registry._values[self.name].clear()
+
+    def _empty(self):
+        return None
+
+    def _merge(self, merged, value, live):
+        if not live:
+            return merged
+        if merged is None:
+            return value
+        return merged + value if self.mode == "sum" else max(merged, value)
+
+    def _lines(self, series):
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in series if value is not None]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            values = self.registry._values[self.name]
+            # Per-bucket (non-cumulative) counts, then sum and count
+            state = values.get(key)
+            if state is None:
+                state = values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _empty(self):
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def _merge(self, merged, value, live):
+        return [a + b for a, b in zip(merged, value)]
+
+    def _lines(self, series):
+        lines = []
+        for key, state in series:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._values = {}  # metric name -> {label values: value}
+        self._collectors = []
+        self.directory = None
+        self._group = None
+        self._stop = threading.Event()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            self._values[metric.name] = {}
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), mode="max"):
+        return self._register(Gauge(self, name, documentation, labelnames, mode))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def on_collect(self, callback):
+        """Run ``callback()`` before values are written or rendered, to refresh mirrored counts."""
+        self._collectors.append(callback)
+        return callback
+
+    def _collect(self):
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+
+    def start(self, directory, flush_interval=5.0):
+        """Share this process's metrics with the other workers through ``directory``."""
+        if self.directory is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        # Workers of one gunicorn master share its pid as their parent
+        self._group = os.getppid()
+        self.directory = directory
+        for name in os.listdir(directory):
+            parts = name.split("-")
+            if len(parts) == 3 and name.startswith("metrics-") and parts[1].isdigit():
+                if not _alive(int(parts[1])):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+        def run():
+            while not self._stop.wait(flush_interval):
+                self.flush()
+
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"metrics-{self._group}-{pid}.json")
+
+    def _snapshot(self):
+        self._collect()
+        with self._lock:
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value] for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+
+    def flush(self):
+        """Write this process's values for the other workers to read."""
+        if self.directory is None:
+            return
+        data = json.dumps({"pid": os.getpid(), "metrics": self._snapshot()})
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(os.getpid()))
+        except OSError as e:
+            logger.warning(f"Could not write metrics: {str(e)}")
+
+    def _sources(self):
+        """(values, alive) for this process and every other worker of the group."""
+        own = self._snapshot()
+        sources = [(own, True)]
+        if self.directory is None:
+            return sources
+        self.flush()
+        prefix = f"metrics-{self._group}-"
+        for name in os.listdir(self.directory):
+            if not name.startswith(prefix) or name == os.path.basename(self._path(os.getpid())):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            sources.append((data.get("metrics", {}), _alive(data.get("pid", 0))))
+        return sources
+
+    def render(self):
+        """All metrics, merged across workers, in the Prometheus text format."""
+        merged = {name: {} for name in self._metrics}
+        for values, live in self._sources():
+            for name, series in values.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in series:
+                    key = tuple(key)
+                    current = merged[name].get(key, metric._empty())
+                    merged[name][key] = metric._merge(current, value, live)
+
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric._lines(sorted(merged[name].items())))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,33 @@
+"""Run CPU-bound work without stalling gevent's event loop.
+
+Under gevent workers every ``threading.Thread`` is a greenlet on the one hub
+thread, so a snapshot build or unpickle started from the background loader
+holds up every request in the process (health checks included) until it
+finishes. ``run_cpu_bound`` hands such work to gevent's pool of native
+threads and parks only the calling greenlet; the interpreter's switch
+interval then lets the hub run between slices of the work. Without gevent it
+simply calls the function.
+
+Work sent to the pool runs on another OS thread, so it should be plain
+computation and file I/O: no greenlet-only APIs and no waiting on patched
+events.
+"""
+import sys
+
+
+def _native_pool():
+    if "gevent" not in sys.modules:
+        return None
+    from gevent import monkey
+    if not monkey.is_module_patched("threading"):
+        return None
+    import gevent
+    return gevent.get_hub().threadpool
+
+
+def run_cpu_bound(func, *args, **kwargs):
+    """Call ``func(*args, **kwargs)`` on a native thread when running under gevent."""
+    pool = _native_pool()
+    if pool is None:
+        return func(*args, **kwargs)
+    return pool.apply(func, args, kwargs)
@@ -0,0 +1,280 @@
+"""Structured price lookup over the uploaded price lists.
+
+Spreadsheets are ingested as raw cell rows; this module finds the header
+row, types each column, picks out the product name, SKU and price columns
+and indexes product names by character trigrams. Simple "what is the price
+of X" questions are answered straight from the table, but only from
+spreadsheet rows whose price sits in a column with a price-like header and
+only when the question names exactly one product; anything open-ended or
+ambiguous is left to Gemini. PDF lines shaped like ``<product> ... <price>``
+(with no other number on them) are recovered too, but they never answer on
+their own: they only make a lookup ambiguous when they disagree with the
+spreadsheet.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, replace
+
+NAME_HEADERS = ("product", "item", "description", "particular", "name", "model", "વસ્તુ", "ઉત્પાદન", "નામ")
+SKU_HEADERS = ("sku", "code", "part no", "part number", "cat no", "catalogue no", "article", "કોડ")
+PRICE_HEADERS = ("price", "rate", "mrp", "amount", "cost", "dp", "dlp", "ભાવ", "કિંમત", "દર")
+
+_NUMBER = re.compile(r"^[₹$]?\s*(?:rs\.?|inr)?\s*(-?\d[\d,]*(?:\.\d+)?)\s*(?:/-)?$", re.IGNORECASE)
+_ANY_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_PDF_PRICE_LINE = re.compile(r"^(?P<name>.*?[^\W\d_].*?)[\s.:\-–]+(?:₹|rs\.?|inr)?\s*(?P<price>\d[\d,]*(?:\.\d{1,2})?)\s*(?:/-)?$", re.IGNORECASE)
+_WORD = re.compile(r"[\w\u0900-\u097F\u0A80-\u0AFF]+")
+
+# Question shapes that ask for the price of a single product
+_PRICE_QUESTIONS = (
+    re.compile(r"^(?:what(?:'s| is| are)?\s+)?(?:the\s+)?(?:price|rate|cost|mrp)s?\s+(?:of|for)\s+(?P<item>.+)$", re.IGNORECASE),
+    re.compile(r"^how much (?:is|are|does|do|for)\s+(?:the\s+|a\s+|an\s+)?(?P<item>.+?)(?:\s+cost)?$", re.IGNORECASE),
+    re.compile(r"^(?P<item>.+?)\s+(?:price|rate|cost|mrp)$", re.IGNORECASE),
+    re.compile(r"^(?P<item>.+?)\s*(?:નો|ની|નું|ના)?\s*(?:ભાવ|કિંમત)(?:\s+(?:શું|કેટલો|કેટલી|કેટલું)\s*(?:છે)?)?$"),
+)
+# Words that signal an open-ended question that needs the model
+_OPEN_ENDED = re.compile(r"\b(?:compare|comparison|which|best|cheap|cheaper|cheapest|difference|recommend|vs|versus|between|all|list)\b", re.IGNORECASE)
+
+MAX_ITEM_WORDS = 8
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return " ".join(_WORD.findall(text))
+
+
+def parse_number(value):
+    """Parse a price-like cell (``1,250``, ``₹ 99.50``, ``Rs. 40/-``); None if not numeric."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)  # NaN check
+    match = _NUMBER.match(str(value).strip())
+    if not match:
+        return None
+    return float(match.group(1).replace(",", ""))
+
+
+def format_price(value):
+    if float(value).is_integer():
+        return f"₹{int(value):,}"
+    return f"₹{value:,.2f}"
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class PriceRow:
+    name: str
+    sku: str
+    prices: tuple  # tuple of (label, value)
+    source: str
+    # True for spreadsheet rows priced from a column with a price-like header
+    structured: bool = False
+
+
+def _matches(header, keywords):
+    header = normalize(header)
+    return any(keyword in header for keyword in keywords)
+
+
+def find_header_row(rows, scan=10):
+    """Index of the row that looks most like a header (title rows often sit above it)."""
+    best, best_hits = 0, -1
+    for index, row in enumerate(rows[:scan]):
+        cells = [cell for cell in row if cell not in (None, "")]
+        hits = sum(
+            1 for cell in cells
+            if isinstance(cell, str) and _matches(cell, NAME_HEADERS + SKU_HEADERS + PRICE_HEADERS)
+        )
+        if hits > best_hits:
+            best, best_hits = index, hits
+    return best
+
+
+def rows_from_sheet(source, raw_rows):
+    """Turn raw spreadsheet cells into ``PriceRow`` objects."""
+    raw_rows = [list(row) for row in raw_rows if any(cell not in (None, "") for cell in row)]
+    if len(raw_rows) < 2:
+        return []
+    header_index = find_header_row(raw_rows)
+    width = max(len(row) for row in raw_rows)
+    header = [str(cell).strip() if cell not in (None, "") else f"Column {i + 1}"
+              for i, cell in enumerate(raw_rows[header_index] + [None] * (width - len(raw_rows[header_index])))]
+    body = [row + [None] * (width - len(row)) for row in raw_rows[header_index + 1:]]
+
+    # Type each column: numeric if most non-empty cells parse as numbers
+    numeric = []
+    for col in range(width):
+        values = [row[col] for row in body if row[col] not in (None, "")]
+        parsed = [parse_number(value) for value in values]
+        numeric.append(bool(values) and sum(p is not None for p in parsed) >= 0.8 * len(values))
+
+    sku_cols = [i for i, name in enumerate(header) if _matches(name, SKU_HEADERS)]
+    name_cols = [i for i, name in enumerate(header) if _matches(name, NAME_HEADERS) and not numeric[i] and i not in sku_cols]
+    if not name_cols:
+        name_cols = [i for i in range(width) if not numeric[i] and i not in sku_cols][:1]
+    price_cols = [i for i, name in enumerate(header) if numeric[i] and _matches(name, PRICE_HEADERS)]
+    structured = bool(price_cols)
+    if not price_cols:
+        price_cols = [i for i in range(width) if numeric[i] and i not in sku_cols][-1:]
+    if not name_cols or not price_cols:
+        return []
+
+    rows = []
+    for row in body:
+        name = " ".join(str(row[i]).strip() for i in name_cols if row[i] not in (None, ""))
+        prices = tuple(
+            (header[i], parse_number(row[i])) for i in price_cols if parse_number(row[i]) is not None
+        )
+        if not name or not prices:
+            continue
+        sku = " ".join(str(row[i]).strip() for i in sku_cols if row[i] not in (None, ""))
+        rows.append(PriceRow(name, sku, prices, source, structured))
+    return rows
+
+
+def rows_from_pdf_pages(source, pages):
+    """Best-effort rows from PDF text lines shaped like ``<product> ... <price>``.
+
+    Lines with more than one number (``MRP 5400 Dealer 4300``, ``1HP ...
+    5400``) are skipped, as there is no telling which number is the price.
+    """
+    rows = []
+    for page_num, text in pages:
+        for line in text.splitlines():
+            line = line.strip()
+            if len(_ANY_NUMBER.findall(line)) != 1:
+                continue
+            match = _PDF_PRICE_LINE.match(line)
+            if match:
+                name = match.group("name").strip(" .:-–")
+                rows.append(PriceRow(name, "", (("Price", parse_number(match.group("price"))),), f"{source} page {page_num}".lstrip()))
+    return rows
+
+
+def document_rows(document):
+    """Price rows of one document, with sources relative to it (``(Sheet1)``, ``page 3``)."""
+    rows = []
+    for sheet_name, raw_rows in document.tables:
+        rows.extend(rows_from_sheet(f"({sheet_name})", raw_rows))
+    if document.kind == "pdf":
+        rows.extend(rows_from_pdf_pages("", document.pages))
+    return rows
+
+
+def price_question_item(question):
+    """Return the product asked about if ``question`` is a simple price lookup."""
+    question = question.strip().rstrip("?.!। ").strip()
+    if _OPEN_ENDED.search(question):
+        return None
+    for pattern in _PRICE_QUESTIONS:
+        match = pattern.match(question)
+        if match:
+            item = match.group("item").strip()
+            if item and len(item.split()) <= MAX_ITEM_WORDS:
+                return item
+    return None
+
+
+class PriceTable:
+    """Product/SKU index with trigram fuzzy matching."""
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+        self._names = [normalize(row.name) for row in self.rows]
+        self._gram_counts = [len(trigrams(name)) for name in self._names]
+        self._skus = defaultdict(list)
+        self._grams = defaultdict(set)
+        for row_id, (row, name) in enumerate(zip(self.rows, self._names)):
+            if row.sku:
+                self._skus[normalize(row.sku)].append(row_id)
+            for gram in trigrams(name):
+                self._grams[gram].add(row_id)
+
+    @classmethod
+    def from_documents(cls, documents):
+        rows = []
+        for document in documents:
+            # Artifacts carry their rows precomputed; older documents are parsed here
+            relative = document.prepared.price_rows if document.prepared is not None else document_rows(document)
+            rows.extend(replace(row, source=f"{document.path} {row.source}") for row in relative)
+        return cls(rows)
+
+    def lookup(self, item, limit=5):
+        """Return ``[(score, PriceRow)]`` best first; an exact SKU match scores 1.0."""
+        query = normalize(item)
+        if not query:
+            return []
+        if query in self._skus:
+            return [(1.0, self.rows[row_id]) for row_id in self._skus[query][:limit]]
+        query_grams = trigrams(query)
+        overlap = defaultdict(int)
+        for gram in query_grams:
+            for row_id in self._grams.get(gram, ()):
+                overlap[row_id] += 1
+        scored = []
+        for row_id, shared in overlap.items():
+            # Dice coefficient, nudged up when the query is contained in the name
+            score = 2 * shared / (len(query_grams) + self._gram_counts[row_id])
+            if query == self._names[row_id]:
+                score = 1.0
+            elif query in self._names[row_id]:
+                score = max(score, 0.75)
+            scored.append((score, row_id))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(score, self.rows[row_id]) for score, row_id in scored[:limit]]
+
+    def answer(self, question, language, min_score=0.6):
+        """Answer a simple price question, or return None to fall back to Gemini.
+
+        The item asked about must be a SKU or have all its words in exactly
+        one product name (or equal one name exactly), that product's rows
+        must all come from priced spreadsheet columns, and no PDF row for it
+        may quote a different price.
+        """
+        if language not in ("en", "gu") or not self.rows:
+            return None
+        item = price_question_item(question)
+        if item is None:
+            return None
+        query = normalize(item)
+        words = set(query.split())
+        candidates = [
+            row for score, row in self.lookup(item, limit=20)
+            if score == 1.0 or (score >= min_score and words <= set(normalize(row.name).split()))
+        ]
+        names = {normalize(row.name) for row in candidates}
+        if len(names) > 1:
+            # "pump" names many products; only an exact name picks one of them
+            candidates = [row for row in candidates if normalize(row.name) == query]
+            names = {query} if candidates else set()
+        if len(names) != 1:
+            return None
+        # Several rows for the same product (e.g. different sizes) are all shown
+        structured = [row for row in candidates if row.structured]
+        if not structured:
+            return None
+        # A PDF line or an unlabelled column quoting another price makes the answer doubtful
+        quoted = {value for row in structured for _, value in row.prices}
+        if any(not row.structured and not quoted & {value for _, value in row.prices} for row in candidates):
+            return None
+        return format_answer(structured, language)
+
+
+def format_answer(rows, language):
+    price_heading = "કિંમત" if language == "gu" else "Price"
+    lines = []
+    for row in rows:
+        title = f"{row.name} ({row.sku})" if row.sku else row.name
+        lines.append(title)
+        for label, value in row.prices:
+            label = label if not label.startswith("Column ") else price_heading
+            lines.append(f"- {label}: {format_price(value)}")
+        lines.append("")
+    source = "સ્ત્રોત" if language == "gu" else "Source"
+    lines.append(f"{source}: {rows[0].source}")
+    return "\n".join(lines)
@@ -0,0 +1,72 @@
+"""On-demand sampling profiler producing folded stacks for flame graphs.
+
+``SamplingProfiler`` samples the Python stack of every thread at a fixed
+interval from a native OS thread and counts identical stacks. The output is
+the "folded" format (``frame;frame;frame count`` per line) that
+flamegraph.pl, speedscope and inferno read directly. Under gevent workers
+the sampler still runs on a real thread (taken from gevent's saved
+originals), so it sees whichever greenlet currently holds the hub thread.
+"""
+import importlib
+import os
+import sys
+from collections import Counter
+
+
+def _original(module, name):
+    """``module.name`` as it was before gevent monkey-patching, if it was patched."""
+    if "gevent" in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched(module):
+            return monkey.get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._running = False
+        self._finished = False
+        self._thread_id = None
+
+    def start(self):
+        self._running = True
+        _original("_thread", "start_new_thread")(self._run, ())
+        return self
+
+    def _run(self):
+        sleep = _original("time", "sleep")
+        self._thread_id = _original("_thread", "get_ident")()
+        try:
+            while self._running:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == self._thread_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    if stack:
+                        self.samples[";".join(reversed(stack))] += 1
+                self.sample_count += 1
+                sleep(self.interval)
+        finally:
+            self._finished = True
+
+    def stop(self, wait=None):
+        """Stop sampling; ``wait(seconds)`` is the sleep used while the sampler finishes."""
+        self._running = False
+        wait = wait or _original("time", "sleep")
+        while not self._finished:
+            wait(self.interval)
+        return self
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
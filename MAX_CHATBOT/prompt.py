@@ -0,0 +1,163 @@
+"""Prompt assembly under a hard token budget.
+
+The part of the prompt that never changes between requests comes first: the
+answering instructions, the language rule and the corpus version. That
+prefix is byte-identical for every question asked against the same corpus
+in the same language, which is what upstream context caching matches on and
+what the local answer cache keys on. The per-question parts follow (product
+context, the conversation so far and the question), trimmed so the whole
+prompt stays within budget.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass
+
+from retrieval import estimate_tokens, select_context
+
+logger = logging.getLogger(__name__)
+
+INSTRUCTIONS = """You answer customer questions using the product information provided with each question.
+
+Important:
+- When providing price information, format it in a clear and readable way.
+- Use bullet points for different price types.
+- Separate prices with clear labels.
+- Use proper spacing and line breaks.
+- Avoid using asterisks or markdown formatting.
+- Make sure the response is easy to read and understand.
+- If possible, return a JSON object with a 'text' field for the answer and a 'prices' field as a list of price items (if relevant).
+"""
+
+LANGUAGE_RULES = {
+    "gu": (
+        "Respond ONLY in Gujarati language. Do NOT use English or any other language. "
+        "If you use any language other than Gujarati, it is incorrect. "
+        "All explanations, numbers, and price details must be in Gujarati."
+    ),
+    "en": (
+        "Respond ONLY in English language. Do NOT use Gujarati or any other language. "
+        "If you use any language other than English, it is incorrect. "
+        "All explanations, numbers, and price details must be in English."
+    ),
+}
+
+# Older turns that don't fit are summarised as the questions asked, each clipped
+SUMMARY_QUESTION_CHARS = 120
+
+
+def language_rule(language):
+    return LANGUAGE_RULES.get(language, f"Respond ONLY in {language} language. Do NOT use any other language.")
+
+
+def build_prefix(language, corpus_version):
+    """The stable head of every prompt for one language and corpus version."""
+    return f"{INSTRUCTIONS}\n{language_rule(language)}\n\nProduct catalogue version: {corpus_version}\n"
+
+
+def prefix_hash(language, corpus_version):
+    return hashlib.sha256(build_prefix(language, corpus_version).encode("utf-8")).hexdigest()[:16]
+
+
+def clip(text, token_budget):
+    """Cut ``text`` to roughly ``token_budget`` tokens."""
+    if estimate_tokens(text) <= token_budget:
+        return text
+    return text.encode("utf-8")[:max(0, token_budget) * 4].decode("utf-8", errors="ignore")
+
+
+def digest(question):
+    """A question squeezed onto one short line for history summaries."""
+    return " ".join(question.split())[:SUMMARY_QUESTION_CHARS]
+
+
+def _turn_line(turn):
+    return f"{turn['role'].capitalize()}: {turn['content']}"
+
+
+def trim_history(history, token_budget, summary=""):
+    """Most recent turns that fit; older user questions collapse into one summary line.
+
+    ``summary`` lists questions from turns that were already compacted away.
+    """
+    kept, used = [], 0
+    for turn in reversed(history):
+        line = _turn_line(turn)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+
+    older = history[:len(history) - len(kept)]
+    asked = ([summary] if summary else []) + [digest(turn["content"]) for turn in older if turn["role"] == "user"]
+    while asked:
+        line = "Earlier the user asked about: " + "; ".join(asked)
+        if used + estimate_tokens(line) + 1 <= token_budget:
+            kept.insert(0, line)
+            break
+        # Drop the oldest questions until the summary fits
+        asked.pop(0)
+    return "\n".join(kept)
+
+
+@dataclass(frozen=True)
+class Prompt:
+    text: str
+    prefix: str
+    sections: dict  # section name -> estimated tokens
+
+    @property
+    def key(self):
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+class PromptBuilder:
+    """Lay out prompts as stable prefix + product context + history + question.
+
+    ``token_budget`` caps the whole prompt; the question may use up to a
+    quarter of it, history up to ``history_budget``, and product context gets
+    the rest (at most ``context_budget``).
+    """
+
+    def __init__(self, token_budget=8000, context_budget=6000, history_budget=1000, top_k=20):
+        self.token_budget = token_budget
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.top_k = top_k
+
+    def build(self, snapshot, question, language, history=(), summary=""):
+        """Build the prompt for ``question``; ``history`` excludes the question itself."""
+        prefix = build_prefix(language, snapshot.version)
+        question = clip(question, self.token_budget // 4)
+        question_text = f"Answer the user's question: {question}\n"
+        remaining = self.token_budget - estimate_tokens(prefix) - estimate_tokens(question_text)
+
+        history_text = trim_history(list(history), min(self.history_budget, max(0, remaining // 2)), summary)
+        remaining -= estimate_tokens(history_text)
+
+        context_budget = max(0, min(self.context_budget, remaining - 32))  # 32 covers the section labels
+        context = select_context(snapshot, question, context_budget, self.top_k)
+        if not context and context_budget and snapshot.has_text:
+            # Even the best chunk is over budget: send part of it rather than nothing
+            context = select_context(snapshot, question, self.context_budget, 1)
+        if estimate_tokens(context) > context_budget:
+            context = clip(context, context_budget)
+
+        text = (
+            f"{prefix}\nBased on the following product information:\n{context}\n\n"
+            f"Conversation so far:\n{history_text}\n\n{question_text}"
+        )
+        sections = {
+            "prefix": estimate_tokens(prefix),
+            "context": estimate_tokens(context),
+            "history": estimate_tokens(history_text),
+            "question": estimate_tokens(question_text),
+            "total": estimate_tokens(text),
+        }
+        logger.info(
+            f"Prompt tokens: prefix={sections['prefix']} context={sections['context']} "
+            f"history={sections['history']} question={sections['question']} "
+            f"total={sections['total']}/{self.token_budget}"
+        )
+        return Prompt(text, prefix, sections)
@@ -0,0 +1,288 @@
+"""Chunking and a local BM25 index over the product corpus.
+
+Documents are split into chunks along the same ``--- Page N from file ---``
+boundaries the corpus text uses (and into groups of rows for spreadsheet
+dumps), and each query selects the best-scoring chunks that fit a token
+budget. The index is stored as one sparse term-frequency block per file, so a
+changed file only re-tokenises that file; unchanged blocks are shared
+between index versions.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+# Word characters plus the Gujarati and Devanagari blocks, so vowel signs
+# (which are not alphanumeric) don't split words apart.
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u097F\u0A80-\u0AFF]+")
+
+# Target size of a chunk and number of spreadsheet rows per chunk
+CHUNK_MAX_TOKENS = 400
+ROWS_PER_CHUNK = 40
+
+# Rebuild the vocabulary once fewer than this share of its terms are still used
+VOCABULARY_MIN_LIVE = 0.5
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def estimate_tokens(text):
+    """Rough token count; UTF-8 bytes / 4 also scales sensibly for Gujarati."""
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+@dataclass(frozen=True)
+class Chunk:
+    path: str
+    label: str
+    text: str
+
+    def render(self):
+        return f"\n--- {self.label} from {self.path} ---\n{self.text}\n"
+
+
+def line_tokens(line):
+    """What one line counts towards a chunk's ``CHUNK_MAX_TOKENS`` (its newline included)."""
+    return estimate_tokens(line) + 1
+
+
+def _split_lines(text, max_tokens):
+    """Group lines into pieces of at most ``max_tokens`` (a long line stays whole)."""
+    pieces, current, size = [], [], 0
+    for line in text.splitlines():
+        cost = line_tokens(line)
+        if current and size + cost > max_tokens:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += cost
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _split_rows(text, rows_per_chunk):
+    """Group spreadsheet rows, repeating the header line at the top of each group."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    header, rows = lines[0], lines[1:]
+    if not rows:
+        return [header]
+    return [
+        "\n".join([header] + rows[start:start + rows_per_chunk])
+        for start in range(0, len(rows), rows_per_chunk)
+    ]
+
+
+def _split_block(block, max_tokens):
+    """Split a spreadsheet block, repeating its heading on every piece.
+
+    New blocks always fit one chunk; this covers text serialised before they
+    were sized by tokens. The heading is the sheet line and any title lines
+    up to the first ``|``-delimited line (the header row).
+    """
+    lines = block.splitlines()
+    header_index = next((i for i, line in enumerate(lines) if "|" in line), None)
+    if header_index is None or header_index + 1 >= len(lines):
+        return _split_lines(block, max_tokens)
+    heading = lines[:header_index + 1]
+    budget = max(1, max_tokens - sum(line_tokens(line) for line in heading))
+    return ["\n".join(heading + [piece]) for piece in _split_lines("\n".join(lines[header_index + 1:]), budget)]
+
+
+def chunk_document(document):
+    """Split a corpus document into retrievable chunks."""
+    chunks = []
+    for page_num, text in document.pages:
+        if document.kind == "pdf":
+            for piece in _split_lines(text, CHUNK_MAX_TOKENS):
+                chunks.append(Chunk(document.path, f"Page {page_num}", piece))
+        elif "\n\n" in text:
+            # Compact spreadsheet text: blank-line separated blocks that each
+            # carry their own sheet name and header row, sized to fit one chunk
+            for block in text.split("\n\n"):
+                for piece in _split_block(block, CHUNK_MAX_TOKENS):
+                    chunks.append(Chunk(document.path, "Content", piece))
+        else:
+            # Legacy df.to_string() dumps: one header line, then rows
+            for piece in _split_rows(text, ROWS_PER_CHUNK):
+                chunks.append(Chunk(document.path, "Content", piece))
+    return tuple(chunks)
+
+
+@dataclass(frozen=True)
+class _Block:
+    """Term frequencies of one file's chunks."""
+    content_hash: str
+    chunks: tuple
+    tf: object  # scipy.sparse.csr_matrix, shape (len(chunks), vocabulary size at build time)
+    lengths: object  # np.ndarray of chunk lengths in tokens
+    df: object  # np.ndarray, number of chunks in this block containing each term
+
+
+class RetrievalIndex:
+    """Immutable BM25 index; ``updated()`` returns a new index sharing unchanged blocks."""
+
+    def __init__(self, vocabulary=None, blocks=None, k1=1.5, b=0.75):
+        # The vocabulary is append-only and shared between index versions, so
+        # term ids stay stable; older versions simply never see newer columns.
+        # ``updated()`` swaps in a fresh one once most terms are dead.
+        self.vocabulary = vocabulary if vocabulary is not None else {}
+        self.blocks = blocks or {}
+        self.k1 = k1
+        self.b = b
+        self.chunk_count = sum(len(block.chunks) for block in self.blocks.values())
+        self.total_length = float(sum(block.lengths.sum() for block in self.blocks.values()))
+        self.df = self._document_frequencies()
+
+    @classmethod
+    def from_arrays(cls, vocabulary, chunks, tf, lengths, df, k1=1.5, b=0.75):
+        """Single-block index over prebuilt arrays (see ``mapped_corpus``)."""
+        return cls(vocabulary, {"": _Block("", chunks, tf, lengths, df)}, k1, b)
+
+    def _document_frequencies(self):
+        df = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for block in self.blocks.values():
+            df[:len(block.df)] += block.df
+        return df
+
+    def _build_block(self, document):
+        if document.prepared is not None:
+            # Chunked and tokenised when the file was uploaded
+            chunks = tuple(Chunk(document.path, label, text) for label, text in document.prepared.chunks)
+            term_counts = document.prepared.terms
+        else:
+            chunks = chunk_document(document)
+            term_counts = [Counter(tokenize(chunk.text)) for chunk in chunks]
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float64)
+        for row, terms in enumerate(term_counts):
+            lengths[row] = sum(terms.values())
+            for token, count in terms.items():
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                rows.append(row)
+                cols.append(term_id)
+                counts.append(count)
+        tf = sparse.csr_matrix(
+            (np.array(counts, dtype=np.float64), (rows, cols)),
+            shape=(len(chunks), len(self.vocabulary)),
+        )
+        df = np.bincount(np.array(cols, dtype=np.int64), minlength=len(self.vocabulary))
+        return _Block(document.content_hash, chunks, tf, lengths, df)
+
+    def updated(self, documents):
+        """Return an index over ``documents``, re-tokenising only changed files."""
+        blocks = {}
+        for document in documents:
+            block = self.blocks.get(document.path)
+            if block is None or block.content_hash != document.content_hash:
+                block = self._build_block(document)
+            blocks[document.path] = block
+        index = RetrievalIndex(self.vocabulary, blocks, self.k1, self.b)
+        if np.count_nonzero(index.df) < VOCABULARY_MIN_LIVE * len(index.df):
+            # Terms of removed or replaced files would otherwise stay forever
+            index = index.compacted()
+        return index
+
+    def compacted(self):
+        """The same index over a new vocabulary holding only the terms its blocks use."""
+        live = np.flatnonzero(self.df)
+        new_ids = np.full(len(self.df), -1, dtype=np.int64)
+        new_ids[live] = np.arange(len(live))
+        vocabulary = {
+            token: int(new_ids[term_id]) for token, term_id in list(self.vocabulary.items())
+            if term_id < len(new_ids) and new_ids[term_id] >= 0
+        }
+        blocks = {}
+        for path, block in self.blocks.items():
+            tf = block.tf.tocoo()
+            df = np.zeros(len(live), dtype=np.int64)
+            used = np.flatnonzero(block.df)
+            df[new_ids[used]] = block.df[used]
+            blocks[path] = _Block(
+                block.content_hash,
+                block.chunks,
+                sparse.csr_matrix((tf.data, (tf.row, new_ids[tf.col])), shape=(len(block.chunks), len(live))),
+                block.lengths,
+                df,
+            )
+        return RetrievalIndex(vocabulary, blocks, self.k1, self.b)
+
+    def leading(self, token_budget):
+        """Chunks in corpus order until ``token_budget`` is used up."""
+        selected, used = [], 0
+        for path in sorted(self.blocks):
+            for chunk in self.blocks[path].chunks:
+                cost = estimate_tokens(chunk.render())
+                if used + cost > token_budget:
+                    return selected
+                selected.append(chunk)
+                used += cost
+        return selected
+
+    def search(self, query, token_budget, top_k=None):
+        """Return the best-scoring chunks for ``query`` that fit ``token_budget``."""
+        if not self.chunk_count:
+            return []
+        term_ids = sorted({
+            self.vocabulary[token] for token in tokenize(query)
+            if token in self.vocabulary and self.vocabulary[token] < len(self.df)
+        })
+        if not term_ids:
+            return []
+        term_ids = np.array(term_ids, dtype=np.int64)
+        df = self.df[term_ids]
+        idf = np.log1p((self.chunk_count - df + 0.5) / (df + 0.5))
+        avg_length = self.total_length / self.chunk_count or 1.0
+
+        scores, scored_blocks = [], []
+        for block in self.blocks.values():
+            if not block.chunks:
+                continue
+            scored_blocks.append(block)
+            present = term_ids < block.tf.shape[1]
+            tf = np.zeros((len(block.chunks), len(term_ids)))
+            if present.any():
+                tf[:, present] = block.tf[:, term_ids[present]].toarray()
+            norm = self.k1 * (1 - self.b + self.b * block.lengths / avg_length)
+            bm25 = (tf * (self.k1 + 1)) / (tf + norm[:, None])
+            scores.append(bm25 @ idf)
+        scores = np.concatenate(scores)
+        # Chunks are only looked up for selected positions (they may be decoded lazily)
+        starts = np.cumsum([0] + [len(block.chunks) for block in scored_blocks])
+
+        def chunk_at(position):
+            owner = int(np.searchsorted(starts, position, side="right")) - 1
+            return scored_blocks[owner].chunks[position - starts[owner]]
+
+        selected, used = [], 0
+        for position in np.argsort(-scores, kind="stable"):
+            if scores[position] <= 0 or (top_k is not None and len(selected) >= top_k):
+                break
+            chunk = chunk_at(position)
+            cost = estimate_tokens(chunk.render())
+            if used + cost > token_budget:
+                continue
+            selected.append(chunk)
+            used += cost
+        return selected
+
+
+def select_context(snapshot, query, token_budget, top_k=None):
+    """Product context for a prompt: the whole corpus if it fits, else the top chunks."""
+    if snapshot.text_tokens <= token_budget or snapshot.index is None:
+        return snapshot.text
+    chunks = snapshot.index.search(query, token_budget, top_k)
+    if not chunks:
+        # Nothing matched lexically (e.g. a greeting); fall back to the
+        # leading chunks of the corpus rather than an empty context
+        chunks = snapshot.index.leading(token_budget)
+    return "".join(chunk.render() for chunk in chunks)
+
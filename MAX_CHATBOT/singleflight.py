@@ -0,0 +1,116 @@
+"""Coalesce concurrent identical upstream calls into a single call.
+
+The first request for a key starts the upstream generator on a producer
+thread; every request for the same key (including the first) subscribes to
+the shared call and replays its chunks from the beginning as they arrive.
+An upstream error is delivered to every subscriber, and a subscriber that
+waits too long for the next chunk gives up with ``SingleFlightTimeout``
+without affecting the others.
+
+Whether a request leads or joins is decided under one lock, so per-call
+costs (such as an admission slot) can be paid on the leader path only,
+through ``on_lead``.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightTimeout(Exception):
+    """No chunk arrived from the shared call within the timeout."""
+
+
+class _Call:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def stream(self, key, start, timeout=None, on_lead=None):
+        """Yield the chunks of the in-flight call for ``key``, starting it with ``start()`` if needed.
+
+        ``timeout`` bounds how long a subscriber waits for each next chunk.
+        ``on_lead()`` runs only for the request that starts the call, before
+        ``start()``; if it raises, the call is abandoned and the error goes to
+        this caller and to every request that joined in the meantime.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.started += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            if on_lead is not None:
+                try:
+                    on_lead()
+                except BaseException as e:
+                    self._finish(key, call, e)
+                    raise
+            threading.Thread(target=self._produce, args=(key, call, start), name="singleflight", daemon=True).start()
+        else:
+            logger.info("Joined an identical in-flight upstream call")
+        return self._subscribe(call, timeout)
+
+    def _produce(self, key, call, start):
+        try:
+            for chunk in start():
+                with call.cond:
+                    call.chunks.append(chunk)
+                    call.cond.notify_all()
+        except BaseException as e:
+            call.error = e
+        finally:
+            self._finish(key, call, call.error)
+
+    def _finish(self, key, call, error):
+        # Later requests start a fresh call rather than replaying this one
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        with call.cond:
+            call.error = error
+            call.done = True
+            call.cond.notify_all()
+
+    @staticmethod
+    def _subscribe(call, timeout):
+        index = 0
+        while True:
+            with call.cond:
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                while index >= len(call.chunks) and not call.done:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise SingleFlightTimeout(f"No response from upstream within {timeout}s")
+                    call.cond.wait(remaining)
+                pending = call.chunks[index:]
+                index = len(call.chunks)
+                done, error = call.done, call.error
+            yield from pending
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def is_in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
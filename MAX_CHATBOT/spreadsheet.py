@@ -0,0 +1,117 @@
+"""Reading workbooks and serialising them compactly for prompts.
+
+``df.to_string()`` pads every column to a fixed width and only the first
+sheet was ever read. The serializer here covers every sheet, writes rows as
+``|``-delimited cells with empty cells and rows dropped, and repeats the
+sheet name and header row at the top of every block of rows so each block
+can be retrieved and read on its own. Blocks are filled up to the token
+budget retrieval chunks at, so a block is never split away from its heading.
+"""
+import io
+
+from price_table import find_header_row
+from retrieval import CHUNK_MAX_TOKENS, estimate_tokens, line_tokens
+
+SHEET_PREFIX = "Sheet: "
+DELIMITER = "|"
+
+
+def read_sheets(data):
+    """Raw cell rows of every sheet in a workbook, as ``(sheet_name, rows)`` pairs.
+
+    ``data`` is the workbook's bytes or the path of a local copy.
+    """
+    import pandas as pd
+    source = data if isinstance(data, str) else io.BytesIO(data)
+    sheets = pd.read_excel(source, sheet_name=None, header=None)
+    tables = []
+    for sheet_name, df in sheets.items():
+        df = df.astype(object).where(df.notna(), None)
+        tables.append((str(sheet_name), tuple(tuple(_plain(cell) for cell in row) for row in df.itertuples(index=False))))
+    return tuple(tables)
+
+
+def _plain(cell):
+    """Cells as JSON-friendly scalars."""
+    if cell is None or isinstance(cell, (str, int, float, bool)):
+        return cell
+    if hasattr(cell, "item"):
+        return cell.item()
+    return str(cell)
+
+
+def _cell_text(cell):
+    if cell is None:
+        return ""
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return " ".join(str(cell).split()).replace(DELIMITER, "/")
+
+
+def _row_text(row):
+    cells = [_cell_text(cell) for cell in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return DELIMITER.join(cells)
+
+
+def serialize_tables(tables, max_tokens=CHUNK_MAX_TOKENS):
+    """Compact text for all sheets; blocks of at most ``max_tokens`` are separated by blank lines.
+
+    Only a single row too wide to share a block with its heading makes a
+    block larger.
+    """
+    blocks = []
+    for sheet_name, rows in tables:
+        rows = [row for row in rows if any(cell not in (None, "") for cell in row)]
+        if not rows:
+            continue
+        # Drop columns that are empty in every row
+        width = max(len(row) for row in rows)
+        keep = [col for col in range(width) if any(col < len(row) and row[col] not in (None, "") for row in rows)]
+        rows = [[row[col] if col < len(row) else None for col in keep] for row in rows]
+
+        header_index = find_header_row(rows)
+        titles = [_row_text(row) for row in rows[:header_index]]
+        header = _row_text(rows[header_index])
+        body = [_row_text(row) for row in rows[header_index + 1:]]
+        heading = [f"{SHEET_PREFIX}{sheet_name}"] + titles + [header]
+        heading_tokens = sum(line_tokens(line) for line in heading)
+        block, size = [], heading_tokens
+        for row in body:
+            cost = line_tokens(row)
+            if block and size + cost > max_tokens:
+                blocks.append("\n".join(heading + block))
+                block, size = [], heading_tokens
+            block.append(row)
+            size += cost
+        if block or not body:
+            blocks.append("\n".join(heading + block))
+    return "\n\n".join(blocks)
+
+
+def legacy_text(tables):
+    """What ``df.to_string()`` would have produced for the same sheets."""
+    import pandas as pd
+    parts = []
+    for _, rows in tables:
+        if rows:
+            parts.append(pd.DataFrame(list(rows[1:]), columns=list(rows[0])).to_string())
+    return "\n".join(parts)
+
+
+def serialize_workbook(data):
+    """Serialise a workbook; returns ``(tables, text, report)``."""
+    tables = read_sheets(data)
+    text = serialize_tables(tables)
+    baseline = legacy_text(tables)
+    report = {
+        "sheets": len(tables),
+        "bytes": len(text.encode("utf-8")),
+        "tokens": estimate_tokens(text),
+        "baseline_bytes": len(baseline.encode("utf-8")),
+        "baseline_tokens": estimate_tokens(baseline),
+    }
+    report["bytes_saved"] = report["baseline_bytes"] - report["bytes"]
+    report["tokens_saved"] = report["baseline_tokens"] - report["tokens"]
+    return tables, text, report
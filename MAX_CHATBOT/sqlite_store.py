@@ -0,0 +1,54 @@
+"""One SQLite connection per process for the small shared stores.
+
+The answer cache and conversation store used a connection per thread, but
+under gevent workers ``threading.local`` is per greenlet: every request
+opened (and never closed) a new connection and re-ran the PRAGMAs, and a
+busy database blocked the whole event loop in ``connect``. ``SharedDatabase``
+keeps a single connection per process, serialises its use with a lock and
+runs each call through ``offload.run_cpu_bound`` so waiting on SQLite's busy
+timeout parks one greenlet rather than the hub. The busy timeout is short:
+these stores are caches and history, and a request is better off skipping
+them than queueing behind another worker's write.
+"""
+import os
+import sqlite3
+import threading
+
+from offload import run_cpu_bound
+
+# Seconds to wait for another process's write lock before giving up
+BUSY_TIMEOUT = 0.5
+
+
+class SharedDatabase:
+    def __init__(self, path, busy_timeout=BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def run(self, func, *args):
+        """Return ``func(conn, *args)``, run with this process's connection."""
+        with self._lock:
+            return run_cpu_bound(self._call, func, args)
+
+    def _call(self, func, args):
+        return func(self._connection(), *args)
+
+    def _connection(self):
+        # A connection inherited through fork must not be used by the child
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
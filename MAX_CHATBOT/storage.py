@@ -0,0 +1,320 @@
+"""Storage backends that stand in for Supabase Storage (and the client itself).
+
+The app only uses a handful of bucket calls: ``list``, ``download``,
+``upload``, ``remove`` and ``get_public_url``, plus ``get_bucket`` and
+``table(...)`` on the client. ``StorageBucket`` implements the bucket calls
+with the same argument and return shapes as the Supabase client (folders are
+listed as entries without an id, objects carry ``size``/``lastModified``/
+``eTag`` metadata), so change detection and ingestion work unchanged on:
+
+- ``LocalStorageBucket``: a directory on disk (``PDF_DIRECTORY``); listing
+  metadata comes from file size and mtime, and ``watch()`` reports changes
+  through watchdog (inotify and friends) when installed, else by polling.
+- ``MemoryStorageBucket``: a dict, for tests and benchmarks.
+
+``FakeSupabaseClient`` wraps buckets and in-memory tables so the whole
+ingestion and chat pipeline can run offline.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+
+class StorageError(Exception):
+    """Raised for the errors Supabase Storage reports (missing or duplicate objects)."""
+
+
+def _iso(timestamp):
+    # Fixed-width UTC timestamps compare correctly as strings
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _upsert(file_options):
+    return str((file_options or {}).get("x-upsert", "false")).lower() == "true"
+
+
+def _read(data):
+    if hasattr(data, "read"):
+        return data.read()
+    if isinstance(data, str):
+        # supabase-py accepts a local file path
+        with open(data, "rb") as f:
+            return f.read()
+    return bytes(data)
+
+
+class StorageBucket:
+    """Supabase-compatible bucket API over ``_objects()``, ``_read_object()`` etc."""
+
+    def _objects(self):
+        """Yield ``(path, size, modified_timestamp)`` for every object."""
+        raise NotImplementedError
+
+    def _read_object(self, path):
+        raise NotImplementedError
+
+    def _write_object(self, path, data):
+        raise NotImplementedError
+
+    def _delete_object(self, path):
+        """Delete an object; returns False if it didn't exist."""
+        raise NotImplementedError
+
+    def _exists(self, path):
+        raise NotImplementedError
+
+    def list(self, path=None, options=None):
+        """Entries directly under ``path``; sub-folders come back with ``id`` None."""
+        prefix = (path or "").strip("/")
+        prefix = f"{prefix}/" if prefix else ""
+        options = options or {}
+        files, folders = {}, set()
+        for object_path, size, modified in self._objects():
+            if not object_path.startswith(prefix):
+                continue
+            name, _, rest = object_path[len(prefix):].partition("/")
+            if rest:
+                folders.add(name)
+            else:
+                files[name] = (object_path, size, modified)
+        entries = [{"name": name, "id": None, "updated_at": None, "metadata": None} for name in folders]
+        for name, (object_path, size, modified) in files.items():
+            entries.append({
+                "name": name,
+                "id": object_path,
+                "updated_at": _iso(modified),
+                "metadata": {
+                    "size": size,
+                    "lastModified": _iso(modified),
+                    "eTag": f'"{size:x}-{int(modified * 1e6):x}"',
+                },
+            })
+        sort = options.get("sortBy") or {}
+        entries.sort(key=lambda entry: entry.get(sort.get("column", "name")) or "",
+                     reverse=sort.get("order") == "desc")
+        offset = options.get("offset", 0)
+        return entries[offset:offset + options.get("limit", 100)]
+
+    def download(self, path):
+        try:
+            return self._read_object(path)
+        except (FileNotFoundError, KeyError):
+            raise StorageError(f"Object not found: {path}")
+
+    def upload(self, path, file, file_options=None):
+        if self._exists(path) and not _upsert(file_options):
+            raise StorageError(f"The resource already exists: {path}")
+        self._write_object(path, _read(file))
+        return SimpleNamespace(path=path)
+
+    def remove(self, paths):
+        removed = [path for path in paths if self._delete_object(path)]
+        return [{"name": path} for path in removed]
+
+    def get_public_url(self, path):
+        raise NotImplementedError
+
+
+class MemoryStorageBucket(StorageBucket):
+    """Objects kept in a dict of path -> (bytes, modified timestamp)."""
+
+    def __init__(self, objects=None, public_url="memory://"):
+        self.objects = dict(objects or {})
+        self.public_url = public_url
+        self._lock = threading.Lock()
+
+    def _objects(self):
+        with self._lock:
+            items = list(self.objects.items())
+        return [(path, len(data), modified) for path, (data, modified) in items]
+
+    def _read_object(self, path):
+        return self.objects[path][0]
+
+    def _write_object(self, path, data):
+        with self._lock:
+            # Keep mtimes strictly increasing so rewrites always look changed
+            previous = self.objects.get(path, (None, 0.0))[1]
+            self.objects[path] = (data, max(time.time(), previous + 1e-6))
+
+    def _delete_object(self, path):
+        with self._lock:
+            return self.objects.pop(path, None) is not None
+
+    def _exists(self, path):
+        return path in self.objects
+
+    def get_public_url(self, path):
+        return f"{self.public_url}{path}"
+
+
+class LocalStorageBucket(StorageBucket):
+    """A directory on disk; object paths are relative paths under ``root``."""
+
+    def __init__(self, root, public_url=None):
+        self.root = os.path.abspath(root)
+        self.public_url = public_url
+        os.makedirs(self.root, exist_ok=True)
+
+    def _full_path(self, path):
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full_path]) != self.root:
+            raise StorageError(f"Invalid object path: {path}")
+        return full_path
+
+    def _objects(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                full_path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                yield relative, stat.st_size, stat.st_mtime
+
+    def _read_object(self, path):
+        with open(self._full_path(path), "rb") as f:
+            return f.read()
+
+    def _write_object(self, path, data):
+        full_path = self._full_path(path)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so listings never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, full_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _delete_object(self, path):
+        try:
+            os.remove(self._full_path(path))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _exists(self, path):
+        return os.path.isfile(self._full_path(path))
+
+    def get_public_url(self, path):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{path}"
+        return f"file://{self._full_path(path)}"
+
+    def watch(self, on_change, interval=1.0):
+        """Call ``on_change()`` whenever files under ``root`` change; returns a stop function.
+
+        Uses watchdog's native observers when available and falls back to
+        polling a (path, size, mtime) stamp of the tree every ``interval``.
+        """
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return self._poll(on_change, interval)
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not os.path.basename(event.src_path).startswith(".tmp-"):
+                    on_change()
+
+        observer = Observer()
+        observer.schedule(Handler(), self.root, recursive=True)
+        observer.daemon = True
+        observer.start()
+        logger.info(f"Watching {self.root} for changes")
+
+        def stop():
+            observer.stop()
+        return stop
+
+    def _poll(self, on_change, interval):
+        stopped = threading.Event()
+
+        def run():
+            stamp = sorted(self._objects())
+            while not stopped.wait(interval):
+                current = sorted(self._objects())
+                if current != stamp:
+                    stamp = current
+                    on_change()
+
+        threading.Thread(target=run, name="storage-watch", daemon=True).start()
+        logger.info(f"Polling {self.root} for changes every {interval}s")
+        return stopped.set
+
+
+class FakeTable:
+    """In-memory stand-in for the few PostgREST calls the app makes."""
+
+    def __init__(self):
+        self.rows = []
+        self._lock = threading.Lock()
+
+    def select(self, columns="*"):
+        return _Query(self, "select", columns=columns)
+
+    def insert(self, rows):
+        return _Query(self, "insert", rows=rows if isinstance(rows, list) else [rows])
+
+
+class _Query:
+    def __init__(self, table, action, columns="*", rows=None):
+        self.table = table
+        self.action = action
+        self.columns = columns
+        self.rows = rows or []
+        self.filters = []
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def execute(self):
+        with self.table._lock:
+            if self.action == "insert":
+                inserted = []
+                for row in self.rows:
+                    row = dict(row)
+                    row.setdefault("id", len(self.table.rows) + 1)
+                    self.table.rows.append(row)
+                    inserted.append(row)
+                return SimpleNamespace(data=inserted)
+            rows = [row for row in self.table.rows if all(row.get(column) == value for column, value in self.filters)]
+        if self.columns != "*":
+            columns = [column.strip() for column in self.columns.split(",")]
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return SimpleNamespace(data=rows)
+
+
+class FakeSupabaseClient:
+    """In-process Supabase client: named buckets plus in-memory tables."""
+
+    def __init__(self, buckets):
+        self.buckets = dict(buckets)
+        self.tables = {}
+        self._lock = threading.Lock()
+        self.storage = SimpleNamespace(from_=self._bucket, get_bucket=self._bucket)
+
+    def _bucket(self, name):
+        if name not in self.buckets:
+            raise StorageError(f"Bucket not found: {name}")
+        return self.buckets[name]
+
+    def table(self, name):
+        with self._lock:
+            return self.tables.setdefault(name, FakeTable())
@@ -0,0 +1,207 @@
+"""Per-tenant corpora, loaded on demand and evicted under a memory cap.
+
+Every admin uploads into their own ``<user_id>/`` folder; each such folder is
+a tenant with its own snapshot, index, manifest and warm snapshot file. The
+tenant ``""`` covers the whole bucket, which is what single-shop deployments
+(and chats that don't name a tenant) use. Tenants are loaded in a background
+thread the first time a chat asks for them; once the estimated size of all
+loaded tenants goes over ``max_bytes`` the least recently used ones are
+dropped from memory and reloaded from their warm snapshot when next needed.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from corpus import CorpusStore
+
+logger = logging.getLogger(__name__)
+
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_tenant_id(tenant_id):
+    return tenant_id == "" or bool(TENANT_ID_PATTERN.match(tenant_id))
+
+
+def snapshot_size(snapshot):
+    """Rough resident size of a snapshot in bytes."""
+    if hasattr(snapshot, "resident_bytes"):
+        # Mapped snapshots keep their bulk in the shared page cache
+        return snapshot.resident_bytes
+    text_bytes = len(snapshot.text.encode("utf-8"))
+    index_bytes = 0
+    if snapshot.index is not None:
+        for block in snapshot.index.blocks.values():
+            # CSR data, indices and the chunk texts themselves
+            index_bytes += block.tf.nnz * 12 + sum(len(chunk.text) for chunk in block.chunks)
+    # Document pages hold the same text again as the rendered corpus
+    return 2 * text_bytes + index_bytes
+
+
+class TenantCorpus:
+    """One tenant's corpus plus what is needed to refresh it."""
+
+    def __init__(self, tenant_id, manifest, snapshot_path, mapped_path=None, lease=None):
+        self.tenant_id = tenant_id
+        self.prefix = tenant_id
+        self.store = CorpusStore()
+        self.manifest = manifest  # change_detection.Manifest (possibly lazy)
+        self.snapshot_path = snapshot_path
+        # Snapshot file shared with other workers, and who may write it
+        self.mapped_path = mapped_path
+        self.lease = lease  # mapped_corpus.RefreshLease
+        self.mapped_stamp = None
+        self.ready = threading.Event()
+        # Serialises refreshes between the loader and the background refresher
+        self.refresh_lock = threading.Lock()
+        self.size = 0
+        self.last_used = time.monotonic()
+
+    def current(self):
+        return self.store.current()
+
+    def close(self):
+        """Give up refreshing this tenant and remove its mapped snapshot.
+
+        The mapped file only goes when no other worker holds the lease; a
+        worker still following it keeps its mapping and rewrites the file
+        once it takes the lease on its next poll. The lock file itself stays:
+        unlinking it would let one worker lock the old inode and another a
+        new file at the same path, both believing they hold the lease. The
+        warm snapshot and manifest stay too, so the tenant reloads quickly.
+        """
+        if self.lease is None:
+            return
+        if self.lease.acquire():
+            try:
+                os.remove(self.mapped_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove {self.mapped_path}: {str(e)}")
+        self.lease.release()
+
+
+class TenantCorpora:
+    """LRU map of tenant id -> ``TenantCorpus``.
+
+    ``factory(tenant_id)`` creates an unloaded tenant and ``loader(tenant)``
+    fills it (it runs on its own thread and must set ``tenant.ready``).
+    Tenants in ``pinned`` are never evicted.
+    """
+
+    def __init__(self, factory, loader, max_bytes=512 * 1024 * 1024, max_tenants=256, pinned=()):
+        self.factory = factory
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_tenants = max_tenants
+        self.pinned = set(pinned)
+        self._lock = threading.Lock()
+        self._tenants = OrderedDict()
+        self.counters = {"loads": 0, "evictions": 0}
+
+    def get(self, tenant_id):
+        """Return the tenant, starting a background load the first time it is seen."""
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                tenant.last_used = time.monotonic()
+                return tenant
+            tenant = self.factory(tenant_id)
+            self._tenants[tenant_id] = tenant
+            self.counters["loads"] += 1
+        threading.Thread(
+            target=self._load, args=(tenant,), name=f"tenant-load-{tenant_id or 'all'}", daemon=True
+        ).start()
+        return tenant
+
+    def _load(self, tenant):
+        try:
+            self.loader(tenant)
+        except Exception as e:
+            logger.error(f"Failed to load tenant '{tenant.tenant_id}': {str(e)}")
+        finally:
+            tenant.ready.set()
+        self.evict()
+
+    def loaded(self):
+        with self._lock:
+            return list(self._tenants.values())
+
+    def evict(self):
+        """Drop least recently used tenants until the size and count caps hold."""
+        with self._lock:
+            total = sum(tenant.size for tenant in self._tenants.values())
+            for tenant_id in list(self._tenants):
+                if total <= self.max_bytes and len(self._tenants) <= self.max_tenants:
+                    break
+                tenant = self._tenants[tenant_id]
+                if tenant_id in self.pinned or not tenant.ready.is_set():
+                    continue
+                del self._tenants[tenant_id]
+                tenant.close()
+                total -= tenant.size
+                self.counters["evictions"] += 1
+                logger.info(f"Evicted tenant '{tenant_id}' ({tenant.size} bytes) from memory")
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                loaded=len(self._tenants),
+                bytes=sum(tenant.size for tenant in self._tenants.values()),
+            )
+
+
+class TenantDirectory:
+    """Which tenant ids chats may name: configured ones plus the bucket's folders.
+
+    ``list_folders()`` returns the top-level folder names in storage. The
+    listing is cached for ``ttl`` seconds and an unknown id only triggers a
+    new one once the cache is that old, so made-up ids can neither create
+    tenants nor turn every chat into a storage call.
+    """
+
+    def __init__(self, list_folders, configured=(), ttl=60.0):
+        self.list_folders = list_folders
+        self.configured = set(configured)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._folders = set()
+        self._listed_at = None
+
+    def add(self, tenant_id):
+        """Record a folder this process has just written to."""
+        with self._lock:
+            self._folders.add(tenant_id)
+
+    def known(self, tenant_id):
+        if tenant_id in self.configured:
+            return True
+        with self._lock:
+            if tenant_id in self._folders:
+                return True
+            if self._listed_at is not None and time.monotonic() - self._listed_at < self.ttl:
+                return False
+            try:
+                self._folders = set(self.list_folders())
+            except Exception as e:
+                logger.warning(f"Could not list tenant folders: {str(e)}")
+            self._listed_at = time.monotonic()
+            return tenant_id in self._folders
+
+
+def tenant_paths(cache_dir, tenant_id):
+    """Manifest and warm snapshot locations for a tenant."""
+    directory = os.path.join(cache_dir, "tenants", tenant_id)
+    return os.path.join(directory, "manifest.json"), os.path.join(directory, "corpus-snapshot.pickle")
+
+
+def shared_paths(snapshot_path):
+    """Mapped snapshot and refresh lock file that sit next to a warm snapshot."""
+    base = os.path.splitext(snapshot_path)[0]
+    return f"{base}.mapped", f"{base}.lock"
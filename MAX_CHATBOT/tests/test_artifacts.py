@@ -0,0 +1,20 @@
+from artifacts import publish_artifact, remove_artifacts
+from storage import MemoryStorageBucket
+
+
+def artifact_names(bucket):
+    return sorted(path for path in bucket.objects if "/.artifacts/" in path)
+
+
+def test_artifacts_of_a_file_whose_name_prefixes_another_are_kept_apart():
+    bucket = MemoryStorageBucket()
+    publish_artifact(bucket, "u1/prices.xlsx.txt", "h1", {"version": 0})
+    publish_artifact(bucket, "u1/prices.xlsx", "h2", {"version": 0})
+    assert artifact_names(bucket) == ["u1/.artifacts/prices.xlsx.h2.json", "u1/.artifacts/prices.xlsx.txt.h1.json"]
+
+    # A new upload only replaces its own artifact
+    publish_artifact(bucket, "u1/prices.xlsx", "h3", {"version": 0})
+    assert artifact_names(bucket) == ["u1/.artifacts/prices.xlsx.h3.json", "u1/.artifacts/prices.xlsx.txt.h1.json"]
+
+    remove_artifacts(bucket, "u1/prices.xlsx")
+    assert artifact_names(bucket) == ["u1/.artifacts/prices.xlsx.txt.h1.json"]
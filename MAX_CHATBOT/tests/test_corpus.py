@@ -0,0 +1,35 @@
+import os
+
+from corpus import CorpusStore, Document, load_snapshot, save_snapshot
+
+
+def snapshot():
+    store = CorpusStore()
+    published, _ = store.publish([Document("a.txt", "1", "text", ((1, "Pump P-1 costs 100 EUR"),))])
+    return published
+
+
+def test_snapshots_round_trip_through_a_private_directory(tmp_path):
+    path = str(tmp_path / "snapshots" / "corpus-snapshot.pickle")
+    save_snapshot(snapshot(), path)
+
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+    assert load_snapshot(path).version == snapshot().version
+
+
+def test_snapshots_others_could_have_written_are_not_unpickled(tmp_path):
+    directory = tmp_path / "snapshots"
+    path = str(directory / "corpus-snapshot.pickle")
+    save_snapshot(snapshot(), path)
+
+    os.chmod(directory, 0o777)
+    assert load_snapshot(path) is None
+    os.chmod(directory, 0o700)
+    os.chmod(path, 0o666)
+    assert load_snapshot(path) is None
+    os.chmod(path, 0o600)
+    assert load_snapshot(path) is not None
+
+
+def test_missing_snapshots_load_as_none(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing.pickle")) is None
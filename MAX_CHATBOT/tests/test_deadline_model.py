@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from deadline_model import DeadlineExceeded, DeadlineModel
+from fake_gemini import FakeGeminiModel, FakeStream, FakeUnavailable
+
+
+class InvalidArgument(Exception):
+    """Named like the SDK's 400, which a retry won't fix."""
+
+
+class ScriptedModel(FakeGeminiModel):
+    """Each call follows the next ``(first_token_delay, error)`` plan."""
+
+    def __init__(self, *plans):
+        super().__init__(tokens_per_second=0, answer_tokens=6, chunk_tokens=2)
+        self.plans = list(plans)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            delay, error = self.plans[self.calls]
+            self.calls += 1
+        if error is not None and not isinstance(error, FakeUnavailable):
+            raise error
+        return FakeStream(self, self._answer_words(prompt), delay, error is not None)
+
+
+def answer(model, deadline=5.0, **options):
+    gemini = DeadlineModel(model, backoff=0.01, **options)
+    chunks = gemini.stream("Answer the user's question: pump price", time.monotonic() + deadline)
+    return "".join(chunk.text for chunk in chunks), gemini
+
+
+def test_failed_attempts_are_retried():
+    model = ScriptedModel((0, FakeUnavailable("503")), (0, None))
+    text, gemini = answer(model)
+    assert text == "pump price pump price pump price"
+    assert model.calls == 2
+    assert gemini.stats()["retries"] == 1
+
+
+def test_errors_a_retry_would_not_fix_are_raised_at_once():
+    model = ScriptedModel((0, InvalidArgument("bad prompt")), (0, None))
+    with pytest.raises(InvalidArgument):
+        answer(model)
+    assert model.calls == 1
+
+
+def test_retries_stop_at_max_attempts():
+    model = ScriptedModel(*[(0, FakeUnavailable("503"))] * 5)
+    with pytest.raises(FakeUnavailable):
+        answer(model, max_attempts=3)
+    assert model.calls == 3
+
+
+def test_a_hedge_answers_for_a_slow_attempt_and_the_loser_is_cancelled():
+    model = ScriptedModel((10.0, None), (0, None))
+    started = time.monotonic()
+    text, gemini = answer(model, hedge=True, hedge_initial_delay=0.05, hedge_min_delay=0.05)
+    assert text.startswith("pump price")
+    assert time.monotonic() - started < 2.0
+    stats = gemini.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1 and stats["cancelled"] == 1
+    # The slow attempt stops waiting instead of running to the end
+    for _ in range(100):
+        if model.cancelled:
+            break
+        time.sleep(0.01)
+    assert model.cancelled == 1
+
+
+def test_calls_give_up_at_the_deadline():
+    model = ScriptedModel((10.0, None))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        answer(model, deadline=0.1)
+    assert time.monotonic() - started < 2.0
+    for _ in range(100):
+        if model.cancelled:
+            break
+        time.sleep(0.01)
+    assert model.cancelled == 1
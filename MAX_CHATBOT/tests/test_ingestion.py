@@ -0,0 +1,83 @@
+from change_detection import Manifest, list_bucket_objects
+from extraction_cache import ExtractionCache
+from ingestion import IngestionPipeline
+from storage import MemoryStorageBucket
+
+
+def poll(pipeline, bucket, manifest):
+    """One refresh as ``extract_pdf_text`` does it: unchanged objects from the manifest, the rest ingested."""
+    entries, changed = {}, []
+    for obj in list_bucket_objects(bucket):
+        document = manifest.lookup(obj)
+        if document is not None:
+            entries[obj.path] = (obj.fingerprint, document)
+        else:
+            changed.append(obj)
+    if changed:
+        entries.update(pipeline.run(bucket, changed, manifest.previous))
+    manifest.replace(entries)
+    return {path: document for path, (_, document) in entries.items()}
+
+
+def setup(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    pipeline = IngestionPipeline(cache, download_workers=2, extract_processes=0)
+    manifest = Manifest(str(tmp_path / "manifest.json"), cache)
+    return pipeline, manifest
+
+
+def text_of(documents, path):
+    return "".join(text for _, text in documents[path].pages)
+
+
+def test_corrupt_reupload_keeps_last_good_version_across_polls(tmp_path):
+    pipeline, manifest = setup(tmp_path)
+    bucket = MemoryStorageBucket({"u/prices.txt": (b"Gate valve 950", 1.0)})
+    assert text_of(poll(pipeline, bucket, manifest), "u/prices.txt") == "Gate valve 950"
+
+    # Overwritten with content that can't be parsed (invalid UTF-8)
+    bucket.objects["u/prices.txt"] = (b"\xff\xfe\xfa broken", 2.0)
+    downloads = []
+    original_download = bucket.download
+    bucket.download = lambda path: downloads.append(path) or original_download(path)
+
+    for _ in range(3):
+        documents = poll(pipeline, bucket, manifest)
+        assert text_of(documents, "u/prices.txt") == "Gate valve 950"
+    # The corrupt version is downloaded once, not on every poll
+    assert downloads == ["u/prices.txt"]
+
+    # A fixed upload replaces it
+    bucket.objects["u/prices.txt"] = (b"Gate valve 990", 3.0)
+    assert text_of(poll(pipeline, bucket, manifest), "u/prices.txt") == "Gate valve 990"
+
+
+def test_corrupt_pdf_without_previous_version_is_left_out(tmp_path):
+    pipeline, manifest = setup(tmp_path)
+    bucket = MemoryStorageBucket({"u/new.pdf": (b"%PDF-1.4 not really", 1.0), "u/ok.txt": (b"Ball valve 480", 1.0)})
+    for _ in range(2):
+        documents = poll(pipeline, bucket, manifest)
+        assert sorted(documents) == ["u/ok.txt"]
+
+
+def test_extraction_cache_tracks_its_size_without_rescanning(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=1000)
+    artifact = {"text": "x" * 180}
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: (scans.append(1), scan()))
+
+    for i in range(4):
+        cache.put(f"{i:032x}", artifact)
+    assert len(scans) == 1  # only the first use
+    assert cache.get(f"{0:032x}") == artifact  # now the most recently used
+
+    cache.put(f"{4:032x}", artifact)
+    assert len(scans) == 1
+    # Going over the cap rescans once and trims below it, oldest first
+    cache.put(f"{5:032x}", artifact)
+    assert len(scans) == 2
+    assert cache.size() <= 900
+    assert cache.get(f"{0:032x}") == artifact
+    assert cache.get(f"{1:032x}") is None
+    assert cache.get(f"{5:032x}") == artifact
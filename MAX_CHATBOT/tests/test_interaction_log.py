@@ -0,0 +1,45 @@
+import json
+import os
+import time
+
+from interaction_log import InteractionLogger
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_corrupt_spill_line_is_skipped_and_logging_carries_on(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    with open(spill_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"query": "spilled"}) + "\n")
+        # A crash in the middle of a write
+        f.write('{"query": "trunc')
+    written = []
+    interactions = InteractionLogger(written.extend, batch_size=1, flush_interval=0.05, spill_path=spill_path)
+    interactions.start()
+    try:
+        assert wait_for(lambda: {"query": "spilled"} in written)
+        interactions.log({"query": "later"})
+        assert wait_for(lambda: {"query": "later"} in written)
+        assert interactions._thread.is_alive()
+    finally:
+        interactions.stop()
+    assert written.count({"query": "spilled"}) == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".replay")]
+
+
+def test_a_replay_file_left_behind_is_retried(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    with open(f"{spill_path}.{os.getpid()}.replay", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"query": "left behind"}) + "\n")
+    written = []
+    interactions = InteractionLogger(written.extend, flush_interval=0.05, spill_path=spill_path)
+    interactions.start()
+    try:
+        assert wait_for(lambda: {"query": "left behind"} in written)
+    finally:
+        interactions.stop()
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("gevent")
+
+SCRIPT = textwrap.dedent("""
+    from gevent import monkey; monkey.patch_all()
+    import threading, time, gevent
+    from offload import run_cpu_bound
+
+    def busy():
+        # Pure-Python work that never yields, like building an index
+        end = time.monotonic() + 0.5
+        while time.monotonic() < end:
+            sum(range(1000))
+        return threading.get_ident()
+
+    gaps = []
+    def tick():
+        last = time.monotonic()
+        while True:
+            gevent.sleep(0.01)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+
+    gevent.spawn(tick)
+    result = []
+    loader = threading.Thread(target=lambda: result.append(run_cpu_bound(busy)))
+    loader.start()
+    loader.join()
+    print(max(gaps, default=1.0), result[0] != threading.get_ident())
+""")
+
+
+def test_cpu_bound_work_leaves_the_gevent_hub_responsive():
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=directory, capture_output=True, text=True, timeout=60, check=True
+    ).stdout.split()
+    max_gap, native = float(output[0]), output[1] == "True"
+    assert native
+    assert max_gap < 0.25
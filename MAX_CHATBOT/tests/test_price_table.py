@@ -0,0 +1,87 @@
+from corpus import Document
+from price_table import PriceTable, document_rows, rows_from_pdf_pages, rows_from_sheet
+
+SHEET = [
+    ["Acme Pumps price list", None, None, None],
+    ["Product", "Code", "MRP", "Dealer Price"],
+    ["Monoblock Pump 1HP", "MP-1", 5400, 4300],
+    ["Monoblock Pump 2HP", "MP-2", 7900, 6300],
+    ["Submersible Pump 1.5HP", "SP-15", "₹ 12,500", "10,000"],
+    ["Gate Valve 2in", "GV-2", 950, 760],
+    ["Ball Valve", "BV", 480, 400],
+]
+
+
+def table(*documents):
+    return PriceTable.from_documents(documents)
+
+
+def sheet_document(rows=SHEET, path="acme.xlsx"):
+    return Document(path, "", "sheet", (), (("Sheet1", tuple(tuple(row) for row in rows)),))
+
+
+def pdf_document(text, path="brochure.pdf"):
+    return Document(path, "", "pdf", ((1, text),), ())
+
+
+def test_answers_from_named_price_columns():
+    answer = table(sheet_document()).answer("price of gate valve 2in", "en")
+    assert "Gate Valve 2in (GV-2)" in answer
+    assert "- MRP: ₹950" in answer
+    assert "- Dealer Price: ₹760" in answer
+    assert "Source: acme.xlsx (Sheet1)" in answer
+
+
+def test_answers_by_sku():
+    answer = table(sheet_document()).answer("price of SP-15", "en")
+    assert "Submersible Pump 1.5HP" in answer
+    assert "- MRP: ₹12,500" in answer
+
+
+def test_words_shared_by_several_products_fall_back():
+    assert table(sheet_document()).answer("price of monoblock pump", "en") is None
+    assert table(sheet_document()).answer("what is the price of pump", "en") is None
+
+
+def test_words_not_in_any_product_name_fall_back():
+    # Trigram overlap alone is not a match
+    assert table(sheet_document()).answer("price of gate", "en") is not None
+    assert table(sheet_document()).answer("price of gates valves", "en") is None
+
+
+def test_open_ended_questions_fall_back():
+    assert table(sheet_document()).answer("which is the cheapest pump", "en") is None
+
+
+def test_unlabelled_price_columns_do_not_answer():
+    rows = [["Product", "Code", "Column"], ["Gate Valve 2in", "GV-2", 950]]
+    rows_ = rows_from_sheet("(Sheet1)", rows)
+    assert [row.structured for row in rows_] == [False]
+    assert table(sheet_document(rows)).answer("price of gate valve 2in", "en") is None
+
+
+def test_pdf_lines_with_several_numbers_are_skipped():
+    rows = rows_from_pdf_pages("", [(1, "Monoblock Pump 1HP MRP 5400 Dealer 4300\nGate Valve MRP 950\nContact: 9876543210 or 9876543211")])
+    assert [(row.name, row.prices) for row in rows] == [("Gate Valve MRP", (("Price", 950.0),))]
+    assert not rows[0].structured
+
+
+def test_pdf_rows_never_answer_on_their_own():
+    brochure = pdf_document("Monoblock Pump 1HP MRP 5400 Dealer 4300\nContact: 9876543210\nGST 18%\nGST 18")
+    prices = table(brochure)
+    assert prices.answer("monoblock pump mrp", "en") is None
+    assert prices.answer("price of contact", "en") is None
+    assert prices.answer("price of gst", "en") is None
+
+
+def test_pdf_quoting_another_price_makes_the_answer_ambiguous():
+    agreeing = pdf_document("Ball Valve ... 480")
+    disagreeing = pdf_document("Ball Valve ... 520")
+    assert table(sheet_document(), agreeing).answer("price of ball valve", "en") is not None
+    assert table(sheet_document(), disagreeing).answer("price of ball valve", "en") is None
+
+
+def test_bench_style_pdf_lines_are_not_priced():
+    line = "Pump model 0.3 MX-0001-03 MRP Rs 1029 Dealer Rs 823"
+    assert document_rows(pdf_document(line)) == []
+    assert table(pdf_document(line)).answer("price of MX-0001-03", "en") is None
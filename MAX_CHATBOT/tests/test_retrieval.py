@@ -0,0 +1,39 @@
+from corpus import Document
+from retrieval import RetrievalIndex
+
+
+def catalogue(generation):
+    pages = tuple(
+        (page, f"Pump model G{generation}X{page} costs {generation * 100 + page} EUR. Seal kit S{generation}Y{page}.")
+        for page in range(1, 21)
+    )
+    return Document(f"catalogue-{generation}.pdf", f"hash-{generation}", "pdf", pages)
+
+
+def texts(index, query):
+    return [chunk.text for chunk in index.search(query, token_budget=10_000)]
+
+
+def test_vocabulary_of_replaced_files_is_dropped():
+    index = RetrievalIndex()
+    for generation in range(1, 30):
+        index = index.updated([Document("stock.txt", "stock", "text", ((1, "Pump stock list"),)), catalogue(generation)])
+    fresh = RetrievalIndex().updated(
+        [Document("stock.txt", "stock", "text", ((1, "Pump stock list"),)), catalogue(29)]
+    )
+
+    assert len(index.vocabulary) < 2 * len(fresh.vocabulary)
+    for query in ("G29X7 price", "seal kit S29Y3", "pump stock", "G3X1"):
+        assert texts(index, query) == texts(fresh, query)
+
+
+def test_compaction_keeps_shared_blocks_searchable():
+    stock = Document("stock.txt", "stock", "text", ((1, "Ball valve 2in in stock"),))
+    index = RetrievalIndex().updated([stock, catalogue(1)])
+    older = index
+    index = index.updated([stock]).compacted()
+
+    assert texts(index, "ball valve") == texts(older, "ball valve")
+    # The older version keeps its own vocabulary and still answers
+    assert texts(older, "G1X5")
+    assert not texts(index, "G1X5")
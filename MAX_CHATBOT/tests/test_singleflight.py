@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def gated(chunks, gate):
+    def start():
+        gate.wait(5)
+        yield from chunks
+    return start
+
+
+def test_identical_requests_share_one_call_and_one_admission_slot():
+    flights = SingleFlight()
+    admission = AdmissionController(max_in_flight=1, max_waiting=0)
+    gate = threading.Event()
+    calls = []
+
+    def start():
+        calls.append(1)
+        try:
+            yield from gated(["a", "b"], gate)()
+        finally:
+            admission.release()
+
+    leader = flights.stream("key", start, timeout=5, on_lead=admission.acquire)
+    # The one slot is taken, so a joiner would be rejected if it asked for one
+    joiner = flights.stream("key", start, timeout=5, on_lead=admission.acquire)
+    gate.set()
+
+    assert list(leader) == ["a", "b"]
+    assert list(joiner) == ["a", "b"]
+    assert len(calls) == 1
+    assert flights.started == 1 and flights.coalesced == 1
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_the_slot_is_held_until_the_upstream_call_ends():
+    flights = SingleFlight()
+    admission = AdmissionController(max_in_flight=1, max_waiting=0)
+    gate = threading.Event()
+
+    def start():
+        try:
+            yield from gated(["a"], gate)()
+        finally:
+            admission.release()
+
+    first = flights.stream("one", start, timeout=5, on_lead=admission.acquire)
+    with pytest.raises(Overloaded):
+        flights.stream("two", start, timeout=5, on_lead=admission.acquire)
+    # A rejected leader leaves nothing behind for the next request to join
+    assert flights.in_flight() == 1
+    gate.set()
+    assert list(first) == ["a"]
+    assert list(flights.stream("two", gated(["b"], gate), timeout=5, on_lead=admission.acquire)) == ["b"]
+
+
+def test_requests_that_joined_a_rejected_call_get_the_rejection():
+    flights = SingleFlight()
+    joined = []
+
+    def reject():
+        # Someone joins while the leader is still waiting for admission
+        joined.append(flights.stream("key", lambda: iter(["never"]), timeout=5))
+        raise Overloaded(503, "busy", retry_after=1)
+
+    with pytest.raises(Overloaded):
+        flights.stream("key", lambda: iter(["never"]), timeout=5, on_lead=reject)
+    with pytest.raises(Overloaded):
+        list(joined[0])
+    assert flights.in_flight() == 0
+
+
+def test_upstream_errors_reach_every_subscriber():
+    flights = SingleFlight()
+    gate = threading.Event()
+
+    def start():
+        gate.wait(5)
+        yield "a"
+        raise RuntimeError("upstream broke")
+
+    first = flights.stream("key", start, timeout=5)
+    second = flights.stream("key", start, timeout=5)
+    gate.set()
+    for subscriber in (first, second):
+        with pytest.raises(RuntimeError):
+            list(subscriber)
+
+
+def test_slow_calls_time_out_per_subscriber():
+    flights = SingleFlight()
+    gate = threading.Event()
+    subscriber = flights.stream("key", gated(["a"], gate), timeout=0.05)
+    with pytest.raises(SingleFlightTimeout):
+        list(subscriber)
+    gate.set()
+
+
+def test_admission_queues_then_rejects():
+    admission = AdmissionController(max_in_flight=1, max_waiting=1, wait_timeout=5)
+    admission.acquire()
+    admitted = threading.Event()
+
+    def wait_in_line():
+        admission.acquire()
+        admitted.set()
+
+    waiter = threading.Thread(target=wait_in_line)
+    waiter.start()
+    while admission.stats()["waiting"] == 0:
+        threading.Event().wait(0.01)
+    with pytest.raises(Overloaded) as full:
+        admission.acquire()
+    assert full.value.status == 429
+    admission.release()
+    waiter.join(5)
+    assert admitted.is_set()
+    with pytest.raises(Overloaded) as timed_out:
+        admission.acquire(timeout=0.01)
+    assert timed_out.value.status == 503
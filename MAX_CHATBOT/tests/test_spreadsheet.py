@@ -0,0 +1,77 @@
+from corpus import Document
+from retrieval import CHUNK_MAX_TOKENS, chunk_document, estimate_tokens
+from spreadsheet import SHEET_PREFIX, read_sheets, serialize_tables
+
+
+def pump_sheet(rows, description=""):
+    return ("Pumps", (
+        ("Acme price list 2024",),
+        ("Product", "Code", "MRP", "Dealer Price", "Description"),
+    ) + tuple(
+        (f"Submersible pump model {i} 1.5HP", f"SP-{i:04d}", 1000 + i, 800 + i, description)
+        for i in range(rows)
+    ))
+
+
+def chunks_of(tables):
+    text = serialize_tables(tables)
+    return chunk_document(Document("acme.xlsx.txt", "", "text", ((1, text),), ()))
+
+
+def test_every_chunk_of_a_wide_sheet_carries_its_heading():
+    tables = (pump_sheet(100, description="stainless steel body, copper winding, 40m head, 3 year warranty"),)
+    chunks = chunks_of(tables)
+    assert len(chunks) > 3
+    for chunk in chunks:
+        lines = chunk.text.splitlines()
+        assert lines[:3] == [f"{SHEET_PREFIX}Pumps", "Acme price list 2024", "Product|Code|MRP|Dealer Price|Description"]
+        assert estimate_tokens(chunk.text) <= CHUNK_MAX_TOKENS
+    # Every row is in exactly one chunk
+    rows = [line for chunk in chunks for line in chunk.text.splitlines()[3:]]
+    assert len(rows) == 100 and len(set(rows)) == 100
+
+
+def test_narrow_sheets_fill_chunks():
+    chunks = chunks_of((pump_sheet(100),))
+    assert 1 < len(chunks) < 10
+    assert all(chunk.text.startswith(f"{SHEET_PREFIX}Pumps\n") for chunk in chunks)
+
+
+def test_each_sheet_gets_its_own_blocks():
+    tables = (pump_sheet(3), ("Valves", (("Item", "Rate"), ("Gate valve", 950), ("Ball valve", 480))))
+    texts = [chunk.text for chunk in chunks_of(tables)]
+    assert texts == [
+        "Sheet: Pumps\nAcme price list 2024\nProduct|Code|MRP|Dealer Price|Description\n"
+        "Submersible pump model 0 1.5HP|SP-0000|1000|800\n"
+        "Submersible pump model 1 1.5HP|SP-0001|1001|801\n"
+        "Submersible pump model 2 1.5HP|SP-0002|1002|802",
+        "Sheet: Valves\nItem|Rate\nGate valve|950\nBall valve|480",
+    ]
+
+
+def test_a_sheet_with_only_a_header_is_kept():
+    assert serialize_tables((("Empty", (("Product", "Price"),)),)) == "Sheet: Empty\nProduct|Price"
+
+
+def test_oversized_blocks_from_older_uploads_repeat_their_heading():
+    # 40-row blocks as serialised before blocks were sized by tokens
+    rows = [f"Submersible pump model {i} 1.5HP|SP-{i:04d}|{1000 + i}|{800 + i}|stainless steel body, copper winding"
+            for i in range(40)]
+    block = "\n".join(["Sheet: Pumps", "Acme price list 2024", "Product|Code|MRP|Dealer Price|Description"] + rows)
+    chunks = chunk_document(Document("acme.xlsx.txt", "", "text", ((1, block + "\n\n" + block),), ()))
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert chunk.text.startswith("Sheet: Pumps\nAcme price list 2024\nProduct|Code|MRP|Dealer Price|Description\n")
+        assert estimate_tokens(chunk.text) <= CHUNK_MAX_TOKENS
+
+
+def test_workbooks_are_read_from_a_spooled_path(tmp_path):
+    import pandas as pd
+
+    path = str(tmp_path / "prices.xlsx")
+    pd.DataFrame({"Model": ["P-1", "P-2"], "Price": [100, 200]}).to_excel(path, sheet_name="Pumps", index=False)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert read_sheets(path) == read_sheets(data)
+    assert read_sheets(path)[0] == ("Pumps", (("Model", "Price"), ("P-1", 100), ("P-2", 200)))
@@ -0,0 +1,36 @@
+import threading
+
+from answer_cache import AnswerCache
+from conversations import ConversationStore
+
+
+def test_answer_cache_shares_one_connection_across_threads(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+
+    def work(i):
+        key = cache.make_key(f"price of pump {i}", "en", "v1")
+        cache.put(key, "v1", f"answer {i}")
+        assert cache.get(key, "v1") == f"answer {i}"
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache._db._conn is not None
+    assert cache.stats() == {"hits": 20, "misses": 0, "entries": 20}
+    cache.purge_version("v1")
+    assert cache.stats()["entries"] == 0
+
+
+def test_conversations_survive_a_new_store_on_the_same_file(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    store = ConversationStore(path, max_turns=2)
+    for turn in ("one", "two", "three"):
+        store.append("c1", "user", turn)
+
+    conversation = ConversationStore(path, max_turns=2).get("c1")
+    assert [turn["content"] for turn in conversation.turns] == ["two", "three"]
+    assert conversation.summary == "one"
+    assert store.stats() == {"backend": "sqlite", "conversations": 1}
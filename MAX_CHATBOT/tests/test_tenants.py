@@ -0,0 +1,62 @@
+import os
+
+from mapped_corpus import RefreshLease
+from tenants import TenantCorpora, TenantCorpus, TenantDirectory, shared_paths, tenant_paths
+
+
+def test_unknown_tenants_are_not_resolved_and_only_relist_after_the_ttl():
+    listings = []
+
+    def list_folders():
+        listings.append(1)
+        return ["shop-a"]
+
+    directory = TenantDirectory(list_folders, configured=[""], ttl=3600)
+    assert directory.known("")
+    assert directory.known("shop-a")
+    assert not directory.known("made-up")
+    assert not directory.known("another-made-up")
+    assert len(listings) == 1
+
+    directory.add("shop-b")
+    assert directory.known("shop-b")
+
+
+def test_a_failed_listing_does_not_make_tenants_known():
+    def list_folders():
+        raise ConnectionError("storage down")
+
+    directory = TenantDirectory(list_folders, ttl=0)
+    assert not directory.known("shop-a")
+
+
+def test_evicted_tenants_remove_their_mapped_snapshot_but_not_the_lock(tmp_path):
+    def factory(tenant_id):
+        _, snapshot_path = tenant_paths(str(tmp_path), tenant_id)
+        mapped_path, lock_path = shared_paths(snapshot_path)
+        return TenantCorpus(tenant_id, None, snapshot_path, mapped_path, RefreshLease(lock_path))
+
+    def loader(tenant):
+        assert tenant.lease.acquire()
+        with open(tenant.mapped_path, "wb") as f:
+            f.write(b"mapped")
+        with open(tenant.snapshot_path, "wb") as f:
+            f.write(b"warm")
+        tenant.size = 10
+        tenant.ready.set()
+
+    corpora = TenantCorpora(factory, loader, max_bytes=10)
+    first = corpora.get("shop-a")
+    first.ready.wait(5)
+    corpora.evict()
+    second = corpora.get("shop-b")
+    second.ready.wait(5)
+    corpora.evict()
+
+    assert corpora.stats()["evictions"] == 1
+    assert not os.path.exists(first.mapped_path)
+    # Other workers may be locking this very inode
+    assert os.path.exists(first.lease.path)
+    # The warm snapshot stays for a quick reload
+    assert os.path.exists(first.snapshot_path)
+    assert os.path.exists(second.mapped_path)